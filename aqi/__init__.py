@@ -0,0 +1,4 @@
+from .config import settings, configure
+from .db import connect, ensure_schema
+from .ingest import fetch_records, save_records, download_data
+from .queries import get_county, get_sitename, get_selected_data, get_plot_data
@@ -0,0 +1,33 @@
+import os
+from dataclasses import dataclass
+from dotenv import load_dotenv, find_dotenv
+
+#從執行程式的資料夾往上找.env(每一課的資料夾都有自己的.env)
+load_dotenv(find_dotenv(usecwd=True))
+
+@dataclass
+class Settings:
+    '''
+    AQI資料來源的設定,預設值可以用環境變數覆寫
+    '''
+    db_path:str = os.environ.get('AQI_DB_PATH','AQI.db')
+    base_url:str = os.environ.get('AQI_BASE_URL','https://data.moenv.gov.tw/api/v2')
+    api_key:str|None = os.environ.get('API_KEY')
+    limit:int = 1000
+    timeout:float = 10.0
+
+settings = Settings()
+
+def configure(**kwargs)->Settings:
+    '''
+    修改設定,例如 configure(db_path='lesson10/AQI.db')
+    parameter:
+        kwargs:Settings的欄位名稱與新的值
+    return:
+        修改後的設定
+    '''
+    for key,value in kwargs.items():
+        if not hasattr(settings,key):
+            raise AttributeError(f'沒有這個設定:{key}')
+        setattr(settings,key,value)
+    return settings
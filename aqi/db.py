@@ -0,0 +1,73 @@
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from .config import settings
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    sitename TEXT NOT NULL,
+    county TEXT,
+    aqi INTEGER,
+    status TEXT,
+    pm25 NUMERIC,
+    date TEXT,
+    lat NUMERIC,
+    lon NUMERIC,
+    UNIQUE(sitename,date)
+);
+'''
+
+#資料表統一使用的日期格式,文字排序就是時間順序
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+#api出現過的日期格式(aqx_p_488是'2024-11-04 05:00',aqx_p_432是'2024/11/12 09:00:00')
+INPUT_DATE_FORMATS = ('%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M:%S', '%Y/%m/%d %H:%M')
+
+def normalize_date(value:str|None)->str|None:
+    '''
+    將api的日期轉換成DATE_FORMAT
+    無法解析的日期原樣傳回,None(資料表中的NULL)傳回None
+    '''
+    if value is None:
+        return None
+    for fmt in INPUT_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(),fmt).strftime(DATE_FORMAT)
+        except ValueError:
+            continue
+    return value
+
+def migrate_dates(conn:sqlite3.Connection)->int:
+    '''
+    將舊資料中不是DATE_FORMAT的日期(例如'2024/11/12 09:00:00')轉換成DATE_FORMAT
+    轉換後和既有資料重複的(sitename,date)會刪除,date為NULL的資料不處理
+    會掃描整個資料表,只在資料庫版本升級時執行一次(見maintenance.migrate)
+    return:
+        轉換或刪除的筆數
+    '''
+    conn.create_function('normalize_date',1,normalize_date,deterministic=True)
+    with conn:
+        updated = conn.execute('''UPDATE OR IGNORE records SET date = normalize_date(date)
+                                  WHERE date != normalize_date(date)''').rowcount
+        deleted = conn.execute('DELETE FROM records WHERE date != normalize_date(date)').rowcount
+    return updated + deleted
+
+def ensure_schema(conn:sqlite3.Connection):
+    '''
+    建立records資料表(已經存在就不做任何事)
+    '''
+    conn.executescript(SCHEMA)
+
+@contextmanager
+def connect(db_path:str|None=None):
+    '''
+    開啟資料庫連線,離開with區塊時會commit並關閉連線
+    parameter:
+        db_path:資料庫路徑,None代表使用settings.db_path
+    '''
+    conn = sqlite3.connect(db_path or settings.db_path, timeout=settings.timeout)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
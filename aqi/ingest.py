@@ -0,0 +1,73 @@
+import requests
+from .config import settings
+from .db import connect, ensure_schema, normalize_date
+
+#每個資料集的排序欄位與日期欄位
+DATASETS = {
+    'aqx_p_488': {'sort':'datacreationdate','date':'datacreationdate'},
+    'aqx_p_432': {'sort':'ImportDate','date':'publishtime'},
+}
+
+INSERT_SQL = '''INSERT OR IGNORE INTO records(sitename,county,aqi,status,pm25,date,lat,lon)
+                values (?,?,?,?,?,?,?,?);
+'''
+
+def fetch_records(dataset:str='aqx_p_488')->list[dict]:
+    '''
+    從環境部開放資料下載最新的資料
+    parameter:
+        dataset:資料集代碼
+    return:
+        api傳回的records
+    '''
+    if not settings.api_key:
+        raise RuntimeError('請在.env設定API_KEY')
+    params = {'api_key':settings.api_key,
+              'limit':settings.limit,
+              'sort':f"{DATASETS[dataset]['sort']} desc",
+              'format':'JSON'}
+    response = requests.get(f'{settings.base_url}/{dataset}',params=params,timeout=settings.timeout)
+    response.raise_for_status()
+    return response.json()['records']
+
+def to_row(items:dict, date_field:str='datacreationdate')->tuple:
+    '''
+    將api的一筆資料轉換成records資料表的一列,空字串轉成0
+    日期統一轉換成db.DATE_FORMAT
+    '''
+    return (items['sitename'],
+            items['county'],
+            int(items['aqi']) if items['aqi'] != '' else 0,
+            items['status'],
+            float(items['pm2.5']) if items['pm2.5'] != '' else 0.0,
+            normalize_date(items[date_field]),
+            float(items['latitude']) if items['latitude'] != '' else 0.0,
+            float(items['longitude']) if items['longitude'] != '' else 0.0)
+
+def save_records(records:list[dict], dataset:str='aqx_p_488', db_path:str|None=None)->int:
+    '''
+    一次寫入全部的資料,已經存在的(sitename,date)會略過
+    return:
+        新增的筆數
+    '''
+    date_field = DATASETS[dataset]['date']
+    rows = [to_row(items,date_field) for items in records]
+    with connect(db_path) as conn:
+        ensure_schema(conn)
+        before = conn.total_changes
+        conn.executemany(INSERT_SQL,rows)
+        return conn.total_changes - before
+
+def download_data(dataset:str='aqx_p_488', db_path:str|None=None)->int:
+    '''
+    下載資料並存到資料庫,下載失敗時只印出錯誤訊息
+    return:
+        新增的筆數
+    '''
+    print("重新下載資料")
+    try:
+        records = fetch_records(dataset)
+    except Exception as e:
+        print(e)
+        return 0
+    return save_records(records,dataset=dataset,db_path=db_path)
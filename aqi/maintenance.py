@@ -0,0 +1,271 @@
+import sqlite3
+import threading
+import sys
+from datetime import datetime, timedelta
+from .config import settings
+from .db import ensure_schema, migrate_dates
+
+#資料庫格式的版本,記錄在PRAGMA user_version
+#1:records.date與daily_records.day統一成ISO格式
+SCHEMA_VERSION = 1
+
+#每小時的原始資料保留天數,日統計(rollup)資料永久保留
+RETENTION_DAYS = {
+    'hourly': 30,
+    'daily': None,
+}
+
+#需要檢查執行計畫的查詢(與queries.py相同)
+HEALTH_QUERIES = {
+    'get_county': ('SELECT DISTINCT county FROM records', ()),
+    'get_sitename': ('SELECT DISTINCT sitename FROM records WHERE county = ?', ('臺北市',)),
+    'get_selected_data': ('SELECT date,county,sitename,aqi,pm25,status,lat,lon FROM records WHERE sitename=? ORDER BY date DESC', ('中山',)),
+    'get_plot_data': ('SELECT date,aqi,pm25 FROM records WHERE sitename = ? ORDER BY date', ('中山',)),
+}
+
+def ensure_rollup_schema(conn:sqlite3.Connection):
+    '''
+    建立日統計資料表與查詢所需的索引
+    parameter:
+        conn:資料庫連線
+    '''
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS daily_records (
+        sitename TEXT NOT NULL,
+        county TEXT,
+        day TEXT NOT NULL,
+        aqi_avg REAL,
+        aqi_max INTEGER,
+        pm25_avg REAL,
+        pm25_max NUMERIC,
+        samples INTEGER,
+        lat NUMERIC,
+        lon NUMERIC,
+        PRIMARY KEY(sitename,day)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_records_county_sitename ON records(county,sitename);
+    CREATE INDEX IF NOT EXISTS idx_records_date ON records(date);
+    ''')
+
+def ensure_incremental_vacuum(conn:sqlite3.Connection)->bool:
+    '''
+    將資料庫切換成auto_vacuum=INCREMENTAL
+    只有第一次切換時需要做一次完整的VACUUM,之後就可以用incremental_vacuum逐步回收空間
+    return:
+        是否有執行完整的VACUUM
+    '''
+    mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    if mode == 2:
+        return False
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+def normalize_day(value:str|None)->str|None:
+    '''
+    將日統計資料的日期轉換成'YYYY-MM-DD',無法解析的日期原樣傳回,None傳回None
+    '''
+    if value is None:
+        return None
+    for fmt in ('%Y-%m-%d','%Y/%m/%d'):
+        try:
+            return datetime.strptime(value.strip(),fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return value
+
+def migrate_daily_records(conn:sqlite3.Connection)->int:
+    '''
+    將舊的日統計資料(由'YYYY/MM/DD'的原始資料彙整而來)的日期轉換成'YYYY-MM-DD'
+    同一天已經有'YYYY-MM-DD'資料的會刪除,由rollup_daily重新彙整
+    return:
+        轉換或刪除的筆數
+    '''
+    conn.create_function('normalize_day',1,normalize_day,deterministic=True)
+    with conn:
+        updated = conn.execute('''UPDATE OR IGNORE daily_records SET day = normalize_day(day)
+                                  WHERE day != normalize_day(day)''').rowcount
+        deleted = conn.execute('DELETE FROM daily_records WHERE day != normalize_day(day)').rowcount
+    return updated + deleted
+
+def migrate(conn:sqlite3.Connection)->int:
+    '''
+    將資料庫升級到SCHEMA_VERSION,已經是最新版本的資料庫不做任何事
+    records與daily_records資料表必須已經存在
+    return:
+        轉換或刪除的筆數
+    '''
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return 0
+    migrated = migrate_dates(conn) + migrate_daily_records(conn)
+    with conn:
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return migrated
+
+def rollup_daily(conn:sqlite3.Connection, since:str|None=None)->int:
+    '''
+    將每小時的資料彙整成每日資料(平均值,最大值,筆數)
+    records.date必須已經是db.DATE_FORMAT(見db.migrate_dates)
+    parameter:
+        since:只重算這一天(含)之後的資料,None代表全部重算
+    return:
+        寫入的筆數
+    '''
+    sql = '''
+    INSERT OR REPLACE INTO daily_records(sitename,county,day,aqi_avg,aqi_max,pm25_avg,pm25_max,samples,lat,lon)
+    SELECT sitename,county,substr(date,1,10) AS day,
+           AVG(aqi),MAX(aqi),AVG(pm25),MAX(pm25),COUNT(*),MAX(lat),MAX(lon)
+    FROM records
+    WHERE substr(date,1,10) >= ?
+    GROUP BY sitename,day
+    '''
+    with conn:
+        cursor = conn.execute(sql,(since or '',))
+    return cursor.rowcount
+
+def apply_retention(conn:sqlite3.Connection, now:datetime|None=None, retention:dict|None=None)->int:
+    '''
+    刪除超過保留天數的每小時資料
+    刪除前會先把要刪掉的那幾天彙整到daily_records,所以日統計資料不會遺失
+    return:
+        刪除的筆數
+    '''
+    retention = retention or RETENTION_DAYS
+    days = retention.get('hourly')
+    if days is None:
+        return 0
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=days)).strftime('%Y-%m-%d')
+    oldest = conn.execute('SELECT MIN(date) FROM records WHERE date < ?',(cutoff,)).fetchone()[0]
+    if oldest is None:
+        return 0
+    rollup_daily(conn, since=oldest[:10])
+    with conn:
+        cursor = conn.execute('DELETE FROM records WHERE date < ?',(cutoff,))
+    return cursor.rowcount
+
+def database_size(conn:sqlite3.Connection)->dict:
+    '''
+    return:
+        資料庫大小(bytes)與可回收的空間
+    '''
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return {'page_size':page_size,
+            'pages':page_count,
+            'free_pages':freelist,
+            'size':page_size * page_count,
+            'reclaimable':page_size * freelist}
+
+def query_plan_health(conn:sqlite3.Connection)->dict[str,list[str]]:
+    '''
+    使用EXPLAIN QUERY PLAN檢查每個查詢是否會做整張表掃描
+    return:
+        {查詢名稱:執行計畫說明}
+    '''
+    plans = {}
+    for name,(sql,params) in HEALTH_QUERIES.items():
+        rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}',params).fetchall()
+        plans[name] = [row[-1] for row in rows]
+    return plans
+
+def full_scans(plans:dict[str,list[str]])->list[str]:
+    '''
+    return:
+        沒有使用索引,會掃描整張表的查詢名稱
+    '''
+    return [name for name,details in plans.items()
+            if any(d.startswith('SCAN') and 'USING' not in d for d in details)]
+
+def run_maintenance(db_path:str|None=None, pages:int=1000, retention:dict|None=None)->dict:
+    '''
+    執行一次完整的維護:保留天數,日統計,incremental vacuum,ANALYZE
+    parameter:
+        db_path:資料庫路徑,None代表使用settings.db_path
+        pages:每次incremental vacuum最多回收的頁數
+    return:
+        維護前後的資料庫狀況
+    '''
+    db_path = db_path or settings.db_path
+    conn = sqlite3.connect(db_path)
+    try:
+        before = database_size(conn)
+        ensure_schema(conn)
+        ensure_rollup_schema(conn)
+        vacuumed = ensure_incremental_vacuum(conn)
+        #日期統一成'YYYY-MM-DD HH:MM'後才能用文字比較日期,只有舊版本的資料庫需要轉換
+        migrated = migrate(conn)
+        if migrated:
+            #格式轉換過的日期全部重新彙整
+            rolled = rollup_daily(conn)
+        else:
+            latest = conn.execute('SELECT MAX(day) FROM daily_records').fetchone()[0]
+            rolled = rollup_daily(conn, since=latest)
+        deleted = apply_retention(conn, retention=retention)
+        #用execute只會回收一頁,要用executescript才會把整個pragma執行完
+        conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+        plans = query_plan_health(conn)
+        return {'db':db_path,
+                'before':before,
+                'after':database_size(conn),
+                'full_vacuum':vacuumed,
+                'migrated':migrated,
+                'rolled_up':rolled,
+                'deleted':deleted,
+                'plans':plans,
+                'full_scans':full_scans(plans)}
+    finally:
+        conn.close()
+
+class MaintenanceScheduler(threading.Thread):
+    '''
+    在背景執行緒定時執行資料庫維護,不會卡住tkinter的UI執行緒
+    '''
+    def __init__(self, db_path:str|None=None, interval:float=6*60*60, callback=None, **kwargs):
+        '''
+        parameter:
+            db_path:資料庫路徑
+            interval:每次維護間隔的秒數
+            callback:每次維護完成後呼叫,參數為run_maintenance的結果
+        '''
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.interval = interval
+        self.callback = callback
+        self.kwargs = kwargs
+        self.last_report = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.last_report = run_maintenance(self.db_path, **self.kwargs)
+            except sqlite3.Error as e:
+                print(e)
+            else:
+                if self.callback:
+                    self.callback(self.last_report)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+def print_report(report:dict):
+    before = report['before']['size']
+    after = report['after']['size']
+    print(f"{report['db']}: {before/1024:.0f}KB -> {after/1024:.0f}KB "
+          f"(刪除{report['deleted']}筆,彙整{report['rolled_up']}筆)")
+    for name,details in report['plans'].items():
+        print(f"  {name}: {' / '.join(details)}")
+    if report['full_scans']:
+        print(f"  整張表掃描: {', '.join(report['full_scans'])}")
+
+if __name__ == '__main__':
+    #python -m aqi.maintenance lesson6/AQI.db lesson7/AQI.db ...
+    paths = sys.argv[1:] or [settings.db_path]
+    for path in paths:
+        print_report(run_maintenance(path))
@@ -0,0 +1,60 @@
+import pandas as pd
+from pandas import DataFrame
+from .db import connect
+
+SELECTED_COLUMNS = ('date','county','sitename','aqi','pm25','status','lat','lon')
+
+def get_county()->list[str]:
+    '''
+    return:
+        傳出所有的城市名稱
+    '''
+    with connect() as conn:
+        cursor = conn.execute('SELECT DISTINCT county FROM records')
+        return [items[0] for items in cursor.fetchall()]
+
+def get_sitename(county:str|None=None)->list[str]:
+    '''
+    parameter:
+        county:城市名稱,None代表所有城市
+    return:
+        傳出所有的站點名稱
+    '''
+    with connect() as conn:
+        if county is None:
+            cursor = conn.execute('SELECT DISTINCT sitename FROM records')
+        else:
+            cursor = conn.execute('SELECT DISTINCT sitename FROM records WHERE county = ?',(county,))
+        return [items[0] for items in cursor.fetchall()]
+
+def get_selected_data(sitename:str, columns:tuple[str,...]=SELECTED_COLUMNS)->list[list]:
+    '''
+    使用者選擇了sitename,並將sitename傳入
+    Parameter:
+        sitename: 站點的名稱
+        columns: 要傳回的欄位(必須是SELECTED_COLUMNS內的欄位)
+    Return:
+        所有關於此站點的相關資料,日期由新到舊
+    '''
+    if not set(columns) <= set(SELECTED_COLUMNS):
+        raise ValueError(f'不支援的欄位:{set(columns) - set(SELECTED_COLUMNS)}')
+    sql = f'''
+    SELECT {','.join(columns)}
+    FROM records
+    WHERE sitename=?
+    ORDER BY date DESC;
+    '''
+    with connect() as conn:
+        cursor = conn.execute(sql,(sitename,))
+        return [list(item) for item in cursor.fetchall()]
+
+def get_plot_data(sitename:str)->DataFrame:
+    '''
+    Return:
+        以日期為index,aqi,pm25為欄位的DataFrame
+    '''
+    with connect() as conn:
+        cursor = conn.execute('SELECT date,aqi,pm25 FROM records WHERE sitename = ? ORDER BY date',(sitename,))
+        df = pd.DataFrame(cursor.fetchall(),columns=['date','aqi','pm25'])
+    df['date'] = pd.to_datetime(df['date'])
+    return df.set_index('date')
@@ -1,4 +1,5 @@
 import datasource
+from aqi import maintenance
 from tkinter import ttk
 import tkinter as tk
 from ttkthemes import ThemedTk
@@ -119,8 +120,12 @@ class Window(ThemedTk):
 
 def main():
     datasource.download_data() #下載至資料庫
+    #背景執行緒定時整理資料庫(保留天數,VACUUM,ANALYZE)
+    scheduler = maintenance.MaintenanceScheduler(callback=maintenance.print_report)
+    scheduler.start()
     window = Window(theme="arc")
     window.mainloop()
+    scheduler.stop()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
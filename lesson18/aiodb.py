@@ -0,0 +1,109 @@
+import asyncio
+import os
+import re
+import time
+import db
+
+_PLACEHOLDER = re.compile(r'%s')
+
+class AsyncPool:
+    '''
+    asyncio版本的連線池,等待資料庫時不會佔用執行緒
+    - postgres:asyncpg的連線池
+    - sqlite:aiosqlite的連線(每條連線在自己的背景執行緒執行)
+    SQL使用和db.py相同的%s參數寫法
+    '''
+    def __init__(self,minconn:int=db.POOL_MIN,maxconn:int=db.POOL_MAX,timeout:float=db.POOL_TIMEOUT):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pg = None
+        self._idle:asyncio.LifoQueue|None = None
+        self._slots:asyncio.Semaphore|None = None
+
+    async def open(self):
+        if db.DB_BACKEND == 'sqlite':
+            self._idle = asyncio.LifoQueue()
+            self._slots = asyncio.Semaphore(self.maxconn)
+            for _ in range(self.minconn):
+                self._idle.put_nowait(await self._connect_sqlite())
+        else:
+            import asyncpg
+            self._pg = await asyncpg.create_pool(database=os.environ['Postgres_DB'],
+                                                 user=os.environ['Postgres_user'],
+                                                 host=os.environ['Postgres_HOST'],
+                                                 password=os.environ['Postgres_password'],
+                                                 min_size=self.minconn,
+                                                 max_size=self.maxconn,
+                                                 server_settings={'statement_timeout':str(db.STATEMENT_TIMEOUT)})
+        return self
+
+    async def _connect_sqlite(self):
+        import aiosqlite
+        return await aiosqlite.connect(db.SQLITE_PATH,timeout=db.STATEMENT_TIMEOUT / 1000)
+
+    async def fetch(self,sql:str,params:tuple=())->list[tuple]:
+        start = time.perf_counter()
+        try:
+            if self._pg is not None:
+                #asyncpg使用$1,$2...的參數寫法
+                counter = iter(range(1,len(params) + 1))
+                sql = _PLACEHOLDER.sub(lambda _:f'${next(counter)}',sql)
+                async with self._pg.acquire(timeout=self.timeout) as conn:
+                    return [tuple(row) for row in await conn.fetch(sql,*params)]
+            try:
+                await asyncio.wait_for(self._slots.acquire(),self.timeout)
+            except asyncio.TimeoutError:
+                raise db.PoolTimeout(f'{self.timeout}秒內沒有可用的資料庫連線') from None
+            try:
+                try:
+                    conn = self._idle.get_nowait()
+                except asyncio.QueueEmpty:
+                    conn = await self._connect_sqlite()
+                try:
+                    async with conn.execute(sql.replace('%s','?'),params) as cursor:
+                        rows = await cursor.fetchall()
+                except BaseException:
+                    #包含請求被取消(asyncio.CancelledError),不關閉的話連線和它的執行緒會一直留著
+                    await asyncio.shield(conn.close())
+                    raise
+                self._idle.put_nowait(conn)
+                return rows
+            finally:
+                self._slots.release()
+        finally:
+            db._record(time.perf_counter() - start)
+
+    async def fetchone(self,sql:str,params:tuple=())->tuple|None:
+        rows = await self.fetch(sql,params)
+        return rows[0] if rows else None
+
+    async def close(self):
+        if self._pg is not None:
+            await self._pg.close()
+        if self._idle is not None:
+            while not self._idle.empty():
+                await self._idle.get_nowait().close()
+
+_pool:AsyncPool|None = None
+_pool_lock:asyncio.Lock|None = None
+
+async def get_pool()->AsyncPool:
+    '''
+    取得這個process的非同步連線池,第一次使用時才建立
+    '''
+    global _pool,_pool_lock
+    if _pool is not None:
+        return _pool
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await AsyncPool().open()
+    return _pool
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -0,0 +1,74 @@
+import json
+from flask import Blueprint, Response, abort, request, stream_with_context, url_for
+import datasource
+from cache import cached
+
+bp = Blueprint('api',__name__,url_prefix='/api')
+
+def _fields()->list[str]|None:
+    '''
+    ?fields=_id,city_name 只傳回指定的欄位
+    '''
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+@bp.route('/cities')
+@cached(tags=('city',))
+def cities():
+    '''
+    keyset分頁的城市列表
+    ?after=<cityId>&limit=<筆數>&fields=<欄位>
+    回應中的next是下一頁的網址,沒有下一頁時為null
+    '''
+    after = request.args.get('after',type=int)
+    limit = datasource.clamp_per_page(request.args.get('limit',datasource.MAX_PER_PAGE,type=int))
+    fields = _fields()
+    try:
+        items = datasource.get_cities_after(after,limit,fields)
+    except ValueError as e:
+        abort(400,str(e))
+    next_url = None
+    if len(items) == limit:
+        next_url = url_for('api.cities',after=items[-1]['_id'],limit=limit,
+                           fields=request.args.get('fields'))
+    return {'items':items,'next':next_url}
+
+@bp.route('/cities/<int:city_id>')
+@cached(tags=('city',))
+def city(city_id:int):
+    try:
+        item = datasource.get_city(city_id,_fields())
+    except ValueError as e:
+        abort(400,str(e))
+    if item is None:
+        abort(404)
+    return item
+
+@bp.route('/cities.ndjson')
+def cities_ndjson():
+    '''
+    一行一筆JSON,從server-side cursor直接輸出,不會在記憶體建立整個列表
+    ?after=<cityId>可以從中斷的地方繼續下載
+    '''
+    fields = _fields()
+    after = request.args.get('after',type=int)
+    try:
+        rows = datasource.iter_cities(fields,after)
+        first = next(rows,None)
+    except ValueError as e:
+        abort(400,str(e))
+
+    def generate():
+        try:
+            if first is None:
+                return
+            yield json.dumps(first,ensure_ascii=False) + '\n'
+            for row in rows:
+                yield json.dumps(row,ensure_ascii=False) + '\n'
+        finally:
+            #用戶端中斷時立刻關閉cursor並放回連線,不等待垃圾回收
+            rows.close()
+
+    return Response(stream_with_context(generate()),mimetype='application/x-ndjson')
@@ -0,0 +1,106 @@
+'''
+ASGI版本的進入點,使用uvicorn啟動:
+    uvicorn asgi:app --host 0.0.0.0 --port 8080 --workers 4
+
+- /product,/pricing是async路由,使用aiodb的非同步連線池(asyncpg,本機測試用aiosqlite)
+  等待資料庫時event loop可以繼續處理其它請求,一個process就能同時服務很多請求,不必每個請求一條執行緒
+- 其它網址(表單,API,Dash)交給原本的WSGI程式,在執行緒中執行
+- 與WSGI版本共用網頁快取,樣板與網址,兩個版本的網頁內容完全相同
+'''
+import os
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+load_dotenv()
+
+if not os.environ.get('SECRET_KEY'):
+    raise RuntimeError('正式環境請在.env設定SECRET_KEY')
+
+from a2wsgi import WSGIMiddleware
+from flask import render_template
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.http import http_date, parse_date, parse_etags
+import aiodb
+import datasource
+import metrics
+from cache import CacheEntry, response_cache
+from lesson18 import app as flask_app, application
+from lesson18_2 import start_warmup
+
+#{網址:(樣板,預設每頁筆數)},與lesson18.py的product,pricing相同
+CITY_PAGES = {
+    '/product':('product.j2',10),
+    '/pricing':('pricing.j2',6),
+}
+CITY_TAGS = ('city',)
+
+def _int_arg(request:Request,name:str,default:int)->int:
+    #與flask的request.args.get(name,default,type=int)相同,無法轉換時使用預設值
+    try:
+        return int(request.query_params.get(name,default))
+    except ValueError:
+        return default
+
+def _render(request:Request,template:str,**context)->str:
+    '''
+    在flask的request context中產生網頁,樣板內的url_for,request.path才能使用
+    '''
+    with flask_app.test_request_context(request.url.path,
+                                        base_url=f'{request.url.scheme}://{request.url.netloc}',
+                                        query_string=request.url.query):
+        return render_template(template,**context)
+
+def _conditional(request:Request,entry:CacheEntry)->Response:
+    '''
+    與cache.cached相同的ETag,Last-Modified與Cache-Control,內容沒變就傳回304
+    '''
+    headers = {'ETag':f'"{entry.etag}"',
+               'Last-Modified':http_date(entry.last_modified),
+               'Cache-Control':'public, max-age=0, must-revalidate'}
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        if parse_etags(if_none_match).contains(entry.etag):
+            return Response(status_code=304,headers=headers)
+    else:
+        since = parse_date(request.headers.get('if-modified-since'))
+        if since is not None and int(entry.last_modified) <= since.timestamp():
+            return Response(status_code=304,headers=headers)
+    return Response(entry.body,media_type=entry.content_type,headers=headers)
+
+async def city_page(request:Request)->Response:
+    template,default_per_page = CITY_PAGES[request.url.path]
+    #與flask的request.full_path相同,兩個版本共用快取
+    key = f'{request.url.path}?{request.url.query}'
+    #檢查資料表版本可能會查詢資料庫,放到執行緒中執行
+    entry = await run_in_threadpool(response_cache.get,key,CITY_TAGS)
+    if entry is None:
+        page = _int_arg(request,'page',1)
+        per_page = _int_arg(request,'per_page',default_per_page)
+        items_on_page,total_pages,page = await datasource.get_cities_page_async(page,per_page)
+        html = _render(request,template,
+                       items_on_page=items_on_page,
+                       total_pages=total_pages,
+                       page=page)
+        entry = response_cache.set(key,html.encode('utf-8'),tags=CITY_TAGS)
+    return _conditional(request,entry)
+
+@asynccontextmanager
+async def lifespan(_):
+    await aiodb.get_pool()
+    #每個uvicorn worker啟動後才預熱Dash callback的快取
+    start_warmup()
+    yield
+    await aiodb.close_pool()
+
+app = Starlette(routes=[*(Route(path,city_page) for path in CITY_PAGES),
+                        Mount('/',app=WSGIMiddleware(application))],
+                lifespan=lifespan)
+#async路由的延遲與資料庫時間也在/metrics輸出(application是WSGI的MetricsMiddleware)
+app = metrics.AsgiMetricsMiddleware(app,application,CITY_PAGES)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app',host='localhost',port=8080)
@@ -0,0 +1,205 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from flask import Blueprint, abort, request, send_file, url_for
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR,'static')
+#加上hash的檔案與壓縮檔
+CACHE_DIR = os.environ.get('ASSET_CACHE_DIR',os.path.join(BASE_DIR,'asset_cache'))
+#需要處理的副檔名
+EXTENSIONS = ('.css','.js','.map','.svg')
+#網址包含內容的hash,內容改變網址就會改變,所以可以快取一年
+MAX_AGE = 365 * 24 * 60 * 60
+#壓縮格式,依照優先順序
+ENCODINGS = ('br','gzip') if brotli else ('gzip',)
+SUFFIX = {'br':'.br','gzip':'.gz'}
+#壓縮等級:build()在啟動時壓縮一次用最高等級,請求中才壓縮的回應用較快的等級
+BUILD_LEVEL = {'br':11,'gzip':9}
+RUNTIME_LEVEL = {'br':5,'gzip':6}
+
+bp = Blueprint('assets',__name__)
+#{原始檔名:加上hash的檔名}
+manifest:dict[str,str] = {}
+
+def _compress(data:bytes,encoding:str,levels:dict[str,int]=BUILD_LEVEL)->bytes:
+    if encoding == 'br':
+        return brotli.compress(data,quality=levels['br'])
+    return gzip.compress(data,compresslevel=levels['gzip'],mtime=0)
+
+def _write(path:str,data:bytes):
+    if os.path.exists(path):
+        return
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp,'wb') as file:
+        file.write(data)
+    os.replace(tmp,path)
+
+def build(static_dir:str=STATIC_DIR,cache_dir:str=CACHE_DIR)->dict[str,str]:
+    '''
+    將static內的css,js加上內容hash並預先壓縮成.gz與.br
+    例如 css/index.css -> css/index.3f2a9c1b7e4d.css, css/index.3f2a9c1b7e4d.css.gz
+    return:
+        manifest
+    '''
+    result = {}
+    for root,_,files in os.walk(static_dir):
+        for name in files:
+            if not name.endswith(EXTENSIONS):
+                continue
+            source = os.path.join(root,name)
+            relative = os.path.relpath(source,static_dir).replace(os.sep,'/')
+            with open(source,'rb') as file:
+                data = file.read()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            stem,ext = os.path.splitext(relative)
+            hashed = f'{stem}.{digest}{ext}'
+            target = os.path.join(cache_dir,hashed)
+            os.makedirs(os.path.dirname(target),exist_ok=True)
+            _write(target,data)
+            for encoding in ENCODINGS:
+                #檔名包含hash,已經存在的壓縮檔內容一定相同,不必每次啟動都用最高等級重新壓縮
+                if not os.path.exists(target + SUFFIX[encoding]):
+                    _write(target + SUFFIX[encoding],_compress(data,encoding))
+            result[relative] = hashed
+    return result
+
+def asset_url(filename:str)->str:
+    '''
+    樣板使用的網址,不在manifest內的檔案使用原本的static網址
+    '''
+    hashed = manifest.get(filename)
+    if hashed is None:
+        return url_for('static',filename=filename)
+    return url_for('assets.asset',filename=hashed)
+
+def accepted_encoding(accept_encoding:str)->str|None:
+    '''
+    依照Accept-Encoding選擇壓縮格式,不支援壓縮時傳回None
+    q值較高的優先,q值相同時依照ENCODINGS的順序,q=0代表不接受(例如 br;q=0)
+    '''
+    weights = {}
+    for item in accept_encoding.lower().split(','):
+        name,*params = [part.strip() for part in item.split(';')]
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    best,best_q = None,0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding,weights.get('*',0.0))
+        if q > best_q:
+            best,best_q = encoding,q
+    return best
+
+@bp.route('/assets/<path:filename>')
+def asset(filename:str):
+    if filename not in manifest.values():
+        abort(404)
+    path = os.path.join(CACHE_DIR,filename)
+    encoding = accepted_encoding(request.headers.get('Accept-Encoding',''))
+    response = send_file(path + SUFFIX[encoding] if encoding else path,
+                         mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                         max_age=MAX_AGE,conditional=True,
+                         etag=f'{filename}.{encoding or "identity"}')
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def init_app(app):
+    manifest.update(build(app.static_folder))
+    app.register_blueprint(bp)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+class PrecompressMiddleware:
+    '''
+    WSGI middleware:壓縮並快取不會改變的回應(例如Dash的_dash-component-suites)
+    Dash的component suites網址已經包含版本,所以每個網址只需要壓縮一次
+    - 同一個網址同時有多個請求時,只有第一個請求壓縮,其它請求等待結果
+    - 在請求中壓縮,所以使用RUNTIME_LEVEL,不使用最高等級
+    '''
+    def __init__(self,app,prefixes:tuple[str,...]=('/_dash-component-suites/',),max_entries:int=256):
+        self.app = app
+        self.prefixes = prefixes
+        self.max_entries = max_entries
+        #{(網址,壓縮格式):(headers,壓縮後的內容)}
+        self._cache:dict[tuple[str,str],tuple[list,bytes]] = {}
+        self._lock = threading.Lock()
+        #{(網址,壓縮格式):正在產生這個回應的鎖}
+        self._key_locks:dict[tuple[str,str],threading.Lock] = {}
+
+    def __call__(self,environ,start_response):
+        path = environ.get('PATH_INFO','')
+        if environ.get('REQUEST_METHOD') != 'GET' or not path.startswith(self.prefixes):
+            return self.app(environ,start_response)
+        encoding = accepted_encoding(environ.get('HTTP_ACCEPT_ENCODING',''))
+        if encoding is None:
+            return self.app(environ,start_response)
+        key = (f"{path}?{environ.get('QUERY_STRING','')}",encoding)
+        with self._lock:
+            cached = self._cache.get(key)
+            key_lock = None if cached is not None else self._key_locks.setdefault(key,threading.Lock())
+        if cached is None:
+            with key_lock:
+                #等待期間其它請求可能已經壓縮完成
+                with self._lock:
+                    cached = self._cache.get(key)
+                if cached is None:
+                    try:
+                        status,headers,body = self._render(environ,encoding)
+                    finally:
+                        with self._lock:
+                            self._key_locks.pop(key,None)
+                    if status is not None:
+                        #不快取的回應(不是200或已經壓縮)直接傳回
+                        start_response(status,headers)
+                        return [body]
+                    cached = (headers,body)
+                    with self._lock:
+                        if len(self._cache) < self.max_entries:
+                            self._cache[key] = cached
+        headers,body = cached
+        start_response('200 OK',headers + [('Content-Length',str(len(body)))])
+        return [body]
+
+    def _render(self,environ,encoding:str)->tuple[str|None,list,bytes]:
+        '''
+        執行app並壓縮回應
+        return:
+            (status,headers,body),可以快取的200回應status為None,body是壓縮後的內容
+        '''
+        captured = {}
+        def capture(status,headers,exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            return lambda data:None
+        result = self.app(environ,capture)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result,'close'):
+                result.close()
+        headers = captured['headers']
+        already = any(name.lower() == 'content-encoding' for name,_ in headers)
+        if not captured['status'].startswith('200') or already:
+            return captured['status'],headers,body
+        headers = [(name,value) for name,value in headers
+                   if name.lower() not in ('content-length','etag','vary')]
+        body = _compress(body,encoding,RUNTIME_LEVEL)
+        headers += [('Content-Encoding',encoding),('Vary','Accept-Encoding')]
+        return None,headers,body
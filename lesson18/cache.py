@@ -0,0 +1,191 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import wraps
+from flask import request, make_response
+
+#快取幾秒後一定重新產生
+CACHE_TTL = 300
+#最多快取幾個網頁
+CACHE_MAXSIZE = 512
+#最多每幾秒檢查一次資料表有沒有變動
+VERSION_CHECK_INTERVAL = 10
+#手動清除快取時寫入的世代檔案,gunicorn的每個worker都有自己的快取,各自定期檢查這些檔案
+GENERATION_DIR = os.environ.get('CACHE_GENERATION_DIR',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)),'data_cache','cache_generation'))
+#代表所有網頁的tag
+ALL_TAGS = '*'
+
+@dataclass
+class CacheEntry:
+    body:bytes
+    content_type:str
+    etag:str
+    last_modified:float
+    expires:float
+    tags:tuple[str,...] = field(default_factory=tuple)
+
+class ResponseCache:
+    '''
+    伺服器端的網頁快取
+    - key為網址(路徑+查詢字串)
+    - 每個項目可以標記相依的資料表(tags),資料表變動時只清除相關的網頁
+    - 超過maxsize時移除最久沒有使用的項目
+    - bump()寫入共用的世代檔案,所有process檢查版本時都會清除對應的網頁
+    '''
+    def __init__(self,ttl:float=CACHE_TTL,maxsize:int=CACHE_MAXSIZE,generation_dir:str=GENERATION_DIR):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.generation_dir = generation_dir
+        self._entries:OrderedDict[str,CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        #{tag:[取得版本的函式,版本改變時呼叫的函式,上次的版本,上次檢查的時間]}
+        self._versions:dict[str,list] = {}
+        #保護_versions,取得版本可能會查詢資料庫,所以不使用_lock,查詢時也不持有這個鎖
+        self._versions_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def watch(self,tag:str,version_func,on_change=None):
+        '''
+        註冊資料表版本的檢查函式,版本改變時清除這個tag的所有網頁
+        parameter:
+            tag:資料表名稱
+            version_func:傳回目前版本的函式(不需要參數)
+            on_change:版本改變時額外呼叫的函式,例如清除其它快取
+        '''
+        with self._versions_lock:
+            self._versions[tag] = [version_func,on_change,None,0.0]
+
+    def _generation_path(self,tag:str)->str:
+        return os.path.join(self.generation_dir,'_all' if tag == ALL_TAGS else tag)
+
+    def _generation(self,tag:str)->str|None:
+        try:
+            with open(self._generation_path(tag),encoding='utf-8') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def bump(self,tag:str|None=None):
+        '''
+        清除所有process的快取:目前的process馬上清除,
+        其它process在下一次檢查版本時(最多VERSION_CHECK_INTERVAL秒)發現世代改變後清除
+        parameter:
+            tag:只清除相依這個資料表的網頁,None代表全部清除
+        '''
+        path = self._generation_path(tag or ALL_TAGS)
+        os.makedirs(self.generation_dir,exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp,'w',encoding='utf-8') as file:
+            file.write(secrets.token_hex(8))
+        os.replace(tmp,path)
+        self.invalidate(tag)
+
+    def _check_versions(self,tags:tuple[str,...]):
+        '''
+        檢查版本,同一個tag在VERSION_CHECK_INTERVAL秒內只有一個執行緒檢查,
+        版本改變時只有這個執行緒清除快取並呼叫on_change
+        '''
+        now = time.monotonic()
+        for tag in (*tags,ALL_TAGS):
+            with self._versions_lock:
+                #沒有註冊watch的tag也要檢查共用的世代檔案
+                watched = self._versions.setdefault(tag,[None,None,None,0.0])
+                if now - watched[3] < VERSION_CHECK_INTERVAL:
+                    continue
+                watched[3] = now
+                version_func = watched[0]
+            try:
+                version = (version_func() if version_func else None,self._generation(tag))
+            except Exception:
+                continue
+            with self._versions_lock:
+                changed = watched[2] is not None and version != watched[2]
+                watched[2] = version
+                if not changed:
+                    continue
+                if tag == ALL_TAGS:
+                    callbacks = [item[1] for item in self._versions.values() if item[1]]
+                else:
+                    callbacks = [watched[1]] if watched[1] else []
+            self.invalidate(None if tag == ALL_TAGS else tag)
+            for callback in callbacks:
+                callback()
+
+    def get(self,key:str,tags:tuple[str,...]=())->CacheEntry|None:
+        self._check_versions(tags)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires < time.time():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self,key:str,body:bytes,content_type:str='text/html; charset=utf-8',
+            tags:tuple[str,...]=(),ttl:float|None=None)->CacheEntry:
+        now = time.time()
+        entry = CacheEntry(body=body,
+                           content_type=content_type,
+                           etag=hashlib.blake2b(body,digest_size=16).hexdigest(),
+                           last_modified=now,
+                           expires=now + (ttl or self.ttl),
+                           tags=tags)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self,tag:str|None=None):
+        '''
+        清除快取
+        parameter:
+            tag:只清除相依這個資料表的網頁,None代表全部清除
+        '''
+        with self._lock:
+            if tag is None:
+                self._entries.clear()
+                return
+            for key in [key for key,entry in self._entries.items() if tag in entry.tags]:
+                del self._entries[key]
+
+response_cache = ResponseCache()
+
+def cached(tags:tuple[str,...]=(),max_age:int=0,ttl:float|None=None):
+    '''
+    快取view function的結果,並加上ETag,Last-Modified與Cache-Control
+    瀏覽器帶If-None-Match或If-Modified-Since時,內容沒變就傳回304
+    parameter:
+        tags:這個網頁相依的資料表
+        max_age:瀏覽器可以不經詢問直接使用快取的秒數,0代表每次都要驗證
+        ttl:伺服器端快取的秒數,None代表使用CACHE_TTL
+    '''
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args,**kwargs):
+            key = request.full_path
+            entry = response_cache.get(key,tags)
+            if entry is None:
+                response = make_response(view(*args,**kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.set(key,response.get_data(),response.content_type,tags,ttl)
+            response = make_response(entry.body)
+            response.content_type = entry.content_type
+            response.set_etag(entry.etag)
+            response.last_modified = entry.last_modified
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            if max_age == 0:
+                response.cache_control.must_revalidate = True
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
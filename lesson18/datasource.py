@@ -1,23 +1,186 @@
-import psycopg2
-from dotenv import load_dotenv
 import os
-load_dotenv()
+import time
+import threading
+import db
+import aiodb
+
+#每頁筆數的上限,避免?per_page=1000000這種請求
+MAX_PER_PAGE = 50
+#COUNT(*)快取的秒數
+COUNT_TTL = 60
+
+#API欄位名稱與city資料表欄位的對應(城市名稱的欄位原本就拼成ctiyName)
+CITY_COLUMNS = {
+    '_id':'"cityId"',
+    'city_name':'"ctiyName"',
+    'continent':'continent',
+    'country':'country',
+    'image':'image',
+}
+#串流時每次從資料庫讀取的筆數
+STREAM_BATCH = 500
+
+_count_cache = {'value':None,'expires':0.0}
+_count_lock = threading.Lock()
+
+def _to_dict(data:list[tuple])->list[dict]:
+    #list comprehension
+    return [{'_id':item[0],
+             'city_name':item[1],
+             'continent':item[2],
+             'country':item[3],
+             'image':item[4]
+             } for item in data]
 
 def get_cities()->list[dict]:
-    with psycopg2.connect(database=os.environ['Postgres_DB'],
-                      user=os.environ['Postgres_user'],
-                      host=os.environ['Postgres_HOST'],
-                      password=os.environ['Postgres_password']) as conn:
+    with db.connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute('SELECT * FROM city')
             data:list[tuple] = cursor.fetchall()
-    
-#list comprehension
-
-    convert_data:list[dict] = [{'_id':item[0],
-                                'city_name':item[1],
-                                'continent':item[2],
-                                'country':item[3],
-                                'image':item[4]
-                                } for item in data]
-    return convert_data
\ No newline at end of file
+
+    convert_data:list[dict] = _to_dict(data)
+    return convert_data
+
+def get_city_count()->int:
+    '''
+    city資料表的總筆數,結果會快取COUNT_TTL秒
+    '''
+    with _count_lock:
+        if _count_cache['value'] is not None and _count_cache['expires'] > time.monotonic():
+            return _count_cache['value']
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM city')
+            count = cursor.fetchone()[0]
+    with _count_lock:
+        _count_cache['value'] = count
+        _count_cache['expires'] = time.monotonic() + COUNT_TTL
+    return count
+
+def clear_count_cache():
+    '''
+    city資料表有新增或刪除資料時呼叫
+    '''
+    with _count_lock:
+        _count_cache['value'] = None
+
+def get_city_version():
+    '''
+    city資料表的版本,資料有新增,修改或刪除時會改變
+    - postgres:pg_stat_user_tables的異動次數
+    - sqlite:citys.db的修改時間
+    '''
+    if db.DB_BACKEND == 'sqlite':
+        return os.stat(db.SQLITE_PATH).st_mtime_ns
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""SELECT n_tup_ins,n_tup_upd,n_tup_del
+                              FROM pg_stat_user_tables WHERE relname = 'city'""")
+            return cursor.fetchone()
+
+def clamp_per_page(per_page:int)->int:
+    return max(1,min(per_page,MAX_PER_PAGE))
+
+def get_cities_page(page:int,per_page:int)->tuple[list[dict],int,int]:
+    '''
+    只讀取一頁的資料(LIMIT/OFFSET在資料庫執行)
+    parameter:
+        page:第幾頁,從1開始,超出範圍會自動調整到第一頁或最後一頁
+        per_page:每頁筆數,最多MAX_PER_PAGE筆
+    return:
+        (這一頁的資料,總頁數,調整後的頁數)
+    '''
+    per_page = clamp_per_page(per_page)
+    total_pages = max(1,(get_city_count() + per_page - 1) // per_page)
+    page = max(1,min(page,total_pages))
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT * FROM city ORDER BY "cityId" LIMIT %s OFFSET %s',
+                           (per_page,(page - 1) * per_page))
+            data:list[tuple] = cursor.fetchall()
+    return _to_dict(data),total_pages,page
+
+async def get_city_count_async()->int:
+    '''
+    get_city_count的非同步版本,與它共用同一個快取
+    '''
+    with _count_lock:
+        if _count_cache['value'] is not None and _count_cache['expires'] > time.monotonic():
+            return _count_cache['value']
+    pool = await aiodb.get_pool()
+    count = (await pool.fetchone('SELECT COUNT(*) FROM city'))[0]
+    with _count_lock:
+        _count_cache['value'] = count
+        _count_cache['expires'] = time.monotonic() + COUNT_TTL
+    return count
+
+async def get_cities_page_async(page:int,per_page:int)->tuple[list[dict],int,int]:
+    '''
+    get_cities_page的非同步版本,等待資料庫時event loop可以處理其它請求
+    '''
+    per_page = clamp_per_page(per_page)
+    total_pages = max(1,(await get_city_count_async() + per_page - 1) // per_page)
+    page = max(1,min(page,total_pages))
+    pool = await aiodb.get_pool()
+    data = await pool.fetch('SELECT * FROM city ORDER BY "cityId" LIMIT %s OFFSET %s',
+                            (per_page,(page - 1) * per_page))
+    return _to_dict(data),total_pages,page
+
+def _select_fields(fields:list[str]|None)->list[str]:
+    '''
+    檢查欄位名稱,None代表全部欄位
+    '''
+    if not fields:
+        return list(CITY_COLUMNS)
+    unknown = set(fields) - set(CITY_COLUMNS)
+    if unknown:
+        raise ValueError(f'不支援的欄位:{",".join(sorted(unknown))}')
+    #_id一定要有,才能算出下一頁的cursor
+    return ['_id'] + [field for field in fields if field != '_id']
+
+def get_cities_after(after_id:int|None,limit:int,fields:list[str]|None=None)->list[dict]:
+    '''
+    keyset分頁:讀取編號大於after_id的下一批資料,不論翻到第幾頁成本都一樣
+    parameter:
+        after_id:上一批最後一筆的編號,None代表從頭開始
+        limit:筆數,最多MAX_PER_PAGE筆
+        fields:要傳回的欄位,None代表全部
+    '''
+    limit = clamp_per_page(limit)
+    fields = _select_fields(fields)
+    columns = ','.join(CITY_COLUMNS[field] for field in fields)
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            if after_id is None:
+                cursor.execute(f'SELECT {columns} FROM city ORDER BY "cityId" LIMIT %s',(limit,))
+            else:
+                cursor.execute(f'SELECT {columns} FROM city WHERE "cityId" > %s ORDER BY "cityId" LIMIT %s',
+                               (after_id,limit))
+            data:list[tuple] = cursor.fetchall()
+    return [dict(zip(fields,item)) for item in data]
+
+def get_city(city_id:int,fields:list[str]|None=None)->dict|None:
+    fields = _select_fields(fields)
+    columns = ','.join(CITY_COLUMNS[field] for field in fields)
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f'SELECT {columns} FROM city WHERE "cityId" = %s',(city_id,))
+            item = cursor.fetchone()
+    return dict(zip(fields,item)) if item else None
+
+def iter_cities(fields:list[str]|None=None,after_id:int|None=None):
+    '''
+    逐筆讀取全部的城市,使用server-side cursor,不會一次把整張表載入記憶體
+    - postgres:named cursor,每次從伺服器取STREAM_BATCH筆
+    - sqlite:cursor本來就是逐筆讀取
+    會自己從連線池取得連線,可以在請求結束後的串流回應中使用
+    '''
+    fields = _select_fields(fields)
+    columns = ','.join(CITY_COLUMNS[field] for field in fields)
+    with db.get_pool().connection() as conn:
+        with conn.cursor(name='city_stream') as cursor:
+            cursor.itersize = STREAM_BATCH
+            cursor.execute(f'SELECT {columns} FROM city WHERE "cityId" > %s ORDER BY "cityId"',
+                           (after_id if after_id is not None else -1,))
+            for item in cursor:
+                yield dict(zip(fields,item))
@@ -0,0 +1,291 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from flask import g, has_app_context
+load_dotenv()
+
+#postgres或sqlite,sqlite會使用同一個資料夾內的citys.db,方便在本機測試
+DB_BACKEND = os.environ.get('CITY_DB_BACKEND','postgres')
+SQLITE_PATH = os.environ.get('CITY_SQLITE_PATH',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)),'citys.db'))
+POOL_MIN = int(os.environ.get('DB_POOL_MIN',1))
+POOL_MAX = int(os.environ.get('DB_POOL_MAX',10))
+#等待可用連線的秒數
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT',5))
+#單一SQL最多執行的毫秒數
+STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT',5000))
+
+#目前請求累計的資料庫時間,由metrics.MetricsMiddleware設定為[0.0]
+db_time:ContextVar[list|None] = ContextVar('db_time',default=None)
+
+def _record(seconds:float):
+    spent = db_time.get()
+    if spent is not None:
+        spent[0] += seconds
+
+class PoolTimeout(Exception):
+    '''
+    等待POOL_TIMEOUT秒後仍然沒有可用的連線
+    '''
+
+class SqliteCursor:
+    '''
+    讓sqlite3的cursor可以使用psycopg2的%s參數寫法
+    '''
+    def __init__(self,cursor:sqlite3.Cursor):
+        self._cursor = cursor
+
+    def execute(self,sql:str,params=()):
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(sql.replace('%s','?'),params)
+        finally:
+            _record(time.perf_counter() - start)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self,size:int):
+        return self._cursor.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+class SqliteConnection:
+    '''
+    citys.db的連線,介面與psycopg2的connection相同
+    '''
+    def __init__(self,path:str):
+        self._conn = sqlite3.connect(path,check_same_thread=False,timeout=STATEMENT_TIMEOUT / 1000)
+        self.closed = 0
+
+    def cursor(self,name:str|None=None)->SqliteCursor:
+        #name是psycopg2的server-side cursor名稱,sqlite的cursor本來就是逐筆讀取
+        return SqliteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+        self.closed = 1
+
+def _connect_postgres():
+    import psycopg2
+    import psycopg2.extensions
+
+    class TimedCursor(psycopg2.extensions.cursor):
+        '''
+        記錄每個查詢花費的時間
+        '''
+        def execute(self,sql,params=None):
+            start = time.perf_counter()
+            try:
+                return super().execute(sql,params)
+            finally:
+                _record(time.perf_counter() - start)
+
+    return psycopg2.connect(database=os.environ['Postgres_DB'],
+                            user=os.environ['Postgres_user'],
+                            host=os.environ['Postgres_HOST'],
+                            password=os.environ['Postgres_password'],
+                            options=f'-c statement_timeout={STATEMENT_TIMEOUT}',
+                            cursor_factory=TimedCursor)
+
+def _connect_sqlite():
+    return SqliteConnection(SQLITE_PATH)
+
+class ConnectionPool:
+    '''
+    執行緒安全的連線池
+    - 連線用完放回池子,下一個請求直接使用,不必每次重新連線
+    - 池子滿了會等待POOL_TIMEOUT秒,而不是無限制的開新連線
+    - 取出連線時如果連線已經斷掉會自動換一條新的
+    '''
+    def __init__(self,factory,minconn:int=POOL_MIN,maxconn:int=POOL_MAX,timeout:float=POOL_TIMEOUT):
+        self.factory = factory
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.stats = {'created':0,'closed':0,'checkouts':0,'in_use':0,
+                      'waits':0,'wait_seconds':0.0,'timeouts':0,'errors':0}
+        for _ in range(minconn):
+            self._idle.put(self._create())
+
+    def _create(self):
+        conn = self.factory()
+        with self._lock:
+            self.stats['created'] += 1
+        return conn
+
+    def _discard(self,conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self.stats['closed'] += 1
+
+    def getconn(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.stats['timeouts'] += 1
+            raise PoolTimeout(f'{self.timeout}秒內沒有可用的資料庫連線')
+        waited = time.perf_counter() - start
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._create()
+                    break
+                if conn.closed:
+                    self._discard(conn)
+                    conn = None
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.stats['checkouts'] += 1
+            self.stats['in_use'] += 1
+            if waited > 0.001:
+                self.stats['waits'] += 1
+                self.stats['wait_seconds'] += waited
+        return conn
+
+    def putconn(self,conn,error:bool=False):
+        try:
+            if error:
+                with self._lock:
+                    self.stats['errors'] += 1
+                conn.rollback()
+            else:
+                conn.commit()
+        except Exception:
+            self._discard(conn)
+        else:
+            if conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+        finally:
+            with self._lock:
+                self.stats['in_use'] -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        error = True
+        try:
+            yield conn
+            error = False
+        finally:
+            #串流中斷時產生器會收到GeneratorExit,不是Exception,也要放回連線
+            self.putconn(conn,error=error)
+
+    def ping(self)->bool:
+        '''
+        健康檢查:取出一條連線執行SELECT 1
+        '''
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    return cursor.fetchone()[0] == 1
+        except Exception:
+            return False
+
+    def metrics(self)->dict:
+        with self._lock:
+            metrics = dict(self.stats)
+        metrics['idle'] = self._idle.qsize()
+        metrics['max'] = self.maxconn
+        return metrics
+
+    def closeall(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+_pool:ConnectionPool|None = None
+_pool_lock = threading.Lock()
+
+def get_pool()->ConnectionPool:
+    '''
+    取得這個process的連線池,第一次使用時才建立
+    fork之後的子process會建立自己的連線池,不會共用父process的連線
+    '''
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            factory = _connect_sqlite if DB_BACKEND == 'sqlite' else _connect_postgres
+            _pool = ConnectionPool(factory)
+        return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+@contextmanager
+def connection():
+    '''
+    取得資料庫連線
+    在flask的請求中,同一個請求的所有查詢共用一條連線,請求結束時由teardown放回連線池
+    '''
+    if has_app_context():
+        if 'db_conn' not in g:
+            g.db_conn = get_pool().getconn()
+        yield g.db_conn
+    else:
+        with get_pool().connection() as conn:
+            yield conn
+
+def init_app(app):
+    '''
+    註冊flask的生命週期事件
+    '''
+    @app.teardown_appcontext
+    def release_connection(exc):
+        conn = g.pop('db_conn',None)
+        if conn is not None:
+            get_pool().putconn(conn,error=exc is not None)
+
+    @app.route('/healthz')
+    def healthz():
+        pool = get_pool()
+        ok = pool.ping()
+        return {'database':'ok' if ok else 'error',
+                'backend':DB_BACKEND,
+                'pool':pool.metrics()},200 if ok else 503
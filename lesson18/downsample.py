@@ -0,0 +1,37 @@
+'''
+折線圖的降採樣:點數超過畫面的像素時,只保留看得出形狀的點
+'''
+import math
+import os
+import numpy as np
+
+#每條線最多傳給瀏覽器的點數,大約是圖表寬度的像素
+POINT_BUDGET = int(os.environ.get('CHART_POINT_BUDGET',800))
+
+def lttb(x:np.ndarray,y:np.ndarray,threshold:int=POINT_BUDGET)->tuple[np.ndarray,np.ndarray]:
+    '''
+    Largest-Triangle-Three-Buckets:
+    第一個點與最後一個點一定保留,中間分成threshold-2個區間,
+    每個區間保留和前一個選中的點,下一個區間平均值組成最大三角形的點
+    點數不超過threshold時直接傳回
+    '''
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x,y
+    xf = x.astype('float64')
+    yf = y.astype('float64')
+    bucket = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold,dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = math.floor(i * bucket) + 1
+        end = math.floor((i + 1) * bucket) + 1
+        next_end = min(math.floor((i + 2) * bucket) + 1,n)
+        avg_x = xf[end:next_end].mean()
+        avg_y = yf[end:next_end].mean()
+        area = np.abs((xf[a] - avg_x) * (yf[start:end] - yf[a]) - (xf[a] - xf[start:end]) * (avg_y - yf[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return x[selected],y[selected]
@@ -0,0 +1,194 @@
+'''
+Dash callback結果的快取
+- key為callback的output,輸入值與資料版本,value為Dash已經編碼好的json回應
+- 命中時直接傳回json,不必執行callback,也不必再轉成json
+- 存在sqlite檔案內,gunicorn的所有worker共用,其中一個worker算過其它worker就不必再算
+'''
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    #Windows沒有fcntl,每個process都會預熱
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.environ.get('FIGURE_CACHE',os.path.join(BASE_DIR,'data_cache','figures.db'))
+#最多快取幾個結果,約200個國家 x 3種資料 x 2個callback
+MAX_ENTRIES = int(os.environ.get('FIGURE_CACHE_MAX',4000))
+#啟動時是否預先計算全部的組合
+WARM = os.environ.get('FIGURE_CACHE_WARM','1') == '1'
+DASH_CALLBACK_PATH = '/_dash-update-component'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS callback_cache(
+    key TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    body BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_callback_cache_created ON callback_cache(created);
+'''
+
+class FigureStore:
+    '''
+    以sqlite實作的key-value store,每個執行緒使用自己的連線
+    '''
+    def __init__(self,path:str=CACHE_PATH,max_entries:int=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _conn(self)->sqlite3.Connection:
+        conn = getattr(self._local,'conn',None)
+        #fork之後不能使用父process的連線
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path),exist_ok=True)
+            conn = sqlite3.connect(self.path,timeout=5,isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self,key:str,version:str)->bytes|None:
+        '''
+        只傳回這個資料版本的結果(其它worker可能還沒刪除舊版本)
+        '''
+        row = self._conn().execute('SELECT body FROM callback_cache WHERE key = ? AND version = ?',
+                                   (key,version)).fetchone()
+        return row[0] if row else None
+
+    def set(self,key:str,version:str,body:bytes):
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO callback_cache(key,version,body,created) VALUES (?,?,?,?)',
+                     (key,version,body,time.time()))
+        #超過上限時刪除最舊的結果
+        conn.execute('''DELETE FROM callback_cache WHERE key IN (
+                            SELECT key FROM callback_cache ORDER BY created DESC LIMIT -1 OFFSET ?)''',
+                     (self.max_entries,))
+
+    def count(self,version:str)->int:
+        return self._conn().execute('SELECT COUNT(*) FROM callback_cache WHERE version = ?',
+                                    (version,)).fetchone()[0]
+
+    def discard_other_versions(self,version:str):
+        '''
+        資料更新後刪除舊版本的結果
+        '''
+        self._conn().execute('DELETE FROM callback_cache WHERE version != ?',(version,))
+
+def callback_key(payload:dict,version:str)->str|None:
+    '''
+    依照output與輸入值產生key,不是dict的payload傳回None
+    '''
+    try:
+        values = [(item['id'],item['property'],item.get('value')) for item in payload['inputs']]
+        values += [(item['id'],item['property'],item.get('value')) for item in payload.get('state',[])]
+        text = json.dumps([payload['output'],values,version],sort_keys=True,ensure_ascii=False)
+    except (KeyError,TypeError):
+        return None
+    return hashlib.blake2b(text.encode('utf-8'),digest_size=16).hexdigest()
+
+class CallbackCacheMiddleware:
+    '''
+    WSGI middleware:放在Dash的server前面,快取指定output的callback回應
+    parameter:
+        outputs:要快取的callback output字串,例如 "..lineChart.data...lineChart.series.."
+        version_func:傳回目前資料版本的函式,版本不同就不會使用舊的結果
+            命中時不會執行callback,這個函式必須自己檢查資料是否更新(例如gapminder.Dataset.current_version)
+    '''
+    def __init__(self,app,outputs:set[str],version_func,store:FigureStore|None=None):
+        self.app = app
+        self.outputs = outputs
+        self.version_func = version_func
+        self.store = store or FigureStore()
+
+    def __call__(self,environ,start_response):
+        if environ.get('PATH_INFO') != DASH_CALLBACK_PATH or environ.get('REQUEST_METHOD') != 'POST':
+            return self.app(environ,start_response)
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(length)
+        environ['wsgi.input'] = io.BytesIO(body)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self.app(environ,start_response)
+        if not isinstance(payload,dict) or payload.get('output') not in self.outputs:
+            return self.app(environ,start_response)
+        version = self.version_func()
+        key = callback_key(payload,version)
+        if key is None:
+            return self.app(environ,start_response)
+        cached = self.store.get(key,version)
+        if cached is None:
+            captured = {}
+            def capture(status,headers,exc_info=None):
+                captured['status'] = status
+                captured['headers'] = headers
+                return lambda data:None
+            result = self.app(environ,capture)
+            try:
+                cached = b''.join(result)
+            finally:
+                if hasattr(result,'close'):
+                    result.close()
+            if not captured['status'].startswith('200'):
+                start_response(captured['status'],captured['headers'])
+                return [cached]
+            self.store.set(key,version,cached)
+        start_response('200 OK',[('Content-Type','application/json'),
+                                 ('Content-Length',str(len(cached)))])
+        return [cached]
+
+@contextmanager
+def _exclusive(path:str):
+    '''
+    跨process的檔案鎖,已經被其它process鎖住時傳回False,不等待
+    '''
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(path),exist_ok=True)
+    with open(path,'a') as file:
+        try:
+            fcntl.flock(file,fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(file,fcntl.LOCK_UN)
+
+def warm(server,payloads,store:FigureStore,version:str,expected:int):
+    '''
+    在背景預先計算全部的組合
+    已經有其它process算好(store內已經有expected筆這個版本的結果)或正在計算就不再計算
+    必須在worker內呼叫(例如gunicorn的post_fork),不能在import時呼叫:
+    preload_app時import在master執行,執行緒不會被fork到worker
+    parameter:
+        server:Dash的flask server,經過test_client送出請求,結果會存到store
+        payloads:callback請求內容的iterable
+    '''
+    def run():
+        if not WARM or store.count(version) >= expected:
+            return
+        with _exclusive(f'{store.path}.warm') as acquired:
+            if not acquired:
+                return
+            start = time.perf_counter()
+            client = server.test_client()
+            for payload in payloads:
+                client.post(DASH_CALLBACK_PATH,json=payload)
+            print(f'callback快取預熱完成,{time.perf_counter() - start:.1f}秒')
+    thread = threading.Thread(target=run,daemon=True)
+    thread.start()
+    return thread
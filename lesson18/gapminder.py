@@ -0,0 +1,263 @@
+'''
+gapminder資料集的本機快取
+- 第一次使用時下載csv,轉換型別後存成parquet,之後直接讀取parquet(幾毫秒)
+- 快取超過REFRESH_INTERVAL秒會在背景執行緒重新下載,下載失敗(離線)就繼續使用快取
+- 其它process(gunicorn的其它worker)更新了快取檔案,這個process也會重新讀取
+
+    import gapminder
+    df = gapminder.load()
+    rows = gapminder.country_index().records('Taiwan',['pop'])
+'''
+import hashlib
+import io
+import math
+import os
+import sys
+import threading
+import time
+import numpy as np
+import pandas as pd
+import requests
+#filter_query的實作在上層資料夾的table_filter套件,和寵物登記共用
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from table_filter import apply_filter
+
+URL = 'https://raw.githubusercontent.com/plotly/datasets/master/gapminder_unfiltered.csv'
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.environ.get('GAPMINDER_CACHE',os.path.join(BASE_DIR,'data_cache','gapminder.parquet'))
+#幾秒後重新下載
+REFRESH_INTERVAL = float(os.environ.get('GAPMINDER_REFRESH_SECONDS',24 * 60 * 60))
+#最多每幾秒檢查一次快取檔案
+CHECK_INTERVAL = 60
+METRICS = ('pop','lifeExp','gdpPercap')
+DTYPES = {
+    'country':'category',
+    'continent':'category',
+    'year':'int16',
+    'pop':'int64',
+    'lifeExp':'float32',
+    'gdpPercap':'float64',
+}
+#float32欄位轉成json時保留的小數位數,超過原始資料位數的部分是float32的捨入誤差
+#lifeExp最多3位小數,整數部分不超過3位,在float32約7位有效數字的範圍內
+#gdpPercap整數部分可達6位,小數又多達7位,float32會改變數值(例如2950.1234變成2950.1233),所以保留float64不捨入
+DECIMALS = {'lifeExp':3}
+
+def convert(frame:pd.DataFrame)->pd.DataFrame:
+    '''
+    只保留需要的欄位,轉換成較小的型別,並依照國家,年份排序
+    '''
+    frame = frame[list(DTYPES)].astype(DTYPES)
+    return frame.sort_values(['country','year'],kind='stable').reset_index(drop=True)
+
+def frame_version(frame:pd.DataFrame)->str:
+    '''
+    資料內容的hash,內容相同版本就相同
+    '''
+    hashed = pd.util.hash_pandas_object(frame,index=False).values
+    return hashlib.blake2b(hashed.tobytes(),digest_size=8).hexdigest()
+
+def to_records(frame:pd.DataFrame)->list[dict]:
+    '''
+    轉成Dash元件使用的list[dict],數值轉回一般的int,float
+    '''
+    frame = frame.copy()
+    for metric,decimals in DECIMALS.items():
+        if metric in frame:
+            frame[metric] = frame[metric].astype('float64').round(decimals)
+    for column in ('country','continent'):
+        if column in frame:
+            frame[column] = frame[column].astype(str)
+    return frame.to_dict('records')
+
+def query_table(frame:pd.DataFrame,page_current:int,page_size:int,
+                sort_by:list[dict]|None=None,filter_query:str='')->tuple[list[dict],int,int]:
+    '''
+    dash_table的page_action,sort_action,filter_action='custom',只傳回目前這一頁
+    parameter:
+        sort_by:[{'column_id':欄位,'direction':'asc'或'desc'}]
+        filter_query:例如 "{year} >= 2000 && {pop} > 1000000"
+    return:
+        (這一頁的資料,總頁數,調整後的頁數)
+    '''
+    frame = apply_filter(frame,filter_query)
+    columns = [item['column_id'] for item in sort_by or [] if item['column_id'] in frame]
+    if columns:
+        ascending = [item['direction'] == 'asc' for item in sort_by if item['column_id'] in frame]
+        frame = frame.sort_values(columns,ascending=ascending,kind='stable')
+    page_size = max(1,page_size)
+    page_count = max(1,math.ceil(len(frame) / page_size))
+    page_current = max(0,min(page_current or 0,page_count - 1))
+    start = page_current * page_size
+    return to_records(frame.iloc[start:start + page_size]),page_count,page_current
+
+class CountryIndex:
+    '''
+    依照國家分割的索引,資料已經依照國家排序,每個國家是連續的一段
+    - 建立時只掃描一次資料,之後取得任何國家的資料都是O(1)的切片,不必每次df[df.country == ...]
+    - 每個欄位預先轉成一般數值的陣列,callback直接切片使用
+    '''
+    def __init__(self,frame:pd.DataFrame):
+        self.frame = frame
+        codes = frame['country'].cat.codes.to_numpy()
+        starts = np.flatnonzero(np.r_[True,codes[1:] != codes[:-1]]) if len(codes) else np.array([],dtype=int)
+        stops = np.r_[starts[1:],len(codes)]
+        categories = frame['country'].cat.categories
+        #{國家:(開始,結束)}
+        self.offsets:dict[str,tuple[int,int]] = {str(categories[codes[start]]):(int(start),int(stop))
+                                                 for start,stop in zip(starts,stops)}
+        self.countries = list(self.offsets)
+        self.columns:dict[str,np.ndarray] = {'year':frame['year'].to_numpy()}
+        for metric in METRICS:
+            if metric in DECIMALS:
+                self.columns[metric] = np.round(frame[metric].to_numpy(dtype='float64'),DECIMALS[metric])
+            else:
+                self.columns[metric] = frame[metric].to_numpy()
+
+    def _range(self,country:str)->tuple[int,int]:
+        return self.offsets.get(country,(0,0))
+
+    def slice(self,country:str)->pd.DataFrame:
+        '''
+        這個國家的資料(不複製)
+        '''
+        start,stop = self._range(country)
+        return self.frame.iloc[start:stop]
+
+    def series(self,country:str,column:str)->np.ndarray:
+        '''
+        這個國家某個欄位的陣列(不複製)
+        '''
+        start,stop = self._range(country)
+        return self.columns[column][start:stop]
+
+    def records(self,country:str,columns:tuple[str,...]|list[str]=METRICS)->list[dict]:
+        '''
+        Dash元件使用的list[dict],包含country,year與指定的欄位
+        '''
+        start,stop = self._range(country)
+        names = ['year',*columns]
+        values = [self.columns[name][start:stop].tolist() for name in names]
+        return [{'country':country,**dict(zip(names,row))} for row in zip(*values)]
+
+class Dataset:
+    def __init__(self,path:str=CACHE_PATH,url:str=URL,interval:float=REFRESH_INTERVAL):
+        self.path = path
+        self.url = url
+        self.interval = interval
+        self.frame:pd.DataFrame|None = None
+        self.version:str|None = None
+        self.index:CountryIndex|None = None
+        self._mtime = 0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._refreshing:threading.Thread|None = None
+        self._listeners = []
+
+    def on_change(self,callback):
+        '''
+        註冊資料更新後要呼叫的函式,例如清除用舊資料產生的快取
+        callback(frame,version)
+        '''
+        self._listeners.append(callback)
+        return callback
+
+    def load(self)->pd.DataFrame:
+        '''
+        取得目前的資料,必要時在背景更新
+        '''
+        if self.frame is None:
+            with self._lock:
+                if self.frame is None:
+                    if os.path.exists(self.path):
+                        self._read()
+                    else:
+                        #沒有快取時只能等待下載
+                        self._swap(self._download())
+        self._maybe_refresh()
+        return self.frame
+
+    def current_version(self)->str:
+        '''
+        目前資料的版本,和load()一樣必要時在背景更新
+        快取命中時不會執行callback(不會呼叫load),快取的key要用這個函式取得版本才會發現資料已經更新
+        '''
+        self.load()
+        return self.version
+
+    def _read(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        frame = pd.read_parquet(self.path)
+        if any(str(frame[column].dtype) != dtype for column,dtype in DTYPES.items() if column in frame):
+            #舊版本的快取(pop,gdpPercap存成float32)已經失去精度,重新下載
+            self._swap(self._download())
+            return
+        self._swap(frame,mtime)
+
+    def _download(self)->pd.DataFrame:
+        response = requests.get(self.url,timeout=30)
+        response.raise_for_status()
+        return convert(pd.read_csv(io.BytesIO(response.content)))
+
+    def _write(self,frame:pd.DataFrame)->int:
+        os.makedirs(os.path.dirname(self.path),exist_ok=True)
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        frame.to_parquet(tmp,index=False)
+        os.replace(tmp,self.path)
+        return os.stat(self.path).st_mtime_ns
+
+    def _swap(self,frame:pd.DataFrame,mtime:int|None=None):
+        version = frame_version(frame)
+        if mtime is None:
+            mtime = self._write(frame)
+        changed = version != self.version
+        if changed or self.index is None:
+            self.index = CountryIndex(frame)
+        self.frame,self.version,self._mtime = frame,version,mtime
+        self._checked = time.monotonic()
+        if changed:
+            for callback in self._listeners:
+                callback(frame,version)
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now - self._checked < CHECK_INTERVAL:
+            return
+        with self._lock:
+            if now - self._checked < CHECK_INTERVAL or (self._refreshing and self._refreshing.is_alive()):
+                return
+            self._checked = now
+            #gunicorn fork之後執行緒不會被複製,所以每次都在目前的process建立
+            self._refreshing = threading.Thread(target=self._refresh,daemon=True)
+            self._refreshing.start()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns if os.path.exists(self.path) else 0
+            if mtime and mtime != self._mtime:
+                #其它process已經更新了快取
+                with self._lock:
+                    self._read()
+            elif time.time() - mtime / 1e9 > self.interval:
+                frame = self._download()
+                with self._lock:
+                    if frame_version(frame) == self.version:
+                        #內容沒變,只更新檔案時間
+                        os.utime(self.path)
+                        self._mtime = os.stat(self.path).st_mtime_ns
+                    else:
+                        self._swap(frame)
+        except Exception as error:
+            print(f'gapminder資料更新失敗,繼續使用快取:{error}')
+
+dataset = Dataset()
+
+def load()->pd.DataFrame:
+    return dataset.load()
+
+def country_index()->CountryIndex:
+    '''
+    目前資料的國家索引,資料更新時會一起重建
+    '''
+    dataset.load()
+    return dataset.index
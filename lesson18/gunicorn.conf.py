@@ -0,0 +1,50 @@
+'''
+正式環境的啟動設定
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+- preload_app:master先載入程式(包含pandas的資料與Dash的layout)再fork,
+  worker之間以copy-on-write共用這些記憶體
+- 更新程式碼(因為preload_app,HUP只會重啟worker,不會重新載入程式碼):
+    kill -USR2 <master pid>    啟動新的master與worker
+    kill -WINCH <舊master pid> 舊的worker處理完目前的請求後結束
+    kill -QUIT <舊master pid>  結束舊的master
+- 只調整worker數量:kill -TTIN / -TTOU <master pid>
+'''
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('WEB_BIND','0.0.0.0:8080')
+workers = int(os.environ.get('WEB_WORKERS',multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS',4))
+worker_class = 'gthread'
+preload_app = True
+#處理這麼多請求後重啟worker,避免記憶體一直增加
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS',5000))
+max_requests_jitter = max_requests // 10
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+def on_starting(server):
+    #清除上次執行時各worker留下的/metrics數據
+    import metrics
+    metrics.reset_store()
+
+def child_exit(server, worker):
+    #結束的worker的/metrics數據合併到retired.json,刪除它的檔案
+    import metrics
+    metrics.retire_store(worker.pid)
+
+def when_ready(server):
+    #載入完成後凍結目前的物件,GC不會再修改它們,fork後才不會因為GC而複製記憶體分頁
+    gc.freeze()
+
+def post_fork(server, worker):
+    #每個worker使用自己的資料庫連線池
+    import db
+    db.close_pool()
+    #callback快取的預熱執行緒在worker內啟動,master的執行緒不會被fork到worker
+    from lesson18_2 import start_warmup
+    start_warmup()
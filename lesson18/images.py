@@ -0,0 +1,119 @@
+import os
+import threading
+from flask import Blueprint, abort, send_file, url_for
+from werkzeug.utils import safe_join
+from PIL import Image
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+#原始圖片
+SOURCE_DIR = os.path.join(BASE_DIR,'static','images','cityImage')
+#縮圖快取,檔名包含原始圖片的修改時間,原圖更新後會自動產生新的縮圖
+CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR',os.path.join(BASE_DIR,'image_cache'))
+#卡片寬度為18rem(288px),提供1x,2x,3x三種寬度
+WIDTHS = (300,600,900)
+#輸出格式:(副檔名,Pillow格式,儲存參數)
+FORMATS = {
+    'webp':('WEBP',{'quality':75,'method':6}),
+    'jpg':('JPEG',{'quality':80,'optimize':True,'progressive':True}),
+}
+#縮圖網址包含版本,內容不會改變,瀏覽器可以快取一年
+MAX_AGE = 365 * 24 * 60 * 60
+
+bp = Blueprint('images',__name__)
+_locks:dict[str,threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+def _source_path(name:str)->str:
+    path = safe_join(SOURCE_DIR,name)
+    if path is None or not os.path.isfile(path):
+        raise FileNotFoundError(name)
+    return path
+
+def _version(source:str)->str:
+    return format(os.stat(source).st_mtime_ns,'x')
+
+def variant_path(name:str,width:int,fmt:str)->str:
+    '''
+    產生(或從快取取得)指定寬度與格式的縮圖
+    parameter:
+        name:cityImage內的檔名
+        width:WIDTHS其中一個寬度
+        fmt:webp或jpg
+    return:
+        縮圖檔案的路徑
+    '''
+    source = _source_path(name)
+    stem = os.path.splitext(name)[0]
+    target = os.path.join(CACHE_DIR,f'{stem}-{width}-{_version(source)}.{fmt}')
+    if os.path.exists(target):
+        return target
+    with _locks_lock:
+        lock = _locks.setdefault(target,threading.Lock())
+    with lock:
+        if not os.path.exists(target):
+            os.makedirs(CACHE_DIR,exist_ok=True)
+            pil_format,options = FORMATS[fmt]
+            with Image.open(source) as image:
+                image = image.convert('RGB')
+                if image.width > width:
+                    image.thumbnail((width,image.height * width // image.width),Image.LANCZOS)
+                #先寫到暫存檔再改名,多個process同時產生也不會讀到寫一半的檔案
+                tmp = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+                image.save(tmp,pil_format,**options)
+            os.replace(tmp,target)
+    return target
+
+def image_srcset(name:str,fmt:str)->str:
+    '''
+    給<img>或<source>使用的srcset,例如 /img/Kyoto.jpg/300.webp?v=... 300w, ...
+    找不到原始圖片時傳回空字串
+    '''
+    try:
+        version = _version(_source_path(name))
+    except FileNotFoundError:
+        return ''
+    return ', '.join(f"{url_for('images.variant',name=name,width=width,fmt=fmt,v=version)} {width}w"
+                     for width in WIDTHS)
+
+def image_src(name:str,width:int=WIDTHS[0],fmt:str='jpg')->str:
+    '''
+    不支援srcset的瀏覽器使用的網址,找不到原始圖片時使用原本的static網址
+    '''
+    try:
+        version = _version(_source_path(name))
+    except FileNotFoundError:
+        return url_for('static',filename='images/cityImage/'+name)
+    return url_for('images.variant',name=name,width=width,fmt=fmt,v=version)
+
+@bp.route('/img/<path:name>/<int:width>.<fmt>')
+def variant(name:str,width:int,fmt:str):
+    if width not in WIDTHS or fmt not in FORMATS:
+        abort(404)
+    try:
+        path = variant_path(name,width,fmt)
+    except FileNotFoundError:
+        abort(404)
+    response = send_file(path,mimetype=f"image/{'jpeg' if fmt == 'jpg' else fmt}",
+                         max_age=MAX_AGE,conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def init_app(app):
+    app.register_blueprint(bp)
+    app.jinja_env.globals.update(image_srcset=image_srcset,image_src=image_src)
+
+def build_all():
+    '''
+    預先產生所有縮圖,部署時執行 python images.py
+    '''
+    count = 0
+    for name in sorted(os.listdir(SOURCE_DIR)):
+        for width in WIDTHS:
+            for fmt in FORMATS:
+                variant_path(name,width,fmt)
+                count += 1
+    return count
+
+if __name__ == '__main__':
+    print(f'產生{build_all()}張縮圖,存放在{CACHE_DIR}')
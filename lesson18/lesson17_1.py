@@ -1,8 +1,9 @@
 from dash import Dash,html,dcc,callback,Input, Output,dash_table
-import pandas as pd
+import gapminder
 import plotly.express as px
 
-df = pd.read_csv('https://raw.githubusercontent.com/plotly/datasets/master/gapminder_unfiltered.csv')
+#從本機的parquet快取讀取,不必每次啟動都下載csv
+df = gapminder.load()
 
 app = Dash(__name__)
 
@@ -10,7 +11,7 @@ app.layout = html.Div(
     [
     html.H1("Dash App的標題",style={"textAlign":'center'}),
     dcc.RadioItems(['pop','lifeExp','gdpPercap'],value='pop',inline=True,id='radio_item'),
-    dcc.Dropdown(df.country.unique(),value='Taiwan',id='dropdown-selection'),
+    dcc.Dropdown(df.country.unique().tolist(),value='Taiwan',id='dropdown-selection'),
     dash_table.DataTable(data=[],page_size=10,id='datatable',columns=[]),
     dcc.Graph(id='graph-content')
     ])
@@ -23,7 +24,7 @@ app.layout = html.Div(
     
 )
 def update_graph(country_value,radio_value):
-    dff = df[df.country == country_value]
+    dff = gapminder.country_index().slice(country_value)
     print(radio_value)
     if radio_value == "pop":
         title = f'{country_value}:人口成長圖表'
@@ -42,7 +43,7 @@ def update_graph(country_value,radio_value):
     Input('radio_item','value') 
 )
 def update_table(country_value,radio_value):
-    dff = df[df.country == country_value]
+    dff = gapminder.country_index().slice(country_value)
     columns = [
         {'id':'country','name':'country'},
         {'id':'year','name':'year'}        
@@ -54,7 +55,7 @@ def update_table(country_value,radio_value):
     elif radio_value == 'gdpPercap':
         columns.append({'id':'gdpPercap','name':'gdpPercap'})
 
-    return dff.to_dict('records'),columns
+    return gapminder.to_records(dff),columns
     
 
 if __name__ == '__main__':
@@ -1,10 +1,11 @@
 from dash import Dash,html,dcc,callback,Input, Output,dash_table,_dash_renderer
-import pandas as pd
+import gapminder
 import plotly.express as px
 import dash_mantine_components as dmc
 _dash_renderer._set_react_version("18.2.0")
 
-df = pd.read_csv('https://raw.githubusercontent.com/plotly/datasets/master/gapminder_unfiltered.csv')
+#從本機的parquet快取讀取,不必每次啟動都下載csv
+df = gapminder.load()
 
 app = Dash(__name__,external_stylesheets=dmc.styles.ALL)
 
@@ -59,7 +60,7 @@ selected_data = [{'value':value,'label':value} for value in df.country.unique()]
 #只顯示台灣的資料,table所需要的資料
 dff = df[df.country == 'Taiwan']
 pop_diff = dff[['country', 'year', 'pop']]
-elements = pop_diff.to_dict('records')
+elements = gapminder.to_records(pop_diff)
 
 rows = [
     dmc.TableTr(
@@ -161,7 +162,7 @@ app.layout = dmc.MantineProvider(
     
 )
 def update_graph(country_value,radio_value):
-    dff = df[df.country == country_value]
+    dff = gapminder.country_index().slice(country_value)
     print(radio_value)
     if radio_value == "pop":
         title = f'{country_value}:人口成長圖表'
@@ -1,53 +1,98 @@
-from flask import Flask,render_template,request,redirect,url_for
+from flask import Flask,render_template,request,redirect,url_for,abort
 import datasource
+import search as city_search
+import db
+import images
+import assets
+import api
+import metrics
+from cache import cached,response_cache
 from flask_wtf import FlaskForm
 from wtforms import EmailField,BooleanField,PasswordField,SubmitField
 from wtforms.validators import DataRequired,Length
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
 from werkzeug.serving import run_simple
+import hmac
 import secrets
-from lesson18_2 import app1
+import os
+from lesson18_2 import app1,start_warmup
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = secrets.token_hex(16)
+#多個worker必須使用同一個SECRET_KEY,session與表單的CSRF token才能通用
+#沒有設定時(開發環境)才隨機產生
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or secrets.token_hex(16)
+db.init_app(app)
+images.init_app(app)
+assets.init_app(app)
+app.register_blueprint(api.bp)
+#city資料表變動時清除相關的網頁快取
+response_cache.watch('city',datasource.get_city_version,on_change=datasource.clear_count_cache)
+
+#Dash的js,css也要壓縮
+app1.server.wsgi_app = assets.PrecompressMiddleware(app1.server.wsgi_app)
 
 application = DispatcherMiddleware(
     app,
     {"/dash": app1.server},
 )
+#每個路由的延遲,資料庫時間,在/metrics輸出
+application = metrics.MetricsMiddleware(application,app,
+                                        dash_outputs=('country-store','country-table','lineChart',
+                                                      'overlay-graph','forecast-graph'))
 
 @app.route("/")
+@cached(max_age=300)
 def index():
     return render_template('index.j2')
 
 @app.route("/product")
+@cached(tags=('city',))
 def product():
-    cities:list[dict] = datasource.get_cities()
     page = request.args.get('page',1, type=int)
-    per_page = 10
-    start = (page-1) * per_page
-    end = start + per_page
-    total_pages = (len(cities) + per_page - 1 ) // per_page
-    items_on_page = cities[start:end]
+    per_page = request.args.get('per_page',10, type=int)
+    items_on_page,total_pages,page = datasource.get_cities_page(page,per_page)
     return render_template('product.j2',
                            items_on_page=items_on_page,
                            total_pages=total_pages,
                            page = page)
 
 @app.route("/pricing")
+@cached(tags=('city',))
 def pricing():
-    cities:list[dict] = datasource.get_cities()
     page = request.args.get('page',1, type=int)
-    per_page = 6
-    start = (page-1) * per_page
-    end = start + per_page
-    total_pages = (len(cities) + per_page - 1 ) // per_page
-    items_on_page = cities[start:end]
+    per_page = request.args.get('per_page',6, type=int)
+    items_on_page,total_pages,page = datasource.get_cities_page(page,per_page)
     return render_template('pricing.j2',
                             items_on_page=items_on_page,
                             total_pages=total_pages,
                             page = page) 
 
+@app.route("/search")
+@cached(tags=('city',))
+def search():
+    q = request.args.get('q','').strip()
+    continent = request.args.get('continent') or None
+    country = request.args.get('country') or None
+    page = max(1,request.args.get('page',1, type=int))
+    per_page = 10
+    facets = city_search.facet_counts(q,continent,country)
+    total = facets['total'][0][1]
+    total_pages = max(1,(total + per_page - 1) // per_page)
+    items_on_page = city_search.search_cities(q,continent,country,limit=per_page,offset=(page-1)*per_page)
+    if request.args.get('format') == 'json':
+        return {'q':q,'total':total,'page':page,'items':items_on_page,
+                'facets':{key:dict(values) for key,values in facets.items() if key != 'total'}}
+    return render_template('search.j2',
+                           q=q,continent=continent,country=country,
+                           facets=facets,total=total,
+                           items_on_page=items_on_page,
+                           total_pages=total_pages,
+                           page=page)
+
+@app.errorhandler(city_search.SearchIndexMissing)
+def search_index_missing(error):
+    return str(error),503
+
 class MyForm(FlaskForm):
     email_field = EmailField("Email address",validators=[DataRequired("必需要有資料")])
     password_field = PasswordField("請輸入密碼",validators=[DataRequired("必需要有資料"),Length(5,10)])
@@ -61,12 +106,25 @@ def faqs():
     return render_template('faqs.j2',myform = myForm)
 
 @app.route("/about")
+@cached(max_age=300)
 def about():
     return render_template('about.j2')
 
+@app.route("/cache/invalidate",methods=['POST'])
+def invalidate_cache():
+    #city資料表更新後由匯入程式呼叫,需要帶上.env內的CACHE_TOKEN
+    #gunicorn的每個worker都有自己的快取,bump寫入共用的世代檔案,其它worker檢查版本時也會清除
+    token = os.environ.get('CACHE_TOKEN')
+    if not token or not hmac.compare_digest(request.headers.get('X-Cache-Token','').encode(),token.encode()):
+        abort(403)
+    response_cache.bump(request.args.get('tag'))
+    datasource.clear_count_cache()
+    return {'hits':response_cache.hits,'misses':response_cache.misses}
+
 @app.route("/success")
 def success():
     return "<h1>登入成功</h1>"
 
 if __name__ == "__main__":
+    start_warmup()
     run_simple("localhost", 8080, application,use_debugger=True,use_reloader=True)
\ No newline at end of file
@@ -1,13 +1,31 @@
-from dash import Dash,html,dcc,callback,Input, Output,dash_table,_dash_renderer
-import pandas as pd
-import plotly.express as px
+from dash import Dash,DiskcacheManager,html,dcc,callback,ctx,Input, Output,State,Patch,dash_table,_dash_renderer
+import json
+import os
+import diskcache
+import numpy as np
+import gapminder
+import downsample
+import figure_cache
 import dash_mantine_components as dmc
 from dash_iconify import DashIconify
 _dash_renderer._set_react_version("18.2.0")
 
-df = pd.read_csv('https://raw.githubusercontent.com/plotly/datasets/master/gapminder_unfiltered.csv')
+#從本機的parquet快取讀取,不必每次啟動都下載csv
+df = gapminder.load()
 
-app1 = Dash(__name__,external_stylesheets=dmc.styles.ALL,requests_pathname_prefix="/dash/")
+#耗時的計算用background callback在另一個process執行,不會佔住網站的worker
+#結果存在diskcache,所有worker共用
+background_cache = diskcache.Cache(os.path.join(gapminder.BASE_DIR,'data_cache','jobs'))
+#計算結果保留的秒數
+JOB_EXPIRE = 24 * 60 * 60
+#計算中的鎖最多保留的秒數(job被取消時鎖不會釋放,過期後其它job才能繼續)
+JOB_LOCK_EXPIRE = 10 * 60
+
+#cache_by:結果的key包含資料版本,資料更新後不會使用舊的結果
+app1 = Dash(__name__,external_stylesheets=dmc.styles.ALL,requests_pathname_prefix="/dash/",
+            background_callback_manager=DiskcacheManager(background_cache,
+                                                         cache_by=[gapminder.dataset.current_version],
+                                                         expire=JOB_EXPIRE))
 
 #radio button要顯示的資料
 radio_data = [['pop','人口'],['lifeExp','平均壽命'],['gdpPercap','人均gdp']]
@@ -76,9 +94,29 @@ app1.layout = dmc.MantineProvider(
                     ,
                         
                         
+                        #分頁,排序,篩選都在伺服器處理,每次只傳送目前這一頁
                         dmc.ScrollArea(
-                            children=[],
-                            h=300,
+                            dash_table.DataTable(
+                                id='country-table',
+                                columns=[
+                                    {'name':'國家','id':'country'},
+                                    {'name':'年份','id':'year','type':'numeric'},
+                                    {'name':'人口','id':'pop','type':'numeric'},
+                                    {'name':'平均壽命','id':'lifeExp','type':'numeric'},
+                                    {'name':'人均GDP','id':'gdpPercap','type':'numeric'},
+                                ],
+                                page_current=0,
+                                page_size=10,
+                                page_action='custom',
+                                sort_action='custom',
+                                sort_mode='multi',
+                                sort_by=[],
+                                filter_action='custom',
+                                filter_query='',
+                                style_cell={'textAlign':'center'},
+                                style_header={'fontWeight':'bold'}
+                            ),
+                            h=400,
                             w='50%',
                             id='scrollarea'
                         )
@@ -110,6 +148,46 @@ app1.layout = dmc.MantineProvider(
                     ),
                     my=50
                 )
+            ,
+                #選擇的國家全部資料種類的數值,切換資料種類時由瀏覽器直接使用
+                dcc.Store(id='country-store')
+            ,
+                #多國比較,使用WebGL繪圖,增加或移除國家時只傳送變動的線
+                dmc.Container(
+                    [
+                        dmc.MultiSelect(
+                            label="多國比較",
+                            placeholder="請選擇國家",
+                            id="overlay-countries",
+                            value=["Taiwan","Japan","Korea, Rep."],
+                            data=selected_data,
+                            searchable=True,
+                            clearable=True,
+                            mb=10,
+                        ),
+                        dcc.Graph(id='overlay-graph',figure={'data':[],'layout':{}})
+                    ],
+                    my=50
+                )
+            ,
+                #目前圖上依序顯示的國家
+                dcc.Store(id='overlay-displayed',data=[])
+            ,
+                #所有國家的趨勢預測,在背景執行,可以看到進度與取消
+                dmc.Container(
+                    [
+                        dmc.Group(
+                            [
+                                dmc.Button("預測10年後成長最多的國家",id='forecast-button'),
+                                dmc.Button("取消",id='forecast-cancel',color='red',variant='outline',disabled=True),
+                            ]
+                        ),
+                        dmc.Progress(id='forecast-progress',value=0,my=10),
+                        dmc.Text(id='forecast-status',size='sm'),
+                        dcc.Graph(id='forecast-graph',figure={'data':[],'layout':{}})
+                    ],
+                    my=50
+                )
                 
             ]
             
@@ -120,77 +198,182 @@ app1.layout = dmc.MantineProvider(
     
 )
 
-#圖表顯示的事件
-@callback(    
+#metric標題,clientside callback也使用同樣的文字
+metric_labels = {'pop':'人口','lifeExp':'平均壽命','gdpPercap':'人均GDP'}
+
+#選擇國家的事件,只有換國家時才需要呼叫伺服器
+@callback(
+    Output('country-store','data'),
+    Input('dropdown-selection','value')
+)
+def update_country(country_value):
+    #直接從國家索引取出全部資料種類,不必掃描整個資料表
+    return {'country':country_value,'records':gapminder.country_index().records(country_value)}
+
+#表格的事件,跟著選擇的國家,只傳回目前這一頁
+@callback(
+    Output('country-table','data'),
+    Output('country-table','page_count'),
+    Output('country-table','page_current'),
+    Input('dropdown-selection','value'),
+    Input('country-table','page_current'),
+    Input('country-table','page_size'),
+    Input('country-table','sort_by'),
+    Input('country-table','filter_query')
+)
+def update_table(country_value,page_current,page_size,sort_by,filter_query):
+    #換國家時回到第一頁
+    if ctx.triggered_id == 'dropdown-selection':
+        page_current = 0
+    frame = gapminder.country_index().slice(country_value)
+    return gapminder.query_table(frame,page_current,page_size,sort_by,filter_query)
+
+#圖表顯示的事件,切換資料種類在瀏覽器內完成,不必呼叫伺服器
+app1.clientside_callback(
+    f"""
+    function(store, radio_value) {{
+        if (!store) {{
+            return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+        }}
+        const labels = {json.dumps(metric_labels,ensure_ascii=False)};
+        const series = [
+            {{name: radio_value, label: `${{store.country}}:${{labels[radio_value]}}`, color: 'indigo.6'}}
+        ];
+        return [store.records, series];
+    }}
+    """,
     Output('lineChart','data'),
     Output('lineChart','series'),
-    Input('dropdown-selection','value'),
+    Input('country-store','data'),
     Input('radio_item','value')
 )
-def update_graph(country_value,radio_value):
-    #linechart要的資料
-    dff = df[df.country == country_value]
-    pop_diff = dff[['country', 'year', radio_value]]
-
-    line_chart_data = pop_diff.to_dict('records')
-    if radio_value == 'pop':
-        label = f'{country_value}:人口'
-    elif radio_value == 'lifeExp':
-        label = f'{country_value}:平均壽命'
-    elif radio_value == 'gdpPercap':
-        label = f'{country_value}人均GDP'
-
-    series = [
-        {"name": radio_value,"label":label ,"color": "indigo.6"} 
-    ]
-
-    return line_chart_data,series
-
-#表格顯示的事件
-@callback(    
-    Output('scrollarea','children'),    
-    Input('dropdown-selection','value'),
-    Input('radio_item','value') 
+
+def overlay_trace(country:str,metric:str)->dict:
+    '''
+    一個國家的WebGL折線,點數超過畫面像素時先在伺服器降採樣
+    '''
+    index = gapminder.country_index()
+    x,y = downsample.lttb(index.series(country,'year'),index.series(country,metric))
+    return {'type':'scattergl','mode':'lines','name':country,'x':x.tolist(),'y':y.tolist()}
+
+def overlay_figure(countries:list[str],metric:str)->dict:
+    return {'data':[overlay_trace(country,metric) for country in countries],
+            'layout':{'title':{'text':f'多國比較:{metric_labels[metric]}'},
+                      'xaxis':{'title':{'text':'year'}},
+                      'uirevision':'overlay',
+                      'legend':{'orientation':'h'}}}
+
+#多國比較的事件
+@callback(
+    Output('overlay-graph','figure'),
+    Output('overlay-displayed','data'),
+    Input('overlay-countries','value'),
+    Input('radio_item','value'),
+    State('overlay-displayed','data')
 )
-def update_table(country_value,radio_value):
-    #只顯示台灣的資料,table所需要的資料
-    dff = df[df.country == country_value]
-    pop_diff = dff[['country', 'year', radio_value]]
-    elements = pop_diff.to_dict('records')
-
-    rows = [
-        dmc.TableTr(
-            [
-                dmc.TableTd(element["country"]),
-                dmc.TableTd(element["year"]),
-                dmc.TableTd(element[radio_value]),
-            ]
-        )
-        for element in elements
-    ]
-
-    if radio_value == 'pop':
-        head_name = '人口'
-    elif radio_value == 'lifeExp':
-        head_name = '平均壽命'
-    elif radio_value == 'gdpPercap':
-        head_name = '人均GDP'
-
-    head = dmc.TableThead(
-        dmc.TableTr(
-            [
-                dmc.TableTh("國家"),
-                dmc.TableTh("年份"),
-                dmc.TableTh(head_name),
-            ]
-        )
-    )
+def update_overlay(countries,radio_value,displayed):
+    countries = countries or []
+    displayed = displayed or []
+    #換資料種類時每條線都要換,重新產生整張圖
+    if ctx.triggered_id != 'overlay-countries' or not displayed:
+        return overlay_figure(countries,radio_value),countries
+    #只有增加或移除國家時,用Patch傳送變動的部分
+    patched = Patch()
+    removed = [i for i,country in enumerate(displayed) if country not in countries]
+    for i in reversed(removed):
+        del patched['data'][i]
+    kept = [country for country in displayed if country in countries]
+    added = [country for country in countries if country not in displayed]
+    for country in added:
+        patched['data'].append(overlay_trace(country,radio_value))
+    return patched,kept + added
 
-    body = dmc.TableTbody(rows)
-    caption = dmc.TableCaption(f"Taiwan 年份,{head_name}")
-    return dmc.Table([head, body, caption])
+#預測使用最近幾年的資料
+FORECAST_WINDOW = 20
+#預測幾年後
+FORECAST_YEARS = 10
+#圖表顯示前幾名
+FORECAST_TOP = 20
 
-    
+def forecast_growth(metric:str,set_progress=None)->list[tuple[str,float]]:
+    '''
+    每個國家用最近FORECAST_WINDOW年做線性迴歸,預測FORECAST_YEARS年後相對最後一年的成長率(%)
+    return:
+        依照成長率由大到小排序的[(國家,成長率)]
+    '''
+    index = gapminder.country_index()
+    countries = index.countries
+    result = []
+    for i,country in enumerate(countries):
+        years = index.series(country,'year').astype('float64')[-FORECAST_WINDOW:]
+        values = index.series(country,metric).astype('float64')[-FORECAST_WINDOW:]
+        if len(years) >= 3 and values[-1] > 0:
+            slope,intercept = np.polyfit(years,values,1)
+            predicted = slope * (years[-1] + FORECAST_YEARS) + intercept
+            result.append((country,round((predicted / values[-1] - 1) * 100,2)))
+        if set_progress and (i % 10 == 0 or i == len(countries) - 1):
+            set_progress(((i + 1) * 100 // len(countries),f'{i + 1}/{len(countries)} 個國家'))
+    result.sort(key=lambda item:item[1],reverse=True)
+    return result
+
+#趨勢預測的事件,在背景process執行
+@callback(
+    Output('forecast-graph','figure'),
+    Input('forecast-button','n_clicks'),
+    State('radio_item','value'),
+    background=True,
+    running=[
+        (Output('forecast-button','disabled'),True,False),
+        (Output('forecast-cancel','disabled'),False,True),
+    ],
+    cancel=[Input('forecast-cancel','n_clicks')],
+    progress=[Output('forecast-progress','value'),Output('forecast-status','children')],
+    #n_clicks(第0個參數)不算在快取的key內,相同資料種類與資料版本的結果直接使用
+    cache_args_to_ignore=[0],
+    prevent_initial_call=True
+)
+def forecast(set_progress,n_clicks,radio_value):
+    #已經完成的結果由cache_by直接傳回,不會執行到這裡
+    #同時有多個相同的job(例如其它worker的請求)時只有一個計算,其它的等待後使用它的結果
+    key = ('forecast',radio_value,gapminder.dataset.version,FORECAST_WINDOW,FORECAST_YEARS)
+    with diskcache.Lock(background_cache,('running',*key),expire=JOB_LOCK_EXPIRE):
+        result = background_cache.get(key)
+        if result is None:
+            result = forecast_growth(radio_value,set_progress)
+            background_cache.set(key,result,expire=JOB_EXPIRE)
+    set_progress((100,'完成'))
+    top = result[:FORECAST_TOP]
+    return {'data':[{'type':'bar','x':[country for country,_ in top],'y':[growth for _,growth in top]}],
+            'layout':{'title':{'text':f'{FORECAST_YEARS}年後{metric_labels[radio_value]}成長率預測(%)'}}}
+
+COUNTRY_OUTPUT = 'country-store.data'
+
+def callback_payloads():
+    '''
+    所有國家的callback請求,用來預熱快取
+    '''
+    for country in gapminder.country_index().countries:
+        yield {'output':COUNTRY_OUTPUT,
+               'outputs':{'id':'country-store','property':'data'},
+               'inputs':[{'id':'dropdown-selection','property':'value','value':country}],
+               'changedPropIds':['dropdown-selection.value']}
+
+#國家的資料只和國家,資料版本有關,快取在所有worker共用的sqlite檔案
+figure_store = figure_cache.FigureStore()
+gapminder.dataset.on_change(lambda frame,version:figure_store.discard_other_versions(version))
+app1.server.wsgi_app = figure_cache.CallbackCacheMiddleware(app1.server.wsgi_app,
+                                                            {COUNTRY_OUTPUT},
+                                                            gapminder.dataset.current_version,
+                                                            figure_store)
+
+def start_warmup():
+    '''
+    在背景預先計算所有國家的callback結果
+    由gunicorn的post_fork(每個worker)或直接執行時呼叫,不在import時執行
+    '''
+    return figure_cache.warm(app1.server,callback_payloads(),figure_store,gapminder.dataset.current_version(),
+                             expected=len(gapminder.country_index().countries))
 
 if __name__ == '__main__':
+    start_warmup()
     app1.run(debug=True)
\ No newline at end of file
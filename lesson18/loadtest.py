@@ -0,0 +1,222 @@
+'''
+本機壓力測試
+    python loadtest.py --serve --concurrency 20 --duration 30
+    python loadtest.py --url http://localhost:8080 --scenarios product,dash
+
+--serve 會用gunicorn啟動一個使用citys.db(不連postgres)的本機伺服器
+--serve --server asgi 改用uvicorn啟動asgi.py的版本
+結果(吞吐量,延遲百分位數)會印出並存成json,方便比較每次修改前後的差異
+'''
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULT_DIR = os.path.join(BASE_DIR,'loadtest-results')
+CSRF_PATTERN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+#Dash callback輸入元件的測試值,沒有列在這裡的callback不會被測試
+SAMPLE_VALUES = {
+    ('dropdown-selection','value'):['Taiwan','Japan','United States','Germany','Brazil','India'],
+    ('radio_item','value'):['pop','lifeExp','gdpPercap'],
+}
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency:dict[str,list[float]] = defaultdict(list)
+        self.errors:dict[str,int] = defaultdict(int)
+
+    def record(self,name:str,seconds:float,ok:bool):
+        with self._lock:
+            self.latency[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+def percentile(values:list[float],p:float)->float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1,max(0,round(p / 100 * len(values)) - 1))
+    return values[index]
+
+def parse_outputs(output:str)->list[dict]:
+    '''
+    將Dash的output字串 "..a.data...b.series.." 轉成[{'id':'a','property':'data'},...]
+    '''
+    parts = output[2:-2].split('...') if output.startswith('..') else [output]
+    outputs = []
+    for part in parts:
+        component_id,prop = part.rsplit('.',1)
+        outputs.append({'id':component_id,'property':prop})
+    return outputs
+
+def dash_callbacks(session:requests.Session,url:str)->list[dict]:
+    '''
+    從_dash-dependencies找出可以測試的伺服器端callback
+    '''
+    response = session.get(f'{url}/dash/_dash-dependencies',timeout=10)
+    response.raise_for_status()
+    callbacks = []
+    for dependency in response.json():
+        if dependency.get('clientside_function') or dependency['output'].startswith('{'):
+            continue
+        inputs = [(item['id'],item['property']) for item in dependency['inputs']]
+        if all(key in SAMPLE_VALUES for key in inputs) and not dependency.get('state'):
+            callbacks.append({'output':dependency['output'],'inputs':inputs})
+    return callbacks
+
+def dash_payload(callback:dict)->dict:
+    inputs = [{'id':component_id,'property':prop,'value':random.choice(SAMPLE_VALUES[(component_id,prop)])}
+              for component_id,prop in callback['inputs']]
+    outputs = parse_outputs(callback['output'])
+    return {'output':callback['output'],
+            'outputs':outputs if len(outputs) > 1 else outputs[0],
+            'inputs':inputs,
+            'changedPropIds':[f"{inputs[0]['id']}.{inputs[0]['property']}"]}
+
+class Scenarios:
+    '''
+    每個method是一種請求,傳回是否成功
+    '''
+    def __init__(self,url:str,callbacks:list[dict]):
+        self.url = url
+        self.callbacks = callbacks
+
+    def product(self,session):
+        return session.get(f'{self.url}/product',params={'page':random.randint(1,9)},timeout=30).ok
+
+    def pricing(self,session):
+        return session.get(f'{self.url}/pricing',params={'page':random.randint(1,14)},timeout=30).ok
+
+    def faqs(self,session):
+        page = session.get(f'{self.url}/faqs',timeout=30)
+        match = CSRF_PATTERN.search(page.text)
+        if not page.ok or not match:
+            return False
+        data = {'csrf_token':match.group(1),
+                'email_field':'test@example.com',
+                'password_field':'123456',
+                'submit_field':'確定送出'}
+        return session.post(f'{self.url}/faqs',data=data,timeout=30).ok
+
+    def dash(self,session):
+        if not self.callbacks:
+            return False
+        payload = dash_payload(random.choice(self.callbacks))
+        return session.post(f'{self.url}/dash/_dash-update-component',json=payload,timeout=30).ok
+
+def run(url:str,names:list[str],concurrency:int,duration:float)->dict:
+    setup = requests.Session()
+    callbacks = dash_callbacks(setup,url) if 'dash' in names else []
+    scenarios = Scenarios(url,callbacks)
+    stats = Stats()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            name = random.choice(names)
+            start = time.perf_counter()
+            try:
+                ok = getattr(scenarios,name)(session)
+            except requests.RequestException:
+                ok = False
+            stats.record(name,time.perf_counter() - start,ok)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    report = {'url':url,'concurrency':concurrency,'duration':round(elapsed,2),
+              'time':time.strftime('%Y-%m-%d %H:%M:%S'),'scenarios':{}}
+    everything = []
+    for name,values in sorted(stats.latency.items()):
+        everything += values
+        report['scenarios'][name] = summary(values,stats.errors[name],elapsed)
+    report['total'] = summary(everything,sum(stats.errors.values()),elapsed)
+    return report
+
+def summary(values:list[float],errors:int,elapsed:float)->dict:
+    return {'requests':len(values),
+            'errors':errors,
+            'rps':round(len(values) / elapsed,1) if elapsed else 0,
+            'p50_ms':round(percentile(values,50) * 1000,2),
+            'p90_ms':round(percentile(values,90) * 1000,2),
+            'p99_ms':round(percentile(values,99) * 1000,2),
+            'max_ms':round(max(values,default=0) * 1000,2)}
+
+SERVERS = {
+    'wsgi':['-m','gunicorn','-c','gunicorn.conf.py','wsgi:application'],
+    'asgi':['-m','uvicorn','asgi:app','--host','127.0.0.1'],
+}
+
+def serve(port:int,server:str='wsgi')->subprocess.Popen:
+    '''
+    啟動使用citys.db的本機伺服器,等到/healthz回應後才傳回
+    '''
+    env = dict(os.environ,
+               CITY_DB_BACKEND='sqlite',
+               SECRET_KEY=os.environ.get('SECRET_KEY','loadtest'),
+               WEB_BIND=f'127.0.0.1:{port}')
+    command = SERVERS[server] + (['--port',str(port)] if server == 'asgi' else [])
+    process = subprocess.Popen([sys.executable,*command],cwd=BASE_DIR,env=env)
+    for _ in range(120):
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/healthz',timeout=1).ok:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError('本機伺服器沒有啟動')
+
+def print_report(report:dict):
+    print(f"{'scenario':<10}{'requests':>10}{'errors':>8}{'rps':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    rows = list(report['scenarios'].items()) + [('total',report['total'])]
+    for name,item in rows:
+        print(f"{name:<10}{item['requests']:>10}{item['errors']:>8}{item['rps']:>9}"
+              f"{item['p50_ms']:>9}{item['p90_ms']:>9}{item['p99_ms']:>9}{item['max_ms']:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description='lesson18 壓力測試')
+    parser.add_argument('--url',default='http://127.0.0.1:8080')
+    parser.add_argument('--scenarios',default='product,pricing,faqs,dash')
+    parser.add_argument('--concurrency',type=int,default=10)
+    parser.add_argument('--duration',type=float,default=20)
+    parser.add_argument('--serve',action='store_true',help='啟動使用citys.db的本機伺服器')
+    parser.add_argument('--server',choices=list(SERVERS),default='wsgi',help='--serve使用的版本')
+    parser.add_argument('--port',type=int,default=8099)
+    parser.add_argument('--output',help='結果的json檔,預設存到loadtest-results/')
+    args = parser.parse_args()
+
+    process = None
+    url = args.url.rstrip('/')
+    if args.serve:
+        process = serve(args.port,args.server)
+        url = f'http://127.0.0.1:{args.port}'
+    try:
+        report = run(url,args.scenarios.split(','),args.concurrency,args.duration)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+    print_report(report)
+    output = args.output or os.path.join(RESULT_DIR,f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)),exist_ok=True)
+    with open(output,'w',encoding='utf-8') as file:
+        json.dump(report,file,ensure_ascii=False,indent=2)
+    print(f'結果已存到{output}')
+
+if __name__ == '__main__':
+    main()
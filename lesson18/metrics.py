@@ -0,0 +1,459 @@
+import io
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+import db
+
+#延遲直方圖的區間(秒)
+BUCKETS = (0.005,0.01,0.025,0.05,0.1,0.25,0.5,1.0,2.5,5.0,10.0)
+#超過這個秒數的請求會開始取樣呼叫堆疊
+SLOW_THRESHOLD = float(os.environ.get('SLOW_REQUEST_SECONDS',1.0))
+#取樣間隔(秒)
+SAMPLE_INTERVAL = 0.005
+#取樣結果存放的資料夾
+PROFILE_DIR = os.environ.get('PROFILE_DIR',os.path.join(os.path.dirname(os.path.abspath(__file__)),'profiles'))
+#同時最多取樣幾個請求
+MAX_PROFILES = 2
+DASH_CALLBACK_PATH = '/dash/_dash-update-component'
+#Dash內建的網址,其它/dash/...的網址都算成dash:other,路由標籤的數量才不會無限增加
+DASH_SEGMENTS = ('_dash-layout','_dash-dependencies','_dash-component-suites','_reload-hash',
+                 '_favicon.ico','assets')
+#超過這個大小的callback請求不讀取內容,路由標籤為dash:callback
+MAX_CALLBACK_BODY = 64 * 1024
+#每個worker定期把自己的數據寫到這個資料夾,/metrics合併所有worker的數據後輸出
+METRICS_DIR = os.environ.get('METRICS_DIR',os.path.join(os.path.dirname(os.path.abspath(__file__)),'metrics_data'))
+#寫入的間隔(秒)
+FLUSH_INTERVAL = 1.0
+#已經結束的worker的數據合併到這個檔案
+RETIRED_FILE = 'retired.json'
+
+def escape_label(value:str)->str:
+    '''
+    Prometheus標籤值的跳脫:反斜線,雙引號,換行
+    '''
+    return str(value).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+
+def reset_store(directory:str=METRICS_DIR):
+    '''
+    清除之前執行時留下的數據,在gunicorn master啟動時(fork worker之前)呼叫
+    '''
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            os.remove(os.path.join(directory,name))
+
+def _read_snapshot(path:str)->dict|None:
+    try:
+        with open(path,encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError,ValueError):
+        return None
+
+def _write_snapshot(path:str,data:dict):
+    tmp = f'{path}.tmp'
+    with open(tmp,'w',encoding='utf-8') as file:
+        json.dump(data,file)
+    os.replace(tmp,path)
+
+def retire_store(pid:int,directory:str=METRICS_DIR):
+    '''
+    worker結束後把它的數據合併到RETIRED_FILE並刪除它的檔案,在gunicorn master的child_exit呼叫
+    計數不會因為worker重啟而減少,檔案數量也不會一直增加
+    '''
+    if not os.path.isdir(directory):
+        return
+    names = [name for name in os.listdir(directory) if name.startswith(f'{pid}-') and name.endswith('.json')]
+    if not names:
+        return
+    retired_path = os.path.join(directory,RETIRED_FILE)
+    snapshots = [_read_snapshot(retired_path) or {'pid':None,'latency':[],'db_seconds':{},'in_flight':{}}]
+    snapshots += [data for data in (_read_snapshot(os.path.join(directory,name)) for name in names) if data]
+    latency,db_seconds,_ = merge_snapshots(snapshots)
+    _write_snapshot(retired_path,{'pid':None,
+                                  'latency':[[route,code,histogram.counts,histogram.sum,histogram.count]
+                                             for (route,code),histogram in latency.items()],
+                                  'db_seconds':dict(db_seconds),
+                                  'in_flight':{}})
+    for name in names:
+        os.remove(os.path.join(directory,name))
+
+def merge_snapshots(snapshots:list[dict])->tuple[dict,dict,dict]:
+    '''
+    合併多個process的數據
+    return:
+        (latency,db_seconds,in_flight)
+    '''
+    latency:dict[tuple[str,str],Histogram] = defaultdict(Histogram)
+    db_seconds:dict[str,float] = defaultdict(float)
+    in_flight:dict[str,int] = defaultdict(int)
+    for data in snapshots:
+        for route,code,counts,total,count in data['latency']:
+            latency[(route,code)].merge(counts,total,count)
+        for route,seconds in data['db_seconds'].items():
+            db_seconds[route] += seconds
+        for route,count in data['in_flight'].items():
+            in_flight[route] += count
+    return latency,db_seconds,in_flight
+
+def _pid_alive(pid:int)->bool:
+    try:
+        os.kill(pid,0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self,value:float):
+        for i,bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self,counts:list[int],total:float,count:int):
+        self.counts = [a + b for a,b in zip(self.counts,counts)]
+        self.sum += total
+        self.count += count
+
+class SlowRequestProfiler:
+    '''
+    背景執行緒:請求超過SLOW_THRESHOLD秒後,每SAMPLE_INTERVAL秒取樣一次該執行緒的呼叫堆疊
+    請求結束時把結果以collapsed stack格式(可以用flamegraph.pl或speedscope開啟)存檔
+    只有一條執行緒,不會每個請求都多開執行緒
+    '''
+    def __init__(self):
+        #{request_id:[路由,thread_id,開始時間,Counter或None]}
+        self._active:dict[int,list] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_thread(self):
+        #fork之後的子process需要重新啟動取樣執行緒
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run,daemon=True)
+            self._thread.start()
+
+    def begin(self,request_id:int,route:str):
+        with self._lock:
+            self._ensure_thread()
+            self._active[request_id] = [route,threading.get_ident(),time.perf_counter(),None]
+
+    def end(self,request_id:int,duration:float):
+        with self._lock:
+            route,_,_,samples = self._active.pop(request_id)
+        if samples:
+            self._save(route,duration,samples)
+
+    def _run(self):
+        targets = []
+        while True:
+            #沒有慢速請求時不需要那麼頻繁的檢查
+            time.sleep(SAMPLE_INTERVAL if targets else 0.05)
+            now = time.perf_counter()
+            with self._lock:
+                slow = [item for item in self._active.values() if now - item[2] > SLOW_THRESHOLD]
+                profiling = sum(1 for item in slow if item[3] is not None)
+                for item in slow:
+                    if item[3] is None and profiling < MAX_PROFILES:
+                        item[3] = Counter()
+                        profiling += 1
+                targets = [item for item in slow if item[3] is not None]
+            if not targets:
+                continue
+            frames = sys._current_frames()
+            for item in targets:
+                frame = frames.get(item[1])
+                if frame is None:
+                    continue
+                stack = ';'.join(f'{f.name} ({os.path.basename(f.filename)}:{f.lineno})'
+                                 for f in traceback.extract_stack(frame))
+                item[3][stack] += 1
+
+    def _save(self,route:str,duration:float,samples:Counter):
+        os.makedirs(PROFILE_DIR,exist_ok=True)
+        name = route.replace('/','_').replace(':','_').replace('.','_')[:80]
+        path = os.path.join(PROFILE_DIR,f'{time.strftime("%Y%m%d-%H%M%S")}-{name}-{duration*1000:.0f}ms.txt')
+        with open(path,'w',encoding='utf-8') as file:
+            for stack,count in samples.most_common():
+                file.write(f'{stack} {count}\n')
+        print(f'慢速請求 {route} {duration:.3f}秒,取樣結果:{path}')
+
+class MetricsMiddleware:
+    '''
+    WSGI middleware:記錄每個路由(Flask endpoint或Dash callback)的
+    - 延遲直方圖
+    - 正在處理中的請求數
+    - 資料庫時間
+    並在/metrics以Prometheus文字格式輸出
+
+    gunicorn有多個worker時,每個worker每FLUSH_INTERVAL秒把自己的數據寫到METRICS_DIR/<pid>-<啟動時間>.json,
+    /metrics由任何一個worker合併所有檔案後輸出,數字不會因為抓到不同的worker而變小
+    - 已經結束的worker(例如max_requests重啟)由gunicorn的child_exit合併到RETIRED_FILE(見retire_store),
+      沒有經過child_exit的已結束worker(例如沒有使用gunicorn.conf.py)的檔案不計算
+    - 連線池狀態是目前這個worker的,加上pid標籤
+    路由標籤只有Flask的endpoint,DASH_SEGMENTS與dash_outputs內的callback,其它的網址合併成固定的標籤
+
+    parameter:
+        dash_outputs:要個別記錄的Dash callback(第一個Output的元件id),其它callback記錄成dash:callback
+    '''
+    def __init__(self,app,flask_app,path:str='/metrics',dash_outputs:tuple[str,...]=()):
+        self.app = app
+        self.flask_app = flask_app
+        self.path = path
+        self.dash_outputs = frozenset(dash_outputs)
+        self._lock = threading.Lock()
+        self.latency:dict[tuple[str,str],Histogram] = defaultdict(Histogram)
+        self.db_seconds:dict[str,float] = defaultdict(float)
+        self.in_flight:dict[str,int] = defaultdict(int)
+        self.profiler = SlowRequestProfiler()
+        self.directory = METRICS_DIR
+        self._store_pid = None
+        self._store_path = None
+        self._flusher = None
+        self._dirty = threading.Event()
+
+    def _ensure_flusher(self):
+        #fork之後的子process需要重新啟動寫入執行緒,並使用自己的檔案
+        pid = os.getpid()
+        if self._store_pid != pid:
+            with self._lock:
+                if self._store_pid != pid:
+                    self._store_pid = pid
+                    self._store_path = os.path.join(self.directory,f'{pid}-{time.time_ns()}.json')
+                    self._flusher = threading.Thread(target=self._flush_loop,daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(FLUSH_INTERVAL)
+            self._dirty.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                print(f'無法寫入metrics:{e}')
+
+    def snapshot(self)->dict:
+        '''
+        目前這個process的數據(可以轉成json)
+        '''
+        with self._lock:
+            return {'pid':os.getpid(),
+                    'latency':[[route,code,histogram.counts,histogram.sum,histogram.count]
+                               for (route,code),histogram in self.latency.items()],
+                    'db_seconds':dict(self.db_seconds),
+                    'in_flight':dict(self.in_flight)}
+
+    def flush(self):
+        '''
+        把目前這個process的數據寫到METRICS_DIR
+        '''
+        if self._store_path is None:
+            return
+        os.makedirs(self.directory,exist_ok=True)
+        _write_snapshot(self._store_path,self.snapshot())
+
+    def collect(self)->tuple[dict,dict,dict]:
+        '''
+        合併所有worker的數據,目前這個process使用記憶體中的最新數據
+        return:
+            (latency,db_seconds,in_flight)
+        '''
+        snapshots = [self.snapshot()]
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory,name)
+                if not name.endswith('.json') or path == self._store_path:
+                    continue
+                data = _read_snapshot(path)
+                if data is None or (data['pid'] is not None and not _pid_alive(data['pid'])):
+                    continue
+                snapshots.append(data)
+        return merge_snapshots(snapshots)
+
+    def route_of(self,environ)->str:
+        path = environ.get('PATH_INFO','')
+        if path == DASH_CALLBACK_PATH and environ.get('REQUEST_METHOD') == 'POST':
+            return self._callback_route(environ)
+        if path == '/dash' or path.startswith('/dash/'):
+            segment = path[len('/dash/'):].split('/')[0]
+            if not segment:
+                return 'dash:index'
+            return f'dash:{segment}' if segment in DASH_SEGMENTS else 'dash:other'
+        try:
+            adapter = self.flask_app.url_map.bind('localhost')
+            endpoint,_ = adapter.match(path,method=environ.get('REQUEST_METHOD','GET'))
+            return endpoint
+        except Exception:
+            return 'not_found'
+
+    def _callback_route(self,environ)->str:
+        '''
+        讀出callback的output當作路由名稱,再把內容放回去給Dash使用
+        output例如 "..country-table.data...country-table.page_count..",使用第一個Output的元件id
+        '''
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return 'dash:callback'
+        if not self.dash_outputs or not 0 < length <= MAX_CALLBACK_BODY:
+            return 'dash:callback'
+        body = environ['wsgi.input'].read(length)
+        environ['wsgi.input'] = io.BytesIO(body)
+        try:
+            output = json.loads(body)['output']
+            component = output.strip('.').split('...')[0].rsplit('.',1)[0]
+        except (ValueError,KeyError,TypeError,AttributeError):
+            return 'dash:callback'
+        return f'dash:{component}' if component in self.dash_outputs else 'dash:callback'
+
+    def __call__(self,environ,start_response):
+        if environ.get('PATH_INFO') == self.path:
+            body = self.render().encode('utf-8')
+            start_response('200 OK',[('Content-Type','text/plain; version=0.0.4; charset=utf-8'),
+                                     ('Content-Length',str(len(body)))])
+            return [body]
+        route = self.route_of(environ)
+        status = {}
+        def capture(code,headers,exc_info=None):
+            status['code'] = code.split(' ')[0]
+            return start_response(code,headers,exc_info)
+        finish = self.begin(route)
+        try:
+            result = self.app(environ,capture)
+        except Exception:
+            finish('500')
+            raise
+        return ClosingIterator(result,lambda:finish(status.get('code','500')))
+
+    def begin(self,route:str,profile:bool=True):
+        '''
+        開始記錄一個請求(WSGI與AsgiMetricsMiddleware共用)
+        parameter:
+            profile:是否取樣慢速請求的呼叫堆疊,async的請求在event loop執行,取樣結果沒有意義
+        return:
+            請求結束時呼叫的函式finish(狀態碼),重複呼叫只記錄一次
+        '''
+        self._ensure_flusher()
+        with self._lock:
+            self.in_flight[route] += 1
+        start = time.perf_counter()
+        spent = [0.0]
+        db.db_time.set(spent)
+        request_id = id(spent)
+        if profile:
+            self.profiler.begin(request_id,route)
+        finished = False
+        def finish(code:str):
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            duration = time.perf_counter() - start
+            if profile:
+                self.profiler.end(request_id,duration)
+            with self._lock:
+                self.in_flight[route] -= 1
+                self.latency[(route,code)].observe(duration)
+                self.db_seconds[route] += spent[0]
+            self._dirty.set()
+        return finish
+
+    def render(self)->str:
+        lines = ['# HELP http_request_duration_seconds 請求處理時間',
+                 '# TYPE http_request_duration_seconds histogram']
+        latency,db_seconds,in_flight = self.collect()
+        for (route,code),histogram in sorted(latency.items()):
+            labels = f'route="{escape_label(route)}",status="{escape_label(code)}"'
+            cumulative = 0
+            for bound,count in zip(BUCKETS,histogram.counts):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {histogram.count}')
+        lines += ['# HELP http_requests_in_flight 正在處理中的請求數',
+                  '# TYPE http_requests_in_flight gauge']
+        lines += [f'http_requests_in_flight{{route="{escape_label(route)}"}} {count}'
+                  for route,count in sorted(in_flight.items())]
+        lines += ['# HELP http_request_db_seconds_total 請求中花在資料庫的時間',
+                  '# TYPE http_request_db_seconds_total counter']
+        lines += [f'http_request_db_seconds_total{{route="{escape_label(route)}"}} {seconds}'
+                  for route,seconds in sorted(db_seconds.items())]
+        pid = os.getpid()
+        #資料庫有問題時更需要/metrics,連線池無法建立時只輸出db_pool_up 0
+        try:
+            pool_metrics = db.get_pool().metrics()
+        except Exception as e:
+            print(f'無法取得連線池狀態:{e}')
+            pool_metrics = None
+        lines += ['# HELP db_pool_up 連線池是否可以使用(回應/metrics的worker)',
+                  '# TYPE db_pool_up gauge',
+                  f'db_pool_up{{pid="{pid}"}} {0 if pool_metrics is None else 1}',
+                  '# HELP db_pool 連線池狀態(回應/metrics的worker)',
+                  '# TYPE db_pool gauge']
+        for name,value in (pool_metrics or {}).items():
+            lines.append(f'db_pool{{pid="{pid}",stat="{escape_label(name)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+class AsgiMetricsMiddleware:
+    '''
+    ASGI middleware:asgi.py原生async路由的請求也記錄到同一個MetricsMiddleware
+    其它網址交給WSGI程式,已經由MetricsMiddleware記錄,不重複計算
+    parameter:
+        metrics:WSGI程式使用的MetricsMiddleware
+        paths:原生async路由的網址
+    '''
+    def __init__(self,app,metrics:MetricsMiddleware,paths):
+        self.app = app
+        self.metrics = metrics
+        self.paths = frozenset(paths)
+
+    async def __call__(self,scope,receive,send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope,receive,send)
+            return
+        route = self.metrics.route_of({'PATH_INFO':scope['path'],'REQUEST_METHOD':scope['method']})
+        status = {}
+        async def capture(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = str(message['status'])
+            await send(message)
+        finish = self.metrics.begin(route,profile=False)
+        try:
+            await self.app(scope,receive,capture)
+        finally:
+            finish(status.get('code','500'))
+
+class ClosingIterator:
+    '''
+    回應內容全部送出(或連線中斷)後才呼叫callback,串流回應的時間也會被記錄
+    '''
+    def __init__(self,iterable,callback):
+        self._iterable = iterable
+        self._callback = callback
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def close(self):
+        try:
+            if hasattr(self._iterable,'close'):
+                self._iterable.close()
+        finally:
+            self._callback()
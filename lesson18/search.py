@@ -0,0 +1,182 @@
+import re
+import threading
+import db
+from datasource import CITY_COLUMNS, _to_dict, clamp_per_page
+
+NAME_COLUMN = CITY_COLUMNS['city_name']
+
+SQLITE_INDEX = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS city_fts USING fts5(
+        ctiyName, country, continent,
+        content='city', content_rowid='cityId',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='1 2 3'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS city_fts_insert AFTER INSERT ON city BEGIN
+        INSERT INTO city_fts(rowid,ctiyName,country,continent)
+        VALUES (new."cityId",new."ctiyName",new.country,new.continent);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS city_fts_delete AFTER DELETE ON city BEGIN
+        INSERT INTO city_fts(city_fts,rowid,ctiyName,country,continent)
+        VALUES ('delete',old."cityId",old."ctiyName",old.country,old.continent);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS city_fts_update AFTER UPDATE ON city BEGIN
+        INSERT INTO city_fts(city_fts,rowid,ctiyName,country,continent)
+        VALUES ('delete',old."cityId",old."ctiyName",old.country,old.continent);
+        INSERT INTO city_fts(rowid,ctiyName,country,continent)
+        VALUES (new."cityId",new."ctiyName",new.country,new.continent);
+    END''',
+    'CREATE INDEX IF NOT EXISTS idx_city_continent_country ON city(continent,country)',
+]
+
+POSTGRES_INDEX = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'''ALTER TABLE city ADD COLUMN IF NOT EXISTS search tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple',
+            coalesce({NAME_COLUMN},'') || ' ' || coalesce(country,'') || ' ' || coalesce(continent,''))) STORED''',
+    'CREATE INDEX IF NOT EXISTS idx_city_search ON city USING GIN (search)',
+    f'CREATE INDEX IF NOT EXISTS idx_city_name_trgm ON city USING GIN ({NAME_COLUMN} gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS idx_city_continent_country ON city (continent,country)',
+]
+
+#建立索引需要的物件,執行期間只檢查是否存在,不修改資料庫
+SQLITE_CHECK = """SELECT COUNT(*) = 4 FROM sqlite_master
+                  WHERE name IN ('city_fts','city_fts_insert','city_fts_delete','city_fts_update')"""
+POSTGRES_CHECK = """SELECT to_regclass('idx_city_search') IS NOT NULL
+                           AND to_regclass('idx_city_name_trgm') IS NOT NULL"""
+
+class SearchIndexMissing(RuntimeError):
+    '''
+    搜尋索引還沒建立,需要先執行 python search.py
+    '''
+
+_index_ready = False
+_index_lock = threading.Lock()
+
+def create_search_index():
+    '''
+    建立全文檢索的索引,部署時執行一次:python search.py
+    - sqlite:FTS5虛擬資料表,由trigger與city資料表同步
+      citys.db有納入版本控制,不在請求中建立,避免執行中的程式修改專案內的資料庫
+    - postgres:tsvector欄位 + GIN索引,以及pg_trgm的三字元索引
+      ALTER TABLE會鎖住並重寫整個city資料表,CREATE EXTENSION需要較高的權限,
+      所以不在請求中執行,要用有權限的帳號在部署時執行
+    '''
+    with db.get_pool().connection() as conn:
+        with conn.cursor() as cursor:
+            if db.DB_BACKEND == 'sqlite':
+                cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'city_fts'")
+                exists = cursor.fetchone()[0] > 0
+                for statement in SQLITE_INDEX:
+                    cursor.execute(statement)
+                if not exists:
+                    #第一次建立時把city現有的資料加入索引
+                    cursor.execute("INSERT INTO city_fts(city_fts) VALUES ('rebuild')")
+            else:
+                #DDL不受應用程式的statement_timeout限制(只在這個transaction內)
+                cursor.execute('SET LOCAL statement_timeout = 0')
+                for statement in POSTGRES_INDEX:
+                    cursor.execute(statement)
+
+def ensure_search_index():
+    '''
+    確認搜尋索引已經建立(每個process成功檢查一次)
+    只檢查索引是否存在,不存在時丟出SearchIndexMissing,索引由create_search_index在部署時建立
+    '''
+    global _index_ready
+    if _index_ready:
+        return
+    with _index_lock:
+        if _index_ready:
+            return
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SQLITE_CHECK if db.DB_BACKEND == 'sqlite' else POSTGRES_CHECK)
+                if not cursor.fetchone()[0]:
+                    raise SearchIndexMissing('搜尋索引尚未建立,請在部署時執行 python search.py')
+        _index_ready = True
+
+def _tokens(q:str)->list[str]:
+    return re.findall(r'\w+',q.lower())
+
+def _where(q:str,continent:str|None,country:str|None)->tuple[str,str,list]:
+    '''
+    return:
+        (FROM子句,WHERE子句,參數)
+    '''
+    tokens = _tokens(q)
+    conditions = []
+    params = []
+    if db.DB_BACKEND == 'sqlite':
+        source = 'city'
+        if tokens:
+            source = 'city JOIN city_fts ON city_fts.rowid = city."cityId"'
+            conditions.append('city_fts MATCH %s')
+            #每個字都做前綴比對,例如 tai kao -> "tai"* "kao"*
+            params.append(' '.join(f'"{token}"*' for token in tokens))
+    else:
+        source = 'city'
+        if tokens:
+            conditions.append(f"(search @@ to_tsquery('simple',%s) OR {NAME_COLUMN} %% %s)")
+            params.append(' & '.join(f'{token}:*' for token in tokens))
+            params.append(q)
+    if continent:
+        conditions.append('city.continent = %s')
+        params.append(continent)
+    if country:
+        conditions.append('city.country = %s')
+        params.append(country)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return source,where,params
+
+def search_cities(q:str,continent:str|None=None,country:str|None=None,limit:int=20,offset:int=0)->list[dict]:
+    '''
+    搜尋城市名稱,國家,洲名,支援前綴比對(例如 "kao" 可以找到 Kaohsiung)
+    parameter:
+        q:搜尋文字,空字串代表不限
+        continent,country:只顯示這個洲/國家的結果
+    return:
+        依照相關程度排序的城市
+    '''
+    ensure_search_index()
+    source,where,params = _where(q,continent,country)
+    if not _tokens(q):
+        order = 'ORDER BY city."cityId"'
+    elif db.DB_BACKEND == 'sqlite':
+        order = 'ORDER BY city_fts.rank'
+    else:
+        order = f"ORDER BY ts_rank(search,to_tsquery('simple',%s)) DESC, similarity({NAME_COLUMN},%s) DESC"
+        params = params + params[:2]
+    sql = f'''SELECT city."cityId",city.{NAME_COLUMN},city.continent,city.country,city.image
+              FROM {source} {where} {order} LIMIT %s OFFSET %s'''
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql,(*params,clamp_per_page(limit),max(0,offset)))
+            return _to_dict(cursor.fetchall())
+
+def facet_counts(q:str,continent:str|None=None,country:str|None=None)->dict[str,list[tuple[str,int]]]:
+    '''
+    在資料庫內計算搜尋結果依洲名與國家的筆數
+    return:
+        {'continent':[(洲名,筆數),...],'country':[(國家,筆數),...],'total':[('',總筆數)]}
+    '''
+    ensure_search_index()
+    source,where,params = _where(q,continent,country)
+    sql = f'''SELECT 'continent',city.continent,COUNT(*) FROM {source} {where} GROUP BY city.continent
+              UNION ALL
+              SELECT 'country',city.country,COUNT(*) FROM {source} {where} GROUP BY city.country'''
+    facets = {'continent':[],'country':[]}
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql,(*params,*params))
+            for facet,value,count in cursor.fetchall():
+                facets[facet].append((value,count))
+    for values in facets.values():
+        values.sort(key=lambda item:(-item[1],item[0]))
+    facets['total'] = [('',sum(count for _,count in facets['continent']))]
+    return facets
+
+if __name__ == '__main__':
+    #部署時執行,建立或更新搜尋索引
+    create_search_index()
+    print('搜尋索引已建立')
@@ -0,0 +1,22 @@
+import os
+import shutil
+import sys
+import pytest
+
+LESSON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,LESSON_DIR)
+
+import db
+
+@pytest.fixture
+def city_db(tmp_path,monkeypatch):
+    '''
+    使用citys.db的複本,測試不會修改專案內的資料庫
+    '''
+    path = tmp_path / 'citys.db'
+    shutil.copy(os.path.join(LESSON_DIR,'citys.db'),path)
+    monkeypatch.setattr(db,'DB_BACKEND','sqlite')
+    monkeypatch.setattr(db,'SQLITE_PATH',str(path))
+    db.close_pool()
+    yield path
+    db.close_pool()
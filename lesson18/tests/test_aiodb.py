@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+import aiodb
+import metrics
+from test_metrics import make_middleware
+
+#大約需要一秒的查詢,讓請求在查詢中被取消
+SLOW_SQL = '''WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 5000000)
+              SELECT COUNT(*) FROM n'''
+
+def test_cancelled_fetch_releases_connection(city_db):
+    async def run():
+        pool = await aiodb.AsyncPool(minconn=0,maxconn=1,timeout=0.5).open()
+        opened = []
+        connect = pool._connect_sqlite
+        async def track():
+            conn = await connect()
+            opened.append(conn)
+            return conn
+        pool._connect_sqlite = track
+        task = asyncio.create_task(pool.fetch(SLOW_SQL))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        #被取消的連線已關閉,沒有放回_idle,唯一的名額也還回來了
+        assert opened[0]._connection is None
+        assert pool._idle.empty()
+        assert (await pool.fetchone('SELECT COUNT(*) FROM city'))[0] > 0
+        await pool.close()
+    asyncio.run(run())
+
+def test_asgi_routes_are_recorded(tmp_path):
+    middleware = make_middleware(tmp_path)
+    async def page(scope,receive,send):
+        await send({'type':'http.response.start','status':200,'headers':[]})
+        await send({'type':'http.response.body','body':b'ok'})
+    app = metrics.AsgiMetricsMiddleware(page,middleware,('/city/1',))
+    async def send(message):
+        pass
+    asyncio.run(app({'type':'http','path':'/city/1','method':'GET'},None,send))
+    assert middleware.latency[('city','200')].count == 1
+    assert middleware.in_flight['city'] == 0
@@ -0,0 +1,29 @@
+from flask import Flask
+import api
+import datasource
+import db
+
+def make_app():
+    app = Flask(__name__)
+    db.init_app(app)
+    app.register_blueprint(api.bp)
+    return app
+
+def test_iter_cities_returns_connection_when_closed(city_db):
+    rows = datasource.iter_cities()
+    next(rows)
+    assert db.get_pool().metrics()['in_use'] == 1
+    rows.close()
+    assert db.get_pool().metrics()['in_use'] == 0
+
+def test_aborted_ndjson_stream_returns_connection(city_db,monkeypatch):
+    pool = db.ConnectionPool(db._connect_sqlite,minconn=0,maxconn=3,timeout=0.1)
+    monkeypatch.setattr(db,'_pool',pool)
+    client = make_app().test_client()
+    for _ in range(pool.maxconn + 1):
+        response = client.get('/api/cities.ndjson',buffered=False)
+        assert next(response.response).startswith(b'{')
+        #模擬用戶端中斷
+        response.close()
+        assert pool.metrics()['in_use'] == 0
+    assert client.get('/healthz').status_code == 200
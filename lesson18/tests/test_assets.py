@@ -0,0 +1,13 @@
+import assets
+
+def test_build_compresses_only_missing_files(tmp_path,monkeypatch):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'css' / 'index.css').write_text('body{color:red}' * 100)
+    calls = []
+    compress = assets._compress
+    monkeypatch.setattr(assets,'_compress',lambda data,encoding:calls.append(encoding) or compress(data,encoding))
+    manifest = assets.build(str(static),str(tmp_path / 'cache'))
+    assert sorted(calls) == sorted(assets.ENCODINGS)
+    assert assets.build(str(static),str(tmp_path / 'cache')) == manifest
+    assert len(calls) == len(assets.ENCODINGS)
@@ -0,0 +1,34 @@
+import threading
+import time
+import cache
+
+def test_version_change_fires_once(tmp_path,monkeypatch):
+    monkeypatch.setattr(cache,'VERSION_CHECK_INTERVAL',0)
+    response_cache = cache.ResponseCache(generation_dir=str(tmp_path))
+    version = [1]
+    changes = []
+    def slow_version():
+        time.sleep(0.01)
+        return version[0]
+    def on_change():
+        changes.append(1)
+        time.sleep(0.05)
+    response_cache.watch('city',slow_version,on_change=on_change)
+    response_cache.get('/',('city',))
+    response_cache.set('/',b'old',tags=('city',))
+    version[0] = 2
+    threads = [threading.Thread(target=response_cache.get,args=('/',('city',))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert changes == [1]
+    assert response_cache.get('/',('city',)) is None
+
+def test_bump_invalidates_other_process(tmp_path,monkeypatch):
+    monkeypatch.setattr(cache,'VERSION_CHECK_INTERVAL',0)
+    worker = cache.ResponseCache(generation_dir=str(tmp_path))
+    worker.get('/',('city',))
+    worker.set('/',b'page',tags=('city',))
+    cache.ResponseCache(generation_dir=str(tmp_path)).bump('city')
+    assert worker.get('/',('city',)) is None
@@ -0,0 +1,46 @@
+import io
+import json
+import time
+import pandas as pd
+import figure_cache
+import gapminder
+
+OUTPUT = '..country-store.data..'
+
+def callback_environ(country:str)->dict:
+    body = json.dumps({'output':OUTPUT,
+                       'inputs':[{'id':'dropdown-selection','property':'value','value':country}]}).encode()
+    return {'PATH_INFO':figure_cache.DASH_CALLBACK_PATH,'REQUEST_METHOD':'POST',
+            'CONTENT_LENGTH':str(len(body)),'wsgi.input':io.BytesIO(body)}
+
+def test_cache_follows_dataset_version(tmp_path):
+    calls = []
+    def dash(environ,start_response):
+        calls.append(environ['PATH_INFO'])
+        start_response('200 OK',[('Content-Type','application/json')])
+        return [f'{{"version":"{version[0]}"}}'.encode()]
+    version = ['v1']
+    store = figure_cache.FigureStore(str(tmp_path / 'figures.db'))
+    middleware = figure_cache.CallbackCacheMiddleware(dash,{OUTPUT},lambda:version[0],store)
+    request = lambda:b''.join(middleware(callback_environ('Taiwan'),lambda status,headers:None))
+    assert request() == request() == b'{"version":"v1"}'
+    assert len(calls) == 1
+    version[0] = 'v2'
+    assert request() == b'{"version":"v2"}'
+    assert len(calls) == 2
+
+def frame(pop:int)->pd.DataFrame:
+    return gapminder.convert(pd.DataFrame({'country':['Taiwan'],'continent':['Asia'],'year':[2007],
+                                           'pop':[pop],'lifeExp':[78.4],'gdpPercap':[28718.3]}))
+
+def test_current_version_notices_updated_file(tmp_path):
+    dataset = gapminder.Dataset(str(tmp_path / 'gapminder.parquet'))
+    dataset._write(frame(1))
+    first = dataset.current_version()
+    #其它process更新了快取檔案,這個worker只呼叫current_version(快取命中,沒有執行callback)
+    time.sleep(0.01)
+    dataset._write(frame(2))
+    dataset._checked = float('-inf')
+    dataset.current_version()
+    dataset._refreshing.join()
+    assert dataset.current_version() == gapminder.frame_version(frame(2)) != first
@@ -0,0 +1,20 @@
+import pandas as pd
+import gapminder
+
+RAW = pd.DataFrame({'country':['Taiwan','Taiwan'],'continent':['Asia','Asia'],'year':[2002,2007],
+                    'pop':[22454239,23174294],'lifeExp':[77.045,78.4],'gdpPercap':[2950.1234,28718.27684]})
+
+def test_values_keep_source_precision():
+    records = gapminder.to_records(gapminder.convert(RAW))
+    assert [record['gdpPercap'] for record in records] == [2950.1234,28718.27684]
+    assert [record['lifeExp'] for record in records] == [77.045,78.4]
+    index = gapminder.CountryIndex(gapminder.convert(RAW))
+    assert index.columns['gdpPercap'].tolist() == [2950.1234,28718.27684]
+
+def test_float32_cache_is_downloaded_again(tmp_path,monkeypatch):
+    path = tmp_path / 'gapminder.parquet'
+    gapminder.convert(RAW).astype({'gdpPercap':'float32'}).to_parquet(path,index=False)
+    dataset = gapminder.Dataset(str(path))
+    monkeypatch.setattr(dataset,'_download',lambda:gapminder.convert(RAW))
+    assert dataset.load()['gdpPercap'].tolist() == [2950.1234,28718.27684]
+    assert str(pd.read_parquet(path)['gdpPercap'].dtype) == 'float64'
@@ -0,0 +1,79 @@
+import io
+import json
+import os
+from flask import Flask
+import db
+import metrics
+
+def make_middleware(tmp_path):
+    app = Flask(__name__)
+
+    @app.route('/city/<int:city_id>')
+    def city(city_id):
+        return 'ok'
+
+    def wsgi(environ,start_response):
+        environ['wsgi.input'].read()
+        start_response('200 OK',[('Content-Type','text/plain')])
+        return [b'ok']
+
+    middleware = metrics.MetricsMiddleware(wsgi,app,dash_outputs=('country-table',))
+    middleware.directory = str(tmp_path)
+    return middleware
+
+def callback_environ(output:str,length:int|None=None)->dict:
+    body = json.dumps({'output':output}).encode()
+    return {'PATH_INFO':metrics.DASH_CALLBACK_PATH,'REQUEST_METHOD':'POST',
+            'CONTENT_LENGTH':str(len(body) if length is None else length),'wsgi.input':io.BytesIO(body)}
+
+def test_route_labels_are_bounded(tmp_path):
+    middleware = make_middleware(tmp_path)
+    route_of = lambda path:middleware.route_of({'PATH_INFO':path,'REQUEST_METHOD':'GET'})
+    assert route_of('/city/1') == route_of('/city/2') == 'city'
+    assert route_of('/no/such/page') == 'not_found'
+    assert route_of('/dash/') == 'dash:index'
+    assert route_of('/dash/_dash-layout') == 'dash:_dash-layout'
+    assert route_of('/dash/random-1') == route_of('/dash/random-2') == 'dash:other'
+
+def test_callback_route_uses_whitelist(tmp_path):
+    middleware = make_middleware(tmp_path)
+    environ = callback_environ('..country-table.data...country-table.page_count..')
+    assert middleware.route_of(environ) == 'dash:country-table'
+    #讀出的內容要放回去給Dash使用
+    assert json.loads(environ['wsgi.input'].read())['output'].startswith('..country-table')
+    assert middleware.route_of(callback_environ('unknown-graph.figure')) == 'dash:callback'
+    big = callback_environ('country-table.data',length=metrics.MAX_CALLBACK_BODY + 1)
+    assert middleware.route_of(big) == 'dash:callback'
+    assert big['wsgi.input'].tell() == 0
+
+def test_render_without_pool(tmp_path,monkeypatch):
+    def broken_pool():
+        raise RuntimeError('database is down')
+    monkeypatch.setattr(db,'get_pool',broken_pool)
+    middleware = make_middleware(tmp_path)
+    response = middleware({'PATH_INFO':'/city/1','REQUEST_METHOD':'GET','wsgi.input':io.BytesIO()},
+                          lambda *args:None)
+    list(response)
+    response.close()
+    text = middleware.render()
+    assert 'http_request_duration_seconds_count{route="city",status="200"} 1' in text
+    assert f'db_pool_up{{pid="{os.getpid()}"}} 0' in text
+
+def test_retire_store_merges_dead_worker(tmp_path):
+    worker = {'pid':999999,'latency':[['city','200',[1] + [0] * len(metrics.BUCKETS),0.001,1]],
+              'db_seconds':{'city':0.5},'in_flight':{'city':1}}
+    for _ in range(2):
+        (tmp_path / '999999-1.json').write_text(json.dumps(worker))
+        metrics.retire_store(999999,str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == [metrics.RETIRED_FILE]
+    latency,db_seconds,in_flight = make_middleware(tmp_path).collect()
+    assert latency[('city','200')].count == 2
+    assert db_seconds['city'] == 1.0
+    assert in_flight['city'] == 0
+
+def test_collect_skips_dead_worker_files(tmp_path):
+    worker = {'pid':999999,'latency':[['city','200',[1] + [0] * len(metrics.BUCKETS),0.001,1]],
+              'db_seconds':{},'in_flight':{}}
+    (tmp_path / '999999-1.json').write_text(json.dumps(worker))
+    latency,_,_ = make_middleware(tmp_path).collect()
+    assert ('city','200') not in latency
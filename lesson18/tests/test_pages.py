@@ -0,0 +1,24 @@
+import pytest
+from flask import Flask, render_template
+from conftest import LESSON_DIR
+
+def make_app()->Flask:
+    '''
+    只載入樣板,不必載入lesson18.py(需要下載gapminder資料)
+    '''
+    app = Flask(__name__,root_path=LESSON_DIR)
+    for endpoint in ('index','faqs','search','product','pricing'):
+        app.add_url_rule(f'/{endpoint}',endpoint,lambda:'')
+    app.jinja_env.globals['asset_url'] = lambda filename:f'/static/{filename}'
+    return app
+
+@pytest.mark.parametrize('endpoint',['product','pricing'])
+def test_pagination_keeps_per_page(endpoint):
+    app = make_app()
+    with app.test_request_context(f'/{endpoint}?page=2&per_page=5'):
+        html = render_template(f'{endpoint}.j2',items_on_page=[],total_pages=3,page=2)
+    assert f'/{endpoint}?page=1&per_page=5' in html
+    assert f'/{endpoint}?page=3&per_page=5' in html
+    with app.test_request_context(f'/{endpoint}?page=2'):
+        html = render_template(f'{endpoint}.j2',items_on_page=[],total_pages=3,page=2)
+    assert f'/{endpoint}?page=3"' in html
@@ -0,0 +1,18 @@
+import pytest
+import search
+
+@pytest.fixture
+def no_index(monkeypatch):
+    monkeypatch.setattr(search,'_index_ready',False)
+
+def test_missing_index_is_not_created_on_request(city_db,no_index):
+    before = city_db.read_bytes()
+    with pytest.raises(search.SearchIndexMissing):
+        search.search_cities('tai')
+    assert city_db.read_bytes() == before
+
+def test_search_after_create_index(city_db,no_index):
+    search.create_search_index()
+    results = search.search_cities('kao')
+    assert any(item['city_name'].lower().startswith('kao') for item in results)
+    assert search.facet_counts('kao')['total'][0][1] >= len(results)
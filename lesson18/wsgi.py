@@ -0,0 +1,13 @@
+'''
+正式環境的進入點,使用gunicorn啟動:
+    gunicorn -c gunicorn.conf.py wsgi:application
+需要在.env設定SECRET_KEY,所有worker才會使用同一個金鑰
+'''
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+if not os.environ.get('SECRET_KEY'):
+    raise RuntimeError('正式環境請在.env設定SECRET_KEY')
+
+from lesson18 import application
@@ -1,41 +1,25 @@
-import requests
-def get_sitename()->list[str]:
-    url='https://data.moenv.gov.tw/api/v2/aqx_p_488?api_key=e8dd42e6-9b8b-43f8-991e-b3dee723a52d&limit=1000&sort=datacreationdate%20desc&format=JSON'
-    try:
-        respone=requests.get(url)
-        respone.raise_for_status()
-        data=respone.json()
-        type(respone)
-    except Exception as e:
-        print(e)
-    else:
-        sitenames=set()
-        for items in (data['records']):
-            sitenames.add(items['sitename'])
-
-    # len(sitenames)
-    sitenames=list(sitenames)
-    return sitenames
+'''
+空氣品質資料來源
+實作都在上層資料夾的aqi套件,這裡只設定這一課的資料庫位置
+'''
+import os
+import sys
+LESSON_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(LESSON_DIR))
+import aqi
+from aqi import download_data
 
-# a=get_sitename()
-# print(a)
+aqi.configure(db_path=os.environ.get('AQI_DB_PATH',os.path.join(LESSON_DIR,'AQI.db')))
 
+def get_sitename()->list[str]:
+    '''
+    先下載最新的資料,再傳出所有的站點名稱
+    '''
+    download_data()
+    return aqi.get_sitename()
 
-def get_selected_data(sitename:str)->list[str]:
-    url='https://data.moenv.gov.tw/api/v2/aqx_p_432?api_key=e8dd42e6-9b8b-43f8-991e-b3dee723a52d&limit=1000&sort=ImportDate%20desc&format=JSON'
-    try:
-        respone=requests.get(url)
-        respone.raise_for_status()
-        data=respone.json()
-        type(respone)
-    except Exception as e:
-        print(e)
-    else:
-        outerlist=[sitename]
-        for items in (data['records']):
-            if items['sitename']==sitename:
-                innerlist=[items['publishtime'],items['county'],items['aqi'],items['pm2.5'],items ['status'],items['latitude'],items['longitude']]
-                outerlist.append(innerlist)
-            
-    return outerlist
-
+def get_selected_data(sitename:str)->list[list]:
+    '''
+    這一課的表格沒有站點欄位
+    '''
+    return aqi.get_selected_data(sitename,columns=('date','county','aqi','pm25','status','lat','lon'))
@@ -0,0 +1 @@
+from .query import FILTER_OPERATORS, COMPARE, split_filter_part, value_text, apply_filter
@@ -0,0 +1,67 @@
+'''
+dash_table的filter_query(filter_action='custom')在伺服器端的實作
+lesson18的gapminder與寵物登記共用,兩邊的篩選行為相同
+'''
+import operator
+import pandas as pd
+
+#dash_table的filter_query運算子,長的要放前面(例如>=要在>之前比對)
+FILTER_OPERATORS = [('ge ','>='),('le ','<='),('lt ','<'),('gt ','>'),('ne ','!='),('eq ','='),
+                    ('contains ',),('datestartswith ',)]
+COMPARE = {'ge':operator.ge,'le':operator.le,'lt':operator.lt,'gt':operator.gt,'ne':operator.ne,'eq':operator.eq}
+
+def split_filter_part(part:str)->tuple[str,str,object]|None:
+    '''
+    將 "{year} >= 2000" 拆成 ('year','ge',2000.0)
+    無法解析時傳回None
+    '''
+    for operators in FILTER_OPERATORS:
+        for symbol in operators:
+            if symbol not in part:
+                continue
+            name_part,value_part = part.split(symbol,1)
+            name = name_part[name_part.find('{') + 1:name_part.rfind('}')]
+            value_part = value_part.strip()
+            if not value_part:
+                return None
+            quote = value_part[0]
+            if quote == value_part[-1] and quote in ('"',"'",'`') and len(value_part) > 1:
+                value = value_part[1:-1].replace('\\' + quote,quote)
+            else:
+                try:
+                    value = float(value_part)
+                except ValueError:
+                    value = value_part
+            return name,operators[0].strip(),value
+    return None
+
+def value_text(value)->str:
+    '''
+    filter輸入的數字會被轉成float,和文字欄位比較時轉回原本的寫法(2015.0 -> '2015')
+    '''
+    if isinstance(value,float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def apply_filter(frame:pd.DataFrame,filter_query:str)->pd.DataFrame:
+    '''
+    依照dash_table的filter_query篩選,無法解析或不存在的欄位略過
+    parameter:
+        filter_query:例如 "{year} >= 2000 && {pop} > 1000000"
+    '''
+    for part in (filter_query or '').split(' && '):
+        parsed = split_filter_part(part)
+        if parsed is None or parsed[0] not in frame:
+            continue
+        name,op,value = parsed
+        column = frame[name]
+        if op in COMPARE:
+            if isinstance(value,float) and column.dtype.kind not in 'iuf':
+                value = value_text(value)
+            mask = COMPARE[op](column.astype(str) if isinstance(value,str) else column,value)
+        elif op == 'contains':
+            mask = column.astype(str).str.contains(value_text(value),case=False,regex=False)
+        else:
+            mask = column.astype(str).str.startswith(value_text(value))
+        frame = frame[mask]
+    return frame
@@ -0,0 +1,29 @@
+import sqlite3
+from aqi import maintenance
+from aqi.db import ensure_schema
+
+def make_db(path):
+    conn = sqlite3.connect(path)
+    ensure_schema(conn)
+    conn.executemany('INSERT INTO records(sitename,county,aqi,date) VALUES(?,?,?,?)',
+                     [('中山','臺北市',50,'2024/11/12 09:00:00'),
+                      ('中山','臺北市',60,'2024-11-12 10:00'),
+                      ('中山','臺北市',70,None)])
+    conn.commit()
+    conn.close()
+
+def test_migration_handles_null_and_runs_once(tmp_path):
+    path = str(tmp_path / 'AQI.db')
+    make_db(path)
+    report = maintenance.run_maintenance(path,retention={'hourly':None})
+    assert report['migrated'] == 1
+    conn = sqlite3.connect(path)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == maintenance.SCHEMA_VERSION
+    assert [row[0] for row in conn.execute('SELECT date FROM records ORDER BY id')] == \
+           ['2024-11-12 09:00','2024-11-12 10:00',None]
+    assert conn.execute('SELECT samples FROM daily_records WHERE day = ?',('2024-11-12',)).fetchone()[0] == 2
+    #之後的維護不再掃描轉換
+    conn.execute("INSERT INTO records(sitename,date) VALUES('中山','2024/11/13 09:00:00')")
+    conn.commit()
+    conn.close()
+    assert maintenance.run_maintenance(path,retention={'hourly':None})['migrated'] == 0
@@ -0,0 +1,20 @@
+import pandas as pd
+from table_filter import apply_filter, split_filter_part
+
+FRAME = pd.DataFrame({'country':['Taiwan','Japan','Chad'],
+                      'year':[2007,2007,1952],
+                      'code':['2007','0886','1952']})
+
+def test_split_filter_part():
+    assert split_filter_part('{year} >= 2000') == ('year','ge',2000.0)
+    assert split_filter_part('{country} contains "Tai"') == ('country','contains','Tai')
+    assert split_filter_part('{country} eq') is None
+    assert split_filter_part('year') is None
+
+def test_apply_filter():
+    assert apply_filter(FRAME,'{year} >= 2000 && {country} contains "tai"').country.tolist() == ['Taiwan']
+    #數字和文字欄位比較時使用原本的寫法
+    assert apply_filter(FRAME,'{code} = 2007').country.tolist() == ['Taiwan']
+    assert apply_filter(FRAME,'{code} datestartswith 19').country.tolist() == ['Chad']
+    #不存在的欄位或無法解析的條件略過
+    assert len(apply_filter(FRAME,'{missing} > 1 && {year} eq')) == 3
@@ -0,0 +1,104 @@
+"""
+縣市統計資料建立方式的效能比較
+
+    python benchmark_stats.py --years 200 --repeat 5
+
+產生 22 個縣市、每月一筆、數十年以上的模擬資料,比較:
+- legacy: 每個縣市一個執行緒,各自用 df[df['County'] == county] 掃描整個資料表
+- build_county_stats: 排序一次後依照縣市切成連續的區段
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from src.data.data_source import CountyStats, build_county_stats
+
+COUNTIES = [
+    "基隆市", "臺北市", "新北市", "桃園市", "新竹市", "新竹縣",
+    "苗栗縣", "臺中市", "彰化縣", "南投縣", "雲林縣", "嘉義市",
+    "嘉義縣", "臺南市", "高雄市", "屏東縣", "臺東縣", "花蓮縣",
+    "宜蘭縣", "澎湖縣", "金門縣", "連江縣"
+]
+
+def synthetic_data(years: int, seed: int = 0) -> pd.DataFrame:
+    """
+    產生模擬資料,每個縣市每個月一筆
+
+    Args:
+        years: 資料涵蓋的年數
+        seed: 亂數種子
+
+    Returns:
+        pd.DataFrame: 與 2023-2009pet_data.csv 相同欄位的資料 (另外加上 Month)
+    """
+    rng = np.random.default_rng(seed)
+    months = years * 12
+    rows = len(COUNTIES) * months
+    registrations = rng.integers(100, 2000, rows).astype(np.int32)
+    neutered = (registrations * rng.uniform(0.2, 0.8, rows)).astype(np.int32)
+    df = pd.DataFrame({
+        'Year': np.tile(np.repeat(np.arange(2024 - years, 2024), 12), len(COUNTIES)).astype(np.int32),
+        'Month': np.tile(np.arange(1, 13), len(COUNTIES) * years).astype(np.int32),
+        'County': np.repeat(COUNTIES, months),
+        'Registrations': registrations,
+        'Deregistrations': rng.integers(0, 200, rows).astype(np.int32),
+        'Neutered': neutered,
+        'Neutering Rate': (neutered / registrations * 100).astype(np.float32)
+    })
+    # 打亂順序,和實際讀進來的資料一樣需要先排序
+    df = df.sample(frac=1, random_state=seed).reset_index(drop=True)
+    df.sort_values(['County', 'Year'], ascending=[True, False], inplace=True, kind='stable')
+    return df
+
+def legacy_county_stats(df: pd.DataFrame) -> dict:
+    """原本的作法:每個縣市一個工作,各自掃描整個資料表"""
+    def compute(county: str) -> CountyStats:
+        county_data = df[df['County'] == county]
+        return CountyStats(
+            county=county,
+            years=county_data['Year'].values,
+            registrations=county_data['Registrations'].values,
+            deregistrations=county_data['Deregistrations'].values,
+            neutered=county_data['Neutered'].values,
+            neutering_rates=county_data['Neutering Rate'].values
+        )
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(compute, county) for county in df['County'].unique()]
+        return {stats.county: stats for stats in (future.result() for future in futures)}
+
+def measure(func, df: pd.DataFrame, repeat: int) -> tuple:
+    """傳回 (最佳秒數, 結果)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description='縣市統計資料建立方式的效能比較')
+    parser.add_argument('--years', type=int, default=200, help='模擬資料的年數')
+    parser.add_argument('--repeat', type=int, default=5, help='每種方式執行的次數')
+    args = parser.parse_args()
+
+    df = synthetic_data(args.years)
+    print(f'模擬資料: {len(COUNTIES)} 個縣市 x {args.years} 年 x 12 個月 = {len(df):,} 筆')
+
+    legacy_seconds, legacy = measure(legacy_county_stats, df, args.repeat)
+    new_seconds, new = measure(build_county_stats, df, args.repeat)
+
+    # 確認兩種方式的結果相同
+    assert legacy.keys() == new.keys()
+    for county, stats in legacy.items():
+        for name in ('years', 'registrations', 'deregistrations', 'neutered', 'neutering_rates'):
+            assert np.array_equal(getattr(stats, name), getattr(new[county], name)), (county, name)
+
+    print(f'legacy (執行緒池 + 逐縣市掃描): {legacy_seconds * 1000:10.2f} ms')
+    print(f'build_county_stats (一次切段):  {new_seconds * 1000:10.2f} ms')
+    print(f'加速 {legacy_seconds / new_seconds:.1f} 倍')
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ from tkinter import ttk
 from ttkthemes import ThemedTk
 from src.ui.analysis_view import AnalysisView
 from src.data.data_source import PetDataManager
+from src.data.file_watcher import DataWatcher
 
 class MainWindow(ThemedTk):
     """主視窗類別,負責初始化程式介面與資料管理"""
@@ -22,12 +23,19 @@ class MainWindow(ThemedTk):
         self.view = AnalysisView(self, self.data_manager)
         self.view.pack(fill='both', expand=True)
         
+        # 在背景監看資料檔案,改變時重新讀取並通知分析視圖
+        self.watcher = DataWatcher(self.data_manager, self.view.notify_data_reloaded)
+        self.watcher.start()
+        
         # 註冊視窗關閉事件處理程序
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
         
     def on_closing(self):
         """處理視窗關閉事件,確保資源正確釋放"""
         try:
+            # 停止監看資料檔案
+            self.watcher.stop()
+            
             # 先停止所有更新
             if hasattr(self.view.map_renderer.map_widget, "after_id"):
                 self.after_cancel(self.view.map_renderer.map_widget.after_id)
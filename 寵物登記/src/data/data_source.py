@@ -1,10 +1,36 @@
+import math
+import os
+import sys
 import pandas as pd
 import numpy as np
-from typing import List, Tuple, Dict, Optional
-from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor
-from functools import lru_cache
+from typing import List, Tuple, Dict, Optional, Union
+from dataclasses import dataclass, field, replace
 import threading
+# filter_query 的實作在專案最上層的 table_filter 套件,和 lesson18 的 gapminder 共用
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+from table_filter import apply_filter
+from .storage import RATE_BASE, SUM_COLUMNS, StorageBackend, open_backend, sum_by_county_year
+
+# 表格欄位與 CountyStats 屬性的對應
+TABLE_COLUMNS = {
+    'Year': 'years',
+    'County': 'county',
+    'Registrations': 'registrations',
+    'Deregistrations': 'deregistrations',
+    'Neutered': 'neutered',
+    'Neutering Rate': 'neutering_rates',
+}
+
+# 全臺與各區域包含的縣市,合計由縣市資料計算
+NATIONAL = "全臺"
+REGIONS = {
+    "北部": ("基隆市", "臺北市", "新北市", "桃園市", "新竹市", "新竹縣", "宜蘭縣"),
+    "中部": ("苗栗縣", "臺中市", "彰化縣", "南投縣", "雲林縣"),
+    "南部": ("嘉義市", "嘉義縣", "臺南市", "高雄市", "屏東縣"),
+    "東部": ("花蓮縣", "臺東縣"),
+    "離島": ("澎湖縣", "金門縣", "連江縣")
+}
+ROLLUPS = [NATIONAL, *REGIONS]
 
 @dataclass
 class CountyStats:
@@ -30,19 +56,210 @@ class CountyStats:
             )
         ]
 
+@dataclass(frozen=True)
+class DataSnapshot:
+    """
+    某一個版本的完整資料,建立後除了 stats 與 records 的快取之外不再修改
+    
+    reload() 建立新的 snapshot 後一次替換,讀取端只會看到舊版本或新版本,
+    不會看到清除一半或混合兩個版本的資料。
+    資料來源是 lazy 時 df 為 None,stats 在第一次使用縣市時才加入。
+    替換後的 stats 與 records 只能在 PetDataManager 的鎖內加入或讀取整個 dict
+    (例如迭代或複製),否則其它執行緒加入快取時會發生
+    "dictionary changed size during iteration"
+    """
+    version: int  # 資料版本,每次 reload 加 1
+    df: Optional[pd.DataFrame]  # 依照縣市、年份排序的資料
+    stats: Dict[str, CountyStats]  # {縣市名稱: 統計資料}
+    years: List[int]  # 年份列表 (新到舊)
+    counties: frozenset  # 資料中有哪些縣市 (包含全臺與區域)
+    totals: pd.DataFrame  # 每個縣市每年的合計,用來更新全臺與區域的合計
+    rollups: Dict[str, CountyStats] = field(default_factory=dict)  # 由縣市資料計算的全臺與區域合計
+    records: Dict[str, List[Tuple]] = field(default_factory=dict)  # get_county_data 的快取
+    changed: frozenset = frozenset()  # 和上一個版本比較,資料有變動的縣市
+
+STATS_FIELDS = ('years', 'registrations', 'deregistrations', 'neutered', 'neutering_rates')
+
+def merge_county_stats(old: Dict[str, CountyStats],
+                       new: Dict[str, CountyStats]) -> Tuple[Dict[str, CountyStats], frozenset]:
+    """
+    比較新舊統計資料,沒有變動的縣市沿用舊的物件
+    
+    只比較兩邊都有統計資料的縣市;lazy 的資料來源只有載入過的縣市才有統計資料,
+    只出現在一邊不代表資料有變動,新增與刪除的縣市由呼叫端比較縣市清單
+    
+    Args:
+        old: 上一個版本的統計資料
+        new: 重新讀取的統計資料
+        
+    Returns:
+        Tuple[Dict[str, CountyStats], frozenset]: (合併後的統計資料, 兩邊都有且資料有變動的縣市)
+    """
+    merged = {}
+    changed = set()
+    for county, stats in new.items():
+        previous = old.get(county)
+        if previous is None:
+            merged[county] = stats
+        elif all(np.array_equal(getattr(previous, name), getattr(stats, name)) for name in STATS_FIELDS):
+            merged[county] = previous
+        else:
+            merged[county] = stats
+            changed.add(county)
+    return merged, frozenset(changed)
+
+def build_rollups(totals: pd.DataFrame) -> Dict[str, CountyStats]:
+    """
+    建立全臺與各區域的合計
+    
+    登記數、註銷數、絕育數直接相加。絕育率的分母不是登記數,
+    所以由各縣市的絕育數與絕育率推算分母,以絕育數合計 / 分母合計計算,
+    和縣市的絕育率基準相同。資料中原有的全臺或區域資料不會重複加總
+    
+    Args:
+        totals: 每個縣市每年的合計 (sum_by_county_year 的格式)
+        
+    Returns:
+        Dict[str, CountyStats]: {全臺或區域名稱: 統計資料},年份由新到舊
+    """
+    totals = totals[~totals['County'].isin(ROLLUPS)]
+    if totals.empty:
+        return {}
+    years, year_index = np.unique(totals['Year'].to_numpy(), return_inverse=True)
+    
+    # 每一列加到 (全臺, 年份),屬於某個區域的列再加到 (區域, 年份)
+    region_index = {county: i + 1 for i, counties in enumerate(REGIONS.values()) for county in counties}
+    region = totals['County'].map(region_index).fillna(0).to_numpy(np.int64)
+    in_region = np.flatnonzero(region)
+    rows = np.concatenate((np.arange(len(totals)), in_region))
+    groups = np.concatenate((year_index, region[in_region] * len(years) + year_index[in_region]))
+    shape = (len(ROLLUPS), len(years))
+    present = np.bincount(groups, minlength=shape[0] * shape[1]).reshape(shape) > 0
+    sums = {
+        column: np.bincount(groups, weights=totals[column].to_numpy(np.float64)[rows],
+                            minlength=shape[0] * shape[1]).reshape(shape).astype(np.int64)
+        for column in SUM_COLUMNS
+    }
+    base = np.bincount(groups, weights=totals[RATE_BASE].to_numpy(np.float64)[rows],
+                       minlength=shape[0] * shape[1]).reshape(shape)
+    
+    rollups = {}
+    for i, name in enumerate(ROLLUPS):
+        # 只保留有資料的年份,由新到舊
+        index = np.flatnonzero(present[i])[::-1]
+        if len(index) == 0:
+            continue
+        neutered = sums['Neutered'][i, index]
+        rate_base = base[i, index]
+        rates = np.divide(neutered * 100.0, rate_base,
+                          out=np.zeros(len(index)), where=rate_base > 0)
+        rollups[name] = CountyStats(
+            county=name,
+            years=years[index],
+            registrations=sums['Registrations'][i, index],
+            deregistrations=sums['Deregistrations'][i, index],
+            neutered=neutered,
+            neutering_rates=rates.round(2).astype(np.float32)
+        )
+    return rollups
+
+def update_rollups(old: Dict[str, CountyStats], old_totals: Optional[pd.DataFrame],
+                   totals: pd.DataFrame) -> Dict[str, CountyStats]:
+    """
+    更新全臺與各區域的合計,只重新計算縣市資料有變動的年份
+    
+    新增年份時只計算新的年份,其他年份沿用原本的合計;
+    沒有任何變動時直接傳回原本的物件
+    
+    Args:
+        old: 原本的合計
+        old_totals: 原本每個縣市每年的合計,None 代表全部重新計算
+        totals: 新的每個縣市每年的合計
+        
+    Returns:
+        Dict[str, CountyStats]: 更新後的合計
+    """
+    if old_totals is None:
+        return build_rollups(totals)
+    # 只出現在其中一邊的列就是有變動的 (縣市, 年份)
+    diff = pd.concat([old_totals, totals]).drop_duplicates(keep=False)
+    changed_years = np.unique(diff['Year'].to_numpy())
+    if len(changed_years) == 0:
+        return old
+    
+    part = build_rollups(totals[totals['Year'].isin(changed_years)])
+    rollups = {}
+    for name in ROLLUPS:
+        pieces = []
+        if name in old:
+            stats = old[name]
+            keep = ~np.isin(stats.years, changed_years)
+            pieces.append({field_name: getattr(stats, field_name)[keep] for field_name in STATS_FIELDS})
+        if name in part:
+            stats = part[name]
+            pieces.append({field_name: getattr(stats, field_name) for field_name in STATS_FIELDS})
+        if not pieces:
+            continue
+        columns = {
+            field_name: np.concatenate([piece[field_name] for piece in pieces])
+            for field_name in STATS_FIELDS
+        }
+        if len(columns['years']) == 0:
+            continue
+        order = np.argsort(-columns['years'].astype(np.int64), kind='stable')
+        rollups[name] = CountyStats(county=name, **{key: values[order] for key, values in columns.items()})
+    return rollups
+
+def build_county_stats(df: pd.DataFrame) -> Dict[str, CountyStats]:
+    """
+    建立所有縣市的統計資料,只掃描資料一次
+    
+    資料必須已經依照 County 排序,每個縣市是連續的一段,
+    找出縣市改變的位置後,每個縣市的陣列都是同一個欄位陣列的切片 (不複製資料)
+    
+    Args:
+        df: 依照 County 排序的資料
+        
+    Returns:
+        Dict[str, CountyStats]: {縣市名稱: 統計資料}
+    """
+    counties = df['County'].to_numpy()
+    if len(counties) == 0:
+        return {}
+    columns = {
+        'years': df['Year'].to_numpy(),
+        'registrations': df['Registrations'].to_numpy(),
+        'deregistrations': df['Deregistrations'].to_numpy(),
+        'neutered': df['Neutered'].to_numpy(),
+        'neutering_rates': df['Neutering Rate'].to_numpy()
+    }
+    
+    # 縣市改變的位置就是每一段的開始
+    changes = np.flatnonzero(counties[1:] != counties[:-1]) + 1
+    starts = np.concatenate(([0], changes))
+    stops = np.concatenate((changes, [len(counties)]))
+    
+    return {
+        counties[start]: CountyStats(
+            county=counties[start],
+            **{name: values[start:stop] for name, values in columns.items()}
+        )
+        for start, stop in zip(starts, stops)
+    }
+
 class PetDataManager:
     """寵物資料管理類別,負責資料的快取與高效能處理"""
     
-    def __init__(self, csv_file: str = '2023-2009pet_data.csv'):
+    def __init__(self, source: Union[str, StorageBackend, None] = None):
         """
         初始化資料管理器
         
         Args:
-            csv_file: CSV 資料檔案路徑
+            source: 資料來源或資料檔案路徑 (CSV 或 SQLite),None 時依照環境變數設定 (見 open_backend)
         """
-        # 定義縣市順序，將全臺加入第一位
+        # 定義縣市順序，將全臺與各區域加入最前面
         self._county_order = [
-            "全臺",  # 加入全臺作為第一個選項
+            *ROLLUPS,  # 全臺作為第一個選項,接著是各區域
             "基隆市", "臺北市", "新北市", "桃園市", "新竹市", "新竹縣", 
             "苗栗縣", "臺中市", "彰化縣", "南投縣", "雲林縣", "嘉義市",
             "嘉義縣", "臺南市", "高雄市", "屏東縣", "臺東縣", "花蓮縣",
@@ -50,66 +267,135 @@ class PetDataManager:
         ]
         
         # 初始化執行緒相關物件
-        self._lock = threading.Lock()  # 執行緒鎖
-        self._stats_cache = {}  # 統計資料快取
-        self._executor = ThreadPoolExecutor(max_workers=4)  # 執行緒池
+        self._lock = threading.Lock()  # 執行緒鎖,reload 替換資料與加入 lazy 快取時使用
+        self._backend = self._open(source)
         
         # 初始化資料
-        self._initialize_data(csv_file)
-        
-    def _initialize_data(self, csv_file: str):
-        """初始化資料,使用並行處理提升效能"""
-        # 讀取CSV檔案，並指定資料型別以優化記憶體使用
-        self.df = pd.read_csv(
-            csv_file,
-            dtype={
-                'Year': np.int32,
-                'Registrations': np.int32,
-                'Deregistrations': np.int32,
-                'Neutered': np.int32,
-                'Neutering Rate': np.float32
-            }
-        )
+        self._snapshot = self._load_snapshot(self._backend, version=1, previous=None)
         
-        # 資料預處理與排序
-        self.df.sort_values(['County', 'Year'], ascending=[True, False], inplace=True)
+    @staticmethod
+    def _open(source: Union[str, StorageBackend, None]) -> StorageBackend:
+        """將檔案路徑轉換成資料來源"""
+        return source if isinstance(source, StorageBackend) else open_backend(source)
         
-        # 使用執行緒池並行處理縣市統計資料
-        futures = []
-        for county in self.df['County'].unique():
-            futures.append(
-                self._executor.submit(self._compute_county_stats, county)
-            )
+    def _load_snapshot(self, backend: StorageBackend, version: int,
+                       previous: Optional[DataSnapshot]) -> DataSnapshot:
+        """
+        讀取資料並建立統計資料
         
-        # 等待所有計算完成並儲存結果
-        for future in futures:
-            stats = future.result()
-            self._stats_cache[stats.county] = stats
+        一次讀入的資料來源排序一次後依照縣市切成連續的區段;
+        lazy 的資料來源只讀取縣市與年份,縣市資料在 get_county_stats 時才讀取。
+        全臺與區域的合計在這裡建立,有上一個版本時只更新變動的年份。
+        資料中原本就有的全臺或區域 (官方公布的數字) 優先使用,計算的合計只補上資料中沒有的;
+        計算的絕育率分母由四捨五入到小數 2 位的縣市絕育率推算,和官方數字會有些微差異
+        (例如 2023 年全臺 50.38,官方為 50.44)
+        """
+        if backend.lazy:
+            df = None
+            counties, years = backend.read_index()
+            totals = backend.read_totals()
+            stats = {}
+        else:
+            df = backend.read_all()
+            stats = build_county_stats(df)  # 一次建立所有縣市的統計資料
+            counties = list(stats)
+            years = sorted(df['Year'].unique(), reverse=True)
+            totals = sum_by_county_year(df)
         
-        # 快取常用資料
-        self._years = sorted(self.df['Year'].unique(), reverse=True)
-        self._available_counties = set(self.df['County'].unique())
-            
-    def _compute_county_stats(self, county: str) -> CountyStats:
+        if previous is None:
+            rollups = build_rollups(totals)
+        else:
+            rollups = update_rollups(previous.rollups, previous.totals, totals)
+        # 資料中沒有的全臺或區域才使用計算出來的合計
+        for name, rollup in rollups.items():
+            if name not in counties:
+                stats[name] = rollup
+        return DataSnapshot(
+            version=version,
+            df=df,
+            stats=stats,
+            years=years,
+            counties=frozenset(counties) | frozenset(rollups),
+            totals=totals,
+            rollups=rollups
+        )
+    
+    def _read_county(self, backend: StorageBackend, county: str) -> Optional[CountyStats]:
+        """從 lazy 的資料來源讀取單一縣市的統計資料"""
+        return build_county_stats(backend.read_county(county)).get(county)
+    
+    def reload(self, source: Union[str, StorageBackend, None] = None) -> int:
         """
-        計算單一縣市的統計資料
+        重新讀取資料,完成後才替換目前的資料
+        
+        讀取與計算在鎖外進行,不會擋住讀取端;替換時持有鎖,
+        同時呼叫多次 reload 時版本號碼不會重複。
+        和目前的資料比較,沒有變動的縣市沿用原本的統計資料,
+        有變動的縣市記錄在新版本的 changed。
+        lazy 的資料來源只重新讀取已經載入過的縣市
         
         Args:
-            county: 縣市名稱
+            source: 新的資料來源或資料檔案,None 代表使用原本的資料來源
             
         Returns:
-            CountyStats: 縣市統計資料物件
-        """
-        county_data = self.df[self.df['County'] == county]
-        return CountyStats(
-            county=county,
-            years=county_data['Year'].values,
-            registrations=county_data['Registrations'].values,
-            deregistrations=county_data['Deregistrations'].values,
-            neutered=county_data['Neutered'].values,
-            neutering_rates=county_data['Neutering Rate'].values
-        )
+            int: 新的資料版本
+        """
+        backend = self._open(source) if source is not None else self._backend
+        with self._lock:
+            current = self._snapshot
+        snapshot = self._load_snapshot(backend, version=0, previous=current)
+        read = set()
+        while True:
+            with self._lock:
+                # 複製一份再比較,避免比較時其它執行緒加入快取
+                old = dict(self._snapshot.stats)
+                # 讀取期間其它執行緒可能又載入了縣市,新版本也要有這些縣市才能比較
+                missing = [county for county in old if county in snapshot.counties
+                           and county not in snapshot.stats and county not in read]
+                if not backend.lazy or not missing:
+                    stats, changed = merge_county_stats(old, snapshot.stats)
+                    # 新增或刪除的縣市
+                    changed |= snapshot.counties ^ self._snapshot.counties
+                    # 沒有變動的縣市沿用已經建立的表格資料
+                    records = {county: rows for county, rows in dict(self._snapshot.records).items()
+                               if county in stats and county not in changed}
+                    self._snapshot = replace(
+                        snapshot,
+                        version=self._snapshot.version + 1,
+                        stats=stats,
+                        records=records,
+                        changed=changed
+                    )
+                    self._backend = backend
+                    return self._snapshot.version
+            # 在鎖外讀取,讀完再重新檢查
+            for county in missing:
+                read.add(county)
+                stats = self._read_county(backend, county)
+                if stats is not None:
+                    snapshot.stats[county] = stats
+    
+    @property
+    def snapshot(self) -> DataSnapshot:
+        """目前版本的完整資料"""
+        return self._snapshot
+    
+    @property
+    def source_paths(self) -> List[str]:
+        """資料來源的檔案,檔案改變時需要 reload"""
+        return self._backend.source_paths
+    
+    @property
+    def version(self) -> int:
+        """目前的資料版本,每次 reload 加 1"""
+        return self._snapshot.version
     
+    @property
+    def df(self) -> pd.DataFrame:
+        """目前版本的資料 (lazy 的資料來源每次都會讀取整個資料表,只適合匯出等用途)"""
+        df = self._snapshot.df
+        return df if df is not None else self._backend.read_all()
+            
     @property
     def years(self) -> List[int]:
         """
@@ -118,7 +404,7 @@ class PetDataManager:
         Returns:
             List[int]: 排序後的年份列表
         """
-        return self._years
+        return self._snapshot.years
     
     @property
     def counties(self) -> List[str]:
@@ -128,12 +414,12 @@ class PetDataManager:
         Returns:
             List[str]: 依照指定順序排序的縣市列表
         """
-        return [county for county in self._county_order if county in self._available_counties]
+        counties = self._snapshot.counties
+        return [county for county in self._county_order if county in counties]
     
-    @lru_cache(maxsize=32)
     def get_county_stats(self, county: str) -> Optional[CountyStats]:
         """
-        取得縣市統計資料 (使用快取)
+        取得縣市統計資料
         
         Args:
             county: 縣市名稱
@@ -141,12 +427,19 @@ class PetDataManager:
         Returns:
             Optional[CountyStats]: 縣市統計資料物件
         """
-        return self._stats_cache.get(county)
+        snapshot = self._snapshot
+        stats = snapshot.stats.get(county)
+        if stats is None and county in snapshot.counties and self._backend.lazy:
+            # 第一次使用的縣市才從資料來源讀取 (在鎖外讀取),同時讀取時以先放入的為準
+            stats = self._read_county(self._backend, county)
+            if stats is not None:
+                with self._lock:
+                    stats = snapshot.stats.setdefault(county, stats)
+        return stats
     
-    @lru_cache(maxsize=32)
     def get_county_data(self, county: str) -> List[Tuple]:
         """
-        取得特定縣市的所有資料 (使用快取)
+        取得特定縣市的所有資料 (快取在目前版本的 snapshot,reload 後自動失效)
         
         Args:
             county: 縣市名稱
@@ -154,19 +447,60 @@ class PetDataManager:
         Returns:
             List[Tuple]: 該縣市的所有年度資料
         """
-        stats = self._stats_cache.get(county)
-        return stats.records if stats else []
+        snapshot = self._snapshot
+        records = snapshot.records.get(county)
+        if records is None:
+            stats = self.get_county_stats(county)
+            records = stats.records if stats else []
+            with self._lock:
+                records = snapshot.records.setdefault(county, records)
+        return records
+        
+    def query_table(self, county: str, page_current: int, page_size: int,
+                    sort_by: Optional[List[Dict]] = None,
+                    filter_query: str = '') -> Tuple[List[Dict], int, int]:
+        """
+        在伺服器端完成篩選、排序與分頁,只傳回目前這一頁 (dash_table 的 custom 模式)
         
+        Args:
+            county: 縣市名稱
+            page_current: 目前頁數,從 0 開始
+            page_size: 每頁筆數
+            sort_by: [{'column_id': 欄位, 'direction': 'asc' 或 'desc'}]
+            filter_query: 例如 "{Year} >= 2015 && {Neutered} > 1000"
+            
+        Returns:
+            Tuple[List[Dict], int, int]: (這一頁的資料, 總頁數, 調整後的頁數)
+        """
+        stats = self.get_county_stats(county)
+        if stats is None:
+            return [], 1, 0
+        frame = pd.DataFrame({
+            column: getattr(stats, attribute) for column, attribute in TABLE_COLUMNS.items()
+        })
+        
+        # 篩選
+        frame = apply_filter(frame, filter_query)
+        
+        # 排序
+        sort_by = [item for item in sort_by or [] if item['column_id'] in frame]
+        if sort_by:
+            frame = frame.sort_values(
+                [item['column_id'] for item in sort_by],
+                ascending=[item['direction'] == 'asc' for item in sort_by],
+                kind='stable'
+            )
+        
+        # 分頁
+        page_size = max(1, page_size)
+        page_count = max(1, math.ceil(len(frame) / page_size))
+        page_current = max(0, min(page_current or 0, page_count - 1))
+        start = page_current * page_size
+        page = frame.iloc[start:start + page_size].astype({'Neutering Rate': 'float64'})
+        page['Neutering Rate'] = page['Neutering Rate'].round(2)
+        return page.to_dict('records'), page_count, page_current
+    
     def clear_cache(self):
-        """清除所有快取資料"""
+        """清除衍生的快取資料 (統計資料本身保留,需要重新讀取資料請使用 reload)"""
         with self._lock:
-            self.get_county_data.cache_clear()
-            self.get_county_stats.cache_clear()
-            self._stats_cache.clear()
-    
-    def __del__(self):
-        """解構時清理資源"""
-        # 關閉執行緒池
-        self._executor.shutdown(wait=True)
-        # 清理快取
-        self.clear_cache()
\ No newline at end of file
+            self._snapshot.records.clear()
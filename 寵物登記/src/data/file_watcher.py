@@ -0,0 +1,86 @@
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 檢查檔案的間隔秒數
+POLL_INTERVAL = 2.0
+
+def file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """
+    取得檔案的簽章,檔案被修改或被新檔案取代 (inode 改變) 時簽章會不同
+
+    Args:
+        path: 檔案路徑
+
+    Returns:
+        Optional[Tuple[int, int, int]]: (修改時間, 大小, inode),檔案不存在時傳回 None
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+class DataWatcher(threading.Thread):
+    """
+    資料檔案監看執行緒
+
+    定期檢查 data_manager 的資料來源檔案,檔案改變且寫入完成後在這個執行緒內 reload,
+    再呼叫 on_reload 通知畫面;讀取資料不會佔用 Tk 的主迴圈
+    """
+
+    def __init__(self, data_manager, on_reload: Callable[[int, frozenset], None],
+                 interval: float = POLL_INTERVAL):
+        """
+        初始化監看執行緒
+
+        Args:
+            data_manager: 資料管理器實例
+            on_reload: reload 完成後呼叫的函式 (版本, 有變動的縣市),在監看執行緒內呼叫
+            interval: 檢查的間隔秒數
+        """
+        super().__init__(daemon=True, name='DataWatcher')
+        self.data_manager = data_manager
+        self.on_reload = on_reload
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._signatures: Dict[str, Optional[Tuple[int, int, int]]] = self._scan()
+
+    def _scan(self) -> Dict[str, Optional[Tuple[int, int, int]]]:
+        """取得所有資料來源檔案的簽章"""
+        return {path: file_signature(path) for path in self.data_manager.source_paths}
+
+    def _changed_paths(self) -> List[str]:
+        """和上次檢查比較,有改變的檔案"""
+        current = self._scan()
+        changed = [path for path, signature in current.items() if self._signatures.get(path) != signature]
+        self._signatures = current
+        return changed
+
+    def run(self):
+        """監看迴圈"""
+        while not self._stop_event.wait(self.interval):
+            if not self._changed_paths():
+                continue
+
+            # 等到檔案連續兩次檢查都沒有改變,避免讀到寫到一半的檔案
+            while not self._stop_event.wait(self.interval):
+                if not self._changed_paths():
+                    break
+            if self._stop_event.is_set():
+                return
+
+            try:
+                version = self.data_manager.reload()
+            except Exception as e:
+                print(f"重新讀取資料失敗,繼續使用目前的資料：{e}")
+                continue
+            changed = self.data_manager.snapshot.changed
+            if changed:
+                self.on_reload(version, changed)
+            # reload 可能改變資料來源,重新記錄簽章
+            self._signatures = self._scan()
+
+    def stop(self):
+        """停止監看"""
+        self._stop_event.set()
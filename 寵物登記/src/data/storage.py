@@ -0,0 +1,284 @@
+import argparse
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+import pandas as pd
+import numpy as np
+from typing import List, Optional, Tuple
+from .file_watcher import file_signature
+
+# 各欄位的資料型別,兩種資料來源讀進來的型別相同
+COLUMN_DTYPES = {
+    'Year': np.int32,
+    'Registrations': np.int32,
+    'Deregistrations': np.int32,
+    'Neutered': np.int32,
+    'Neutering Rate': np.float32
+}
+COLUMNS = ['Year', 'County', 'Registrations', 'Deregistrations', 'Neutered', 'Neutering Rate']
+# 可以直接相加的欄位 (絕育率要由合計重新計算)
+SUM_COLUMNS = ['Registrations', 'Deregistrations', 'Neutered']
+# 絕育率的分母 (絕育數 / (絕育率 / 100)),資料中沒有這個欄位,由每一列推算後相加
+RATE_BASE = 'Neutering Base'
+
+# 選擇資料來源的環境變數
+BACKEND_ENV = 'PET_DATA_BACKEND'  # csv 或 sqlite
+SOURCE_ENV = 'PET_DATA_SOURCE'  # 資料檔案路徑
+
+def sort_records(df: pd.DataFrame) -> pd.DataFrame:
+    """依照縣市 (遞增)、年份 (遞減) 排序,每個縣市成為連續的一段"""
+    df.sort_values(['County', 'Year'], ascending=[True, False], inplace=True, kind='stable')
+    return df
+
+def sum_by_county_year(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    每個縣市每年的合計 (每月一筆的資料會合併成一年一筆)
+
+    Args:
+        df: 包含 County、Year、SUM_COLUMNS 與 Neutering Rate 的資料
+
+    Returns:
+        pd.DataFrame: 欄位為 County、Year、SUM_COLUMNS (int64) 與 RATE_BASE (float64)
+    """
+    rates = df['Neutering Rate'].to_numpy(np.float64)
+    neutered = df['Neutered'].to_numpy(np.float64)
+    # 絕育率為 0 的列推算不出分母,不計入
+    base = np.divide(neutered * 100.0, rates, out=np.zeros(len(df)), where=rates > 0)
+    totals = (df[['County', 'Year', *SUM_COLUMNS]].assign(**{RATE_BASE: base})
+              .groupby(['County', 'Year'], as_index=False, sort=False).sum())
+    return totals.astype({**{column: np.int64 for column in SUM_COLUMNS}, RATE_BASE: np.float64})
+
+class StorageBackend(ABC):
+    """
+    資料來源的介面
+
+    lazy 為 False 的資料來源在讀取時就建立所有縣市的資料;
+    lazy 為 True 的資料來源只先讀取縣市與年份,縣市資料在使用時才讀取
+    """
+    lazy = False
+
+    @property
+    @abstractmethod
+    def source_paths(self) -> List[str]:
+        """資料來源的檔案,檔案改變時需要重新讀取"""
+
+    @abstractmethod
+    def read_all(self) -> pd.DataFrame:
+        """
+        讀取所有資料
+
+        Returns:
+            pd.DataFrame: 依照縣市、年份排序的資料
+        """
+
+    @abstractmethod
+    def read_index(self) -> Tuple[List[str], List[int]]:
+        """
+        只讀取有哪些縣市與年份
+
+        Returns:
+            Tuple[List[str], List[int]]: (縣市列表, 年份列表 (新到舊))
+        """
+
+    @abstractmethod
+    def read_totals(self) -> pd.DataFrame:
+        """
+        讀取每個縣市每年的合計,用來建立全臺與區域的合計
+
+        Returns:
+            pd.DataFrame: 與 sum_by_county_year 相同的欄位
+        """
+
+    @abstractmethod
+    def read_county(self, county: str) -> pd.DataFrame:
+        """
+        讀取單一縣市的資料
+
+        Args:
+            county: 縣市名稱
+
+        Returns:
+            pd.DataFrame: 該縣市依照年份排序 (新到舊) 的資料
+        """
+
+class CsvBackend(StorageBackend):
+    """
+    CSV 資料來源,整個檔案一次讀入
+
+    讀入並排序後的資料與合計會保留,檔案沒有改變時 read_index、read_totals、
+    read_county 直接使用,不會每次重新讀取整個 CSV
+    """
+
+    def __init__(self, csv_file: str):
+        """
+        Args:
+            csv_file: CSV 資料檔案路徑
+        """
+        self.csv_file = csv_file
+        self._lock = threading.Lock()
+        self._signature = None  # 讀入時的檔案簽章 (見 file_signature)
+        self._df: Optional[pd.DataFrame] = None
+        self._totals: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None  # (資料, 合計)
+
+    def _load(self) -> pd.DataFrame:
+        """取得排序後的資料,檔案改變時才重新讀取"""
+        signature = file_signature(self.csv_file)
+        with self._lock:
+            if self._df is None or signature != self._signature:
+                # 讀取CSV檔案，並指定資料型別以優化記憶體使用
+                self._df = sort_records(pd.read_csv(self.csv_file, dtype=COLUMN_DTYPES))
+                self._signature = signature
+            return self._df
+
+    @property
+    def source_paths(self) -> List[str]:
+        return [self.csv_file]
+
+    def read_all(self) -> pd.DataFrame:
+        return self._load()
+
+    def read_index(self) -> Tuple[List[str], List[int]]:
+        df = self._load()
+        return list(df['County'].unique()), sorted(df['Year'].unique(), reverse=True)
+
+    def read_totals(self) -> pd.DataFrame:
+        df = self._load()
+        with self._lock:
+            if self._totals is None or self._totals[0] is not df:
+                self._totals = (df, sum_by_county_year(df))
+            return self._totals[1]
+
+    def read_county(self, county: str) -> pd.DataFrame:
+        df = self._load()
+        return df[df['County'] == county]
+
+class SqliteBackend(StorageBackend):
+    """
+    SQLite 資料來源 (pet_data.db 的 pet_records 資料表)
+
+    有 (County, Year) 索引時讀取單一縣市只需要查索引,不必把整個資料表載入記憶體。
+    讀取資料不會修改資料庫檔案,索引要另外建立:
+        python -m src.data.storage --create-index pet_data.db
+    """
+    lazy = True
+
+    def __init__(self, db_file: str, table: str = 'pet_records', create_index: bool = False):
+        """
+        Args:
+            db_file: SQLite 資料庫檔案路徑
+            table: 資料表名稱
+            create_index: 是否建立 (County, Year) 索引 (會寫入資料庫檔案)
+        """
+        if not os.path.exists(db_file):
+            # sqlite3.connect 會建立空的資料庫,先檢查檔案是否存在
+            raise FileNotFoundError(db_file)
+        self.db_file = db_file
+        self.table = table
+        self._local = threading.local()  # 每個執行緒使用自己的連線
+        if create_index:
+            self.create_index()
+        elif not self.has_index():
+            print(f"{db_file} 沒有 (County, Year) 索引,查詢單一縣市時會掃描整個資料表")
+
+    def _connect(self) -> sqlite3.Connection:
+        """取得目前執行緒的連線"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file)
+            self._local.conn = conn
+        return conn
+
+    @property
+    def index_name(self) -> str:
+        """(County, Year) 索引的名稱"""
+        return f'idx_{self.table}_county_year'
+
+    def has_index(self) -> bool:
+        """資料庫中是否已經有 (County, Year) 索引"""
+        row = self._connect().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (self.index_name,)
+        ).fetchone()
+        return row is not None
+
+    def create_index(self):
+        """建立 (County, Year) 索引 (已經存在就不做任何事)"""
+        with self._connect() as conn:
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "{self.index_name}" '
+                f'ON "{self.table}" ("County", "Year")'
+            )
+
+    def _query(self, where: str = '', params: tuple = ()) -> pd.DataFrame:
+        """查詢資料並轉換成固定的欄位型別"""
+        columns = ', '.join(f'"{column}"' for column in COLUMNS)
+        return pd.read_sql_query(
+            f'SELECT {columns} FROM "{self.table}" {where} ORDER BY "County", "Year" DESC',
+            self._connect(),
+            params=params,
+            dtype=COLUMN_DTYPES
+        )
+
+    @property
+    def source_paths(self) -> List[str]:
+        # WAL 模式下寫入的資料在 checkpoint 之前只會出現在 -wal 檔案
+        return [self.db_file, self.db_file + '-wal']
+
+    def read_all(self) -> pd.DataFrame:
+        return self._query()
+
+    def read_index(self) -> Tuple[List[str], List[int]]:
+        conn = self._connect()
+        counties = [row[0] for row in conn.execute(f'SELECT DISTINCT "County" FROM "{self.table}"')]
+        years = [int(row[0]) for row in conn.execute(
+            f'SELECT DISTINCT "Year" FROM "{self.table}" ORDER BY "Year" DESC'
+        )]
+        return counties, years
+
+    def read_totals(self) -> pd.DataFrame:
+        # 在資料庫內加總,只傳回每個縣市每年一筆
+        sums = ', '.join(f'SUM("{column}") AS "{column}"' for column in SUM_COLUMNS)
+        base = (f'SUM(CASE WHEN "Neutering Rate" > 0 THEN "Neutered" * 100.0 / "Neutering Rate" ELSE 0 END) '
+                f'AS "{RATE_BASE}"')
+        return pd.read_sql_query(
+            f'SELECT "County", "Year", {sums}, {base} FROM "{self.table}" GROUP BY "County", "Year"',
+            self._connect(),
+            dtype={'Year': np.int32, **{column: np.int64 for column in SUM_COLUMNS}, RATE_BASE: np.float64}
+        )
+
+    def read_county(self, county: str) -> pd.DataFrame:
+        return self._query('WHERE "County" = ?', (county,))
+
+# 資料來源種類與預設檔案
+BACKENDS = {'csv': CsvBackend, 'sqlite': SqliteBackend}
+DEFAULT_SOURCES = {'csv': '2023-2009pet_data.csv', 'sqlite': 'pet_data.db'}
+
+def open_backend(source: Optional[str] = None, kind: Optional[str] = None,
+                 base_dir: str = '') -> StorageBackend:
+    """
+    依照設定建立資料來源
+
+    Args:
+        source: 資料檔案路徑,None 時使用環境變數 PET_DATA_SOURCE 或預設檔案
+        kind: 'csv' 或 'sqlite',None 時使用環境變數 PET_DATA_BACKEND,都沒有設定時依照副檔名判斷
+        base_dir: 相對路徑的基準資料夾
+
+    Returns:
+        StorageBackend: 資料來源
+    """
+    source = source or os.environ.get(SOURCE_ENV)
+    kind = kind or os.environ.get(BACKEND_ENV)
+    if kind is None:
+        kind = 'sqlite' if source and source.endswith(('.db', '.sqlite', '.sqlite3')) else 'csv'
+    if kind not in BACKENDS:
+        raise ValueError(f"不支援的資料來源：{kind} (可用的有 {', '.join(BACKENDS)})")
+    return BACKENDS[kind](os.path.join(base_dir, source or DEFAULT_SOURCES[kind]))
+
+if __name__ == '__main__':
+    # 部署時建立 SQLite 的索引: python -m src.data.storage --create-index pet_data.db
+    parser = argparse.ArgumentParser(description='寵物登記資料來源的維護工作')
+    parser.add_argument('--create-index', metavar='DB_FILE', required=True,
+                        help='在 SQLite 資料庫建立 (County, Year) 索引')
+    args = parser.parse_args()
+    SqliteBackend(args.create_index, create_index=True)
+    print(f"已建立索引：{args.create_index}")
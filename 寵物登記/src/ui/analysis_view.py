@@ -5,11 +5,15 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 import numpy as np
 from .map_renderer import TaiwanMapRenderer
+import queue
 import threading
 
 class AnalysisView(ttk.Frame):
     """分析視圖類別,負責展示資料分析結果"""
     
+    # 檢查資料重新讀取通知的間隔毫秒數
+    RELOAD_POLL_MS = 500
+    
     def __init__(self, master, data_manager):
         """
         初始化分析視圖
@@ -21,6 +25,8 @@ class AnalysisView(ttk.Frame):
         super().__init__(master)
         self.data_manager = data_manager
         self._update_lock = threading.Lock()
+        # 資料重新讀取的通知,由監看執行緒放入,Tk 主執行緒取出
+        self._reload_queue = queue.Queue()
         
         # 設定matplotlib中文字型
         plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']
@@ -38,6 +44,9 @@ class AnalysisView(ttk.Frame):
         # 立即更新顯示 (不使用after延遲)
         self._update_display()
         
+        # 定期檢查資料是否已重新讀取
+        self._reload_after_id = self.after(self.RELOAD_POLL_MS, self._poll_reload)
+        
     def _setup_chart(self):
         """設定圖表布局"""
         # 建立主圖表
@@ -159,6 +168,37 @@ class AnalysisView(ttk.Frame):
         if county != self.selected_county.get():
             self.selected_county.set(county)
             
+    def notify_data_reloaded(self, version, changed):
+        """
+        資料重新讀取完成的通知,可以在任何執行緒呼叫,只放入佇列不碰 Tk 元件
+        
+        Args:
+            version: 新的資料版本
+            changed: 資料有變動的縣市
+        """
+        self._reload_queue.put((version, changed))
+        
+    def _poll_reload(self):
+        """在 Tk 主執行緒取出重新讀取的通知並更新畫面"""
+        changed = set()
+        try:
+            while True:
+                _, counties = self._reload_queue.get_nowait()
+                changed.update(counties)
+        except queue.Empty:
+            pass
+            
+        if changed:
+            counties = self.data_manager.counties
+            self.county_cb['values'] = counties
+            # 目前的縣市已不存在時回到全臺
+            if self._current_county not in counties:
+                self.selected_county.set("全臺")
+            elif self._current_county in changed:
+                self._update_display()
+                
+        self._reload_after_id = self.after(self.RELOAD_POLL_MS, self._poll_reload)
+        
     def _update_display(self):
         """更新顯示內容"""
         if not self._current_county:
@@ -253,5 +293,6 @@ class AnalysisView(ttk.Frame):
         
     def destroy(self):
         """清理資源"""
+        self.after_cancel(self._reload_after_id)
         plt.close(self.figure)
         super().destroy()
\ No newline at end of file
@@ -0,0 +1,29 @@
+import os
+import numpy as np
+from src.data.data_source import STATS_FIELDS, build_county_stats
+from src.data.storage import CsvBackend
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_FILE = os.path.join(PROJECT_DIR, '2023-2009pet_data.csv')
+
+COLUMNS = {
+    'years': 'Year',
+    'registrations': 'Registrations',
+    'deregistrations': 'Deregistrations',
+    'neutered': 'Neutered',
+    'neutering_rates': 'Neutering Rate'
+}
+
+def test_matches_per_county_filter():
+    df = CsvBackend(CSV_FILE).read_all()
+    stats = build_county_stats(df)
+    assert list(stats) == list(df['County'].unique())
+    for county, county_stats in stats.items():
+        # 原本每個縣市用布林遮罩篩選整個資料表的結果
+        county_data = df[df['County'] == county]
+        assert county_stats.county == county
+        for name in STATS_FIELDS:
+            np.testing.assert_array_equal(getattr(county_stats, name), county_data[COLUMNS[name]].values)
+
+def test_empty_frame():
+    assert build_county_stats(CsvBackend(CSV_FILE).read_all().iloc[:0]) == {}
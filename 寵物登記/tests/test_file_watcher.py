@@ -0,0 +1,58 @@
+import os
+import shutil
+import threading
+import time
+from dataclasses import replace
+import pandas as pd
+from src.data.data_source import PetDataManager, merge_county_stats
+from src.data.file_watcher import DataWatcher
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_FILE = os.path.join(PROJECT_DIR, '2023-2009pet_data.csv')
+
+def test_merge_detects_changed_counties():
+    old = PetDataManager(CSV_FILE).snapshot.stats
+    new = dict(old)
+    new['臺北市'] = replace(old['臺北市'], registrations=old['臺北市'].registrations + 1)
+    new['新北市'] = replace(old['新北市'], years=old['新北市'].years.copy())
+    del new['高雄市']
+    merged, changed = merge_county_stats(old, new)
+    assert changed == {'臺北市'}
+    assert merged['臺北市'] is new['臺北市']
+    # 內容相同的縣市沿用舊的物件
+    assert merged['新北市'] is old['新北市']
+    # 只有一邊有的縣市不算變動 (新增與刪除由縣市清單比較)
+    assert '高雄市' not in merged
+
+def test_watcher_reloads_once_after_write_settles(tmp_path):
+    csv_file = tmp_path / 'pet_data.csv'
+    shutil.copy(CSV_FILE, csv_file)
+    manager = PetDataManager(str(csv_file))
+    first = manager.version
+    calls = []
+    reloaded = threading.Event()
+    def on_reload(version, changed):
+        calls.append((version, changed))
+        reloaded.set()
+    watcher = DataWatcher(manager, on_reload, interval=0.2)
+    watcher.start()
+    try:
+        source = pd.read_csv(CSV_FILE)
+        source.loc[(source['County'] == '臺北市') & (source['Year'] == 2023), 'Registrations'] += 1
+        text = source.to_csv(index=False)
+        # 分兩次寫入,中間的檔案不完整
+        with open(csv_file, 'w', encoding='utf-8') as file:
+            file.write(text[:len(text) // 2])
+            file.flush()
+            time.sleep(0.05)
+            file.write(text[len(text) // 2:])
+        assert reloaded.wait(5)
+        time.sleep(0.6)
+    finally:
+        watcher.stop()
+        watcher.join()
+    assert len(calls) == 1
+    version, changed = calls[0]
+    assert version == manager.version == first + 1
+    assert '臺北市' in changed
+    assert '新北市' not in changed
@@ -0,0 +1,27 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from src.data.data_source import PetDataManager, STATS_FIELDS, build_county_stats, merge_county_stats
+from src.data.storage import SqliteBackend
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_FILE = os.path.join(PROJECT_DIR, '2023-2009pet_data.csv')
+DB_FILE = os.path.join(PROJECT_DIR, 'pet_data.db')
+
+def test_county_loaded_during_reload_is_not_changed(tmp_path):
+    db_file = tmp_path / 'pet_data.db'
+    shutil.copy(DB_FILE, db_file)
+    manager = PetDataManager(SqliteBackend(str(db_file)))
+    manager.get_county_stats('臺北市')
+    load_snapshot = manager._load_snapshot
+    def load_while_reading(*args, **kwargs):
+        snapshot = load_snapshot(*args, **kwargs)
+        # reload 讀取資料時,其它執行緒第一次使用高雄市
+        manager.get_county_stats('高雄市')
+        return snapshot
+    manager._load_snapshot = load_while_reading
+    manager.reload()
+    snapshot = manager.snapshot
+    assert not {'臺北市', '高雄市'} & snapshot.changed
+    assert {'臺北市', '高雄市'} <= set(snapshot.stats)
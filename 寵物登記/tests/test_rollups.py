@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pandas as pd
+from src.data.data_source import NATIONAL, STATS_FIELDS, PetDataManager, build_rollups, update_rollups
+from src.data.storage import sum_by_county_year
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_FILE = os.path.join(PROJECT_DIR, '2023-2009pet_data.csv')
+
+def test_source_national_rows_are_kept():
+    stats = PetDataManager(CSV_FILE).get_county_stats(NATIONAL)
+    source = pd.read_csv(CSV_FILE)
+    source = source[source['County'] == NATIONAL].sort_values('Year', ascending=False)
+    np.testing.assert_array_equal(stats.years, source['Year'])
+    np.testing.assert_array_equal(stats.neutered, source['Neutered'])
+    # 官方公布的絕育率,不是由四捨五入後的縣市絕育率推算的 50.38
+    assert stats.neutering_rates[0] == np.float32(50.44)
+
+def test_missing_rollups_are_computed(tmp_path):
+    source = pd.read_csv(CSV_FILE)
+    csv_file = tmp_path / 'pet_data.csv'
+    source[source['County'] != NATIONAL].to_csv(csv_file, index=False)
+    manager = PetDataManager(str(csv_file))
+    expected = build_rollups(sum_by_county_year(source))[NATIONAL]
+    stats = manager.get_county_stats(NATIONAL)
+    np.testing.assert_array_equal(stats.neutered, expected.neutered)
+    np.testing.assert_array_equal(stats.neutering_rates, expected.neutering_rates)
+    assert manager.counties[0] == NATIONAL
+
+def assert_same_rollups(actual, expected):
+    assert set(actual) == set(expected)
+    for name, stats in expected.items():
+        for field_name in STATS_FIELDS:
+            np.testing.assert_array_equal(getattr(actual[name], field_name), getattr(stats, field_name))
+
+def test_update_rollups_after_adding_a_year():
+    totals = sum_by_county_year(pd.read_csv(CSV_FILE))
+    old_totals = totals[totals['Year'] < 2023]
+    old = build_rollups(old_totals)
+    assert_same_rollups(update_rollups(old, old_totals, totals), build_rollups(totals))
+
+def test_update_rollups_after_editing_a_year():
+    source = pd.read_csv(CSV_FILE)
+    old_totals = sum_by_county_year(source)
+    old = build_rollups(old_totals)
+    source.loc[(source['County'] == '臺北市') & (source['Year'] == 2020), 'Neutered'] += 100
+    totals = sum_by_county_year(source)
+    updated = update_rollups(old, old_totals, totals)
+    assert_same_rollups(updated, build_rollups(totals))
+    assert update_rollups(updated, totals, totals) is updated
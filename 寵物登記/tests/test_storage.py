@@ -0,0 +1,58 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import pandas as pd
+from src.data import storage
+from src.data.storage import CsvBackend, SqliteBackend, StorageBackend
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_FILE = os.path.join(PROJECT_DIR, '2023-2009pet_data.csv')
+DB_FILE = os.path.join(PROJECT_DIR, 'pet_data.db')
+
+def digest(path) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def test_backend_is_abstract():
+    assert StorageBackend.__abstractmethods__ == {
+        'source_paths', 'read_all', 'read_index', 'read_totals', 'read_county'
+    }
+
+def test_sqlite_backend_does_not_modify_database(tmp_path):
+    db_file = tmp_path / 'pet_data.db'
+    shutil.copy(DB_FILE, db_file)
+    before = digest(db_file)
+    backend = SqliteBackend(str(db_file))
+    backend.read_index()
+    backend.read_totals()
+    backend.read_county('臺北市')
+    assert not backend.has_index()
+    assert digest(db_file) == before
+
+def test_create_index_command(tmp_path):
+    db_file = tmp_path / 'pet_data.db'
+    shutil.copy(DB_FILE, db_file)
+    subprocess.run([sys.executable, '-m', 'src.data.storage', '--create-index', str(db_file)],
+                   cwd=PROJECT_DIR, check=True, capture_output=True)
+    assert SqliteBackend(str(db_file)).has_index()
+
+def test_csv_backend_reads_file_once(tmp_path, monkeypatch):
+    csv_file = tmp_path / 'pet_data.csv'
+    shutil.copy(CSV_FILE, csv_file)
+    reads = []
+    read_csv = pd.read_csv
+    monkeypatch.setattr(storage.pd, 'read_csv', lambda *args, **kwargs: reads.append(args) or read_csv(*args, **kwargs))
+    backend = CsvBackend(str(csv_file))
+    df = backend.read_all()
+    backend.read_index()
+    assert backend.read_totals() is backend.read_totals()
+    taipei = backend.read_county('臺北市')
+    assert len(reads) == 1
+    assert (taipei['County'] == '臺北市').all() and taipei['Year'].is_monotonic_decreasing
+
+    # 檔案改變後重新讀取
+    df.iloc[:1].to_csv(csv_file, index=False)
+    assert len(backend.read_all()) == 1
+    assert len(reads) == 2
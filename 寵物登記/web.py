@@ -1,24 +1,49 @@
-from dash import Dash, html, dcc, callback, Input, Output, dash_table, _dash_renderer
-import pandas as pd
+from dash import Dash, DiskcacheManager, html, dcc, callback, ctx, Input, Output, dash_table, _dash_renderer
+import os
+import diskcache
+import numpy as np
 import plotly.express as px
 import dash_mantine_components as dmc
+from src.data.data_source import PetDataManager
+from src.data.file_watcher import DataWatcher
+from src.data.storage import open_backend
 _dash_renderer._set_react_version("18.2.0")
 
-# 記得要先更換csv路徑
-file_path = r"D:\python視窗設計\GitHub\python_視窗設計\寵物登記\2023-2009pet_data.csv"
+# 資料檔案與web.py放在同一個資料夾,使用 CSV 或 SQLite 由環境變數 PET_DATA_BACKEND 決定
+base_dir = os.path.dirname(os.path.abspath(__file__))
 
 try:
-    df = pd.read_csv(file_path)
+    data_manager = PetDataManager(open_backend(base_dir=base_dir))
     print("文件成功讀取！")
-    print(df.columns)  # 檢查列名
-except FileNotFoundError:
-    print(f"找不到文件：{file_path}")
+    print(data_manager.counties)  # 檢查縣市
+except FileNotFoundError as e:
+    print(f"找不到文件：{e}")
     raise
 except KeyError as e:
     print(f"列名錯誤：{e}")
     raise
 
-app = Dash(__name__, external_stylesheets=dmc.styles.ALL)
+# 資料檔案改變時重新讀取,data_manager.version 隨著增加
+data_watcher = DataWatcher(
+    data_manager,
+    lambda version, changed: print(f"資料已更新 (版本 {version}):{', '.join(sorted(changed))}")
+)
+data_watcher.start()
+
+# 耗時的計算使用 background callback 在另一個 process 執行,結果存在 diskcache
+background_cache = diskcache.Cache(os.path.join(base_dir, '.cache', 'jobs'))
+# 計算結果保留的秒數
+JOB_EXPIRE = 24 * 60 * 60
+# 計算中的鎖最多保留的秒數 (job 被取消時鎖不會釋放,過期後其它 job 才能繼續)
+JOB_LOCK_EXPIRE = 10 * 60
+# 預測幾年後
+FORECAST_YEARS = 3
+
+# cache_by: 結果的 key 包含資料版本,資料重新讀取後不會使用舊的結果
+app = Dash(__name__, external_stylesheets=dmc.styles.ALL,
+           background_callback_manager=DiskcacheManager(background_cache,
+                                                        cache_by=[lambda: data_manager.version],
+                                                        expire=JOB_EXPIRE))
 
 # radio button的資料改為下拉選單資料
 combobox_data = [
@@ -27,39 +52,15 @@ combobox_data = [
     {"value": "Neutered", "label": "絕育數"}
 ]
 
-# selected要的資料
-selected_data = [{'value': value, 'label': value} for value in df.County.unique()]
-
-# 只顯示台灣的資料
-dff = df[df.County == 'Taiwan']
-Registrations_diff = dff[['County', 'Year', 'Registrations']]
-elements = Registrations_diff.to_dict('records')
-
-rows = [
-    dmc.TableTr(
-        [
-            dmc.TableTd(element["County"]),
-            dmc.TableTd(element["Year"]),
-            dmc.TableTd(element["Registrations"]),
-        ]
-    )
-    for element in elements
-]
+# 下拉選單欄位與 CountyStats 屬性的對應
+stats_attributes = {
+    "Registrations": "registrations",
+    "Deregistrations": "deregistrations",
+    "Neutered": "neutered"
+}
 
-head = dmc.TableThead(
-    dmc.TableTr(
-        [
-            dmc.TableTh("年份"),
-            dmc.TableTh("縣市"),
-            dmc.TableTh("登記數"),
-            dmc.TableTh("註銷數"),
-            dmc.TableTh("絕育數"),
-        ]
-    )
-)
-
-body = dmc.TableTbody(rows)
-caption = dmc.TableCaption("Taiwan 年份,登記數量")
+# selected要的資料
+selected_data = [{'value': value, 'label': value} for value in data_manager.counties]
 
 app.layout = dmc.MantineProvider(
     [
@@ -86,7 +87,7 @@ app.layout = dmc.MantineProvider(
                             label="請選擇縣市",
                             placeholder="請選擇1個",
                             id="dropdown-selection",
-                            value="Taiwan",
+                            value="全臺",
                             data=selected_data,
                             w=200,
                             mb=10
@@ -94,20 +95,29 @@ app.layout = dmc.MantineProvider(
                     ],
                 ),
                 dmc.ScrollArea(
+                    # 分頁、排序、篩選都在伺服器處理,每次只傳送目前這一頁
                     dash_table.DataTable(
                         id="data-table",  # 表格 ID
                         columns=[
-                            {"name": "年份", "id": "Year"},
+                            {"name": "年份", "id": "Year", "type": "numeric"},
                             {"name": "縣市", "id": "County"},
-                            {"name": "登記數", "id": "Registrations"},
-                            {"name": "註銷數", "id": "Deregistrations"},
-                            {"name": "絕育數", "id": "Neutered"}
+                            {"name": "登記數", "id": "Registrations", "type": "numeric"},
+                            {"name": "註銷數", "id": "Deregistrations", "type": "numeric"},
+                            {"name": "絕育數", "id": "Neutered", "type": "numeric"},
+                            {"name": "絕育率", "id": "Neutering Rate", "type": "numeric"}
                         ],
-                        style_table={'height': '300px', 'overflowY': 'auto'},
+                        page_current=0,
+                        page_size=10,
+                        page_action='custom',
+                        sort_action='custom',
+                        sort_mode='multi',
+                        sort_by=[],
+                        filter_action='custom',
+                        filter_query='',
                         style_header={'fontWeight': 'bold'},
                         style_cell={'textAlign': 'center'}
                     ),
-                    h=300,
+                    h=400,
                     w='70%'
                 )
             ],
@@ -117,6 +127,21 @@ app.layout = dmc.MantineProvider(
         ),
         dmc.Container(
             dcc.Graph(id='graph-content')
+        ),
+        # 各縣市絕育率預測,在背景執行,可以看到進度與取消
+        dmc.Container(
+            [
+                dmc.Group(
+                    [
+                        dmc.Button(f"預測各縣市{FORECAST_YEARS}年後的絕育率", id='forecast-button'),
+                        dmc.Button("取消", id='forecast-cancel', color='red', variant='outline', disabled=True),
+                    ]
+                ),
+                dmc.Progress(id='forecast-progress', value=0, my=10),
+                dmc.Text(id='forecast-status', size='sm'),
+                dcc.Graph(id='forecast-graph', figure={'data': [], 'layout': {}})
+            ],
+            my=30
         )
     ]
 )
@@ -124,42 +149,102 @@ app.layout = dmc.MantineProvider(
 # 圖表顯示的事件
 @callback(
     Output('graph-content', 'figure'),
-    Output('data-table', 'data'),  # 更新 DataTable 的資料
     Input('dropdown-selection', 'value'),
     Input('combobox-item', 'value')
 )
-def update_content(county_value, combobox_value):
-    # 篩選指定縣市的數據
-    dff = df[df.County == county_value]
+def update_graph(county_value, combobox_value):
+    # 直接取得指定縣市的統計資料,不必掃描整個資料表
+    stats = data_manager.get_county_stats(county_value)
+    if stats is None:
+        return px.line(title=f'{county_value}: 沒有資料')
 
     # 動態設定 Y 軸欄位、標題和 legend 名稱
-    if combobox_value == "Registrations":
-        y_column = 'Registrations'
-        title = f'{county_value}: 登記數歷年趨勢'
-        legend_name = '登記數'
-    elif combobox_value == "Deregistrations":
-        y_column = 'Deregistrations'
-        title = f'{county_value}: 註銷數歷年趨勢'
-        legend_name = '註銷數'
-    elif combobox_value == "Neutered":
-        y_column = 'Neutered'
-        title = f'{county_value}: 絕育數歷年趨勢'
-        legend_name = '絕育數'
+    legend_name = next(item['label'] for item in combobox_data if item['value'] == combobox_value)
+    title = f'{county_value}: {legend_name}歷年趨勢'
 
     # 更新圖表
     fig = px.line(
-        dff,
-        x='Year',
-        y=y_column,
+        x=stats.years,
+        y=getattr(stats, stats_attributes[combobox_value]),
         title=title,
-        labels={y_column: legend_name}
+        labels={'x': 'Year', 'y': legend_name}
     )
     fig.update_traces(name=legend_name)
+    return fig
 
-    # 更新表格數據（保留所有所需欄位）
-    table_data = dff[["Year", "County", "Registrations", "Deregistrations", "Neutered"]].to_dict('records')
-
-    return fig, table_data
+# 表格顯示的事件,跟著選擇的縣市,只傳回目前這一頁
+@callback(
+    Output('data-table', 'data'),
+    Output('data-table', 'page_count'),
+    Output('data-table', 'page_current'),
+    Input('dropdown-selection', 'value'),
+    Input('data-table', 'page_current'),
+    Input('data-table', 'page_size'),
+    Input('data-table', 'sort_by'),
+    Input('data-table', 'filter_query')
+)
+def update_table(county_value, page_current, page_size, sort_by, filter_query):
+    # 換縣市時回到第一頁
+    if ctx.triggered_id == 'dropdown-selection':
+        page_current = 0
+    return data_manager.query_table(county_value, page_current, page_size, sort_by, filter_query)
+
+
+def forecast_neutering_rates(set_progress=None) -> list:
+    """
+    每個縣市以歷年絕育率做線性迴歸,預測 FORECAST_YEARS 年後的絕育率
+    
+    Returns:
+        list: [(縣市, 最新絕育率, 預測絕育率)]
+    """
+    counties = data_manager.counties
+    result = []
+    for i, county in enumerate(counties):
+        stats = data_manager.get_county_stats(county)
+        if stats is not None and len(stats.years) >= 3:
+            years = stats.years.astype('float64')
+            rates = stats.neutering_rates.astype('float64')
+            slope, intercept = np.polyfit(years, rates, 1)
+            latest = int(years.argmax())
+            predicted = slope * (years[latest] + FORECAST_YEARS) + intercept
+            result.append((county, round(float(rates[latest]), 2), round(float(min(max(predicted, 0), 100)), 2)))
+        if set_progress:
+            set_progress(((i + 1) * 100 // len(counties), f'{i + 1}/{len(counties)} 個縣市'))
+    return result
+
+# 絕育率預測的事件,在背景 process 執行
+@callback(
+    Output('forecast-graph', 'figure'),
+    Input('forecast-button', 'n_clicks'),
+    background=True,
+    running=[
+        (Output('forecast-button', 'disabled'), True, False),
+        (Output('forecast-cancel', 'disabled'), False, True),
+    ],
+    cancel=[Input('forecast-cancel', 'n_clicks')],
+    progress=[Output('forecast-progress', 'value'), Output('forecast-status', 'children')],
+    # n_clicks (第 0 個參數) 不算在快取的 key 內,相同資料版本的結果直接使用
+    cache_args_to_ignore=[0],
+    prevent_initial_call=True
+)
+def forecast(set_progress, n_clicks):
+    # 已經完成的結果由 cache_by 直接傳回,不會執行到這裡;
+    # 同時有多個相同的 job 時只有一個計算,其它的等待後使用它的結果
+    key = ('forecast', data_manager.version, FORECAST_YEARS)
+    with diskcache.Lock(background_cache, ('running', *key), expire=JOB_LOCK_EXPIRE):
+        result = background_cache.get(key)
+        if result is None:
+            result = forecast_neutering_rates(set_progress)
+            background_cache.set(key, result, expire=JOB_EXPIRE)
+    set_progress((100, '完成'))
+    counties = [county for county, _, _ in result]
+    return {
+        'data': [
+            {'type': 'bar', 'name': '最新絕育率', 'x': counties, 'y': [latest for _, latest, _ in result]},
+            {'type': 'bar', 'name': f'{FORECAST_YEARS}年後預測', 'x': counties, 'y': [predicted for _, _, predicted in result]}
+        ],
+        'layout': {'title': {'text': '各縣市絕育率預測(%)'}, 'barmode': 'group'}
+    }
 
 
 if __name__ == '__main__':